@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends
+
+from app.api.v1.core.ai_endpoints.ai_response_cache import ai_response_cache
+from app.api.v1.core.ai_endpoints.chat_context import chat_context_compactor
+from app.api.v1.core.ai_endpoints.gemini_client import gemini
+from app.api.v1.core.ai_endpoints.gemini_metrics import gemini_metrics
+from app.api.v1.core.ai_endpoints.model_registry import model_registry
+from app.api.v1.core.ai_endpoints.moderation_cache import moderation_cache
+from app.api.v1.core.models import Users
+from app.db_setup import async_engine, engine, pool_metrics
+from app.security import get_current_admin
+
+router = APIRouter(tags=["admin"], prefix="/admin")
+
+
+@router.get("/db-pool")
+def get_db_pool_metrics(current_admin: Users = Depends(get_current_admin)):
+    """
+    Poolstatus för den här worker-processen. Summera över workers och jämför
+    med Postgres max_connections: (pool_size + max_overflow) * motorer * workers.
+    """
+    pools = {"sync": engine.pool, "async": async_engine.sync_engine.pool}
+    return [pool_metrics[name].snapshot(pool) for name, pool in pools.items()]
+
+
+@router.get("/models")
+def get_model_stats(current_admin: Users = Depends(get_current_admin)):
+    """Vilka ML-modeller som är laddade i den här processen, laddtid och RSS-ökning"""
+    return model_registry.stats()
+
+
+@router.get("/moderation-cache")
+def get_moderation_cache_stats(current_admin: Users = Depends(get_current_admin)):
+    return {
+        "hits": moderation_cache.hits,
+        "perceptual_hits": moderation_cache.perceptual_hits,
+        "misses": moderation_cache.misses,
+    }
+
+
+@router.get("/ai-cache")
+def get_ai_cache_stats(current_admin: Users = Depends(get_current_admin)):
+    """Träffar i minnet, träffar i databasen och missar per AI-endpoint i den här processen"""
+    return ai_response_cache.stats()
+
+
+@router.get("/chat-context")
+def get_chat_context_stats(current_admin: Users = Depends(get_current_admin)):
+    """Uppskattade tokens i /chat-kontexten före och efter komprimering"""
+    return chat_context_compactor.stats()
+
+
+@router.get("/gemini-metrics")
+def get_gemini_metrics(current_admin: Users = Depends(get_current_admin)):
+    """Anrop, fel, omförsök, latens och tokens per AI-endpoint i den här processen"""
+    return gemini_metrics.snapshot()
+
+
+@router.get("/gemini-circuit")
+def get_gemini_circuit(current_admin: Users = Depends(get_current_admin)):
+    """Circuit breakerns läge och utfall i fönstret för den här processen"""
+    return gemini.breaker.stats()
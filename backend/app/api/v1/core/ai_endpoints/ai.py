@@ -1,34 +1,55 @@
 from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status, Query, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy import delete, insert, select, update, and_, or_
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session, joinedload, selectinload
-from typing import Optional, Annotated
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Annotated, Literal
 from random import randint
-import json
-import re
-import os
+from dataclasses import dataclass
+from fractions import Fraction
 from app.settings import settings
-import google.generativeai as genai
 import tempfile
-from cachetools import Cache
-import tensorflow as tf
 import hashlib
-from transformers import pipeline
-from transformers.pipelines import PipelineException
 import logging
-from PIL import Image, UnidentifiedImageError
+from PIL import UnidentifiedImageError
 import PIL
-import uuid
-import io
-from app.db_setup import get_db
+import json
+from app.db_setup import async_engine, get_async_db
 from app.s3_utils import upload_image_to_s3
+from app.api.v1.core.pagination import SAVED_ITEMS, cursor_page, decode_cursor, keyset_condition
+from app.api.v1.core.ai_endpoints.nsfw_inference import InvalidImageError
+from app.api.v1.core.ai_endpoints.nsfw_remote import classify_nsfw
+from app.api.v1.core.ai_endpoints.moderation_cache import content_hash, dhash, moderation_cache
+from app.api.v1.core.ai_endpoints.image_preprocessing import prepare_image, read_image_upload
+from app.api.v1.core.ai_endpoints.gemini_client import (
+    GeminiInvalidResponse,
+    GeminiTimeout,
+    GeminiUnavailable,
+    gemini,
+)
+from app.api.v1.core.ai_endpoints.prompts import (
+    BOUGHT_ITEMS_PROMPT,
+    INGREDIENT_IMAGE_PROMPT,
+    PLATE_IMAGE_PROMPT,
+    add_ingredients_prompt,
+    chat_prompt,
+    change_ingredients_prompt,
+    shopping_list_prompt,
+    similar_recipes_prompt,
+)
+from app.api.v1.core.ai_endpoints.ai_response_cache import ai_response_cache, make_key
+from app.api.v1.core.ai_endpoints.chat_context import chat_context_compactor
 
 from app.api.v1.core.recipe_endpoints.recipe_db import (
     get_one_recipe_db
 )
+from app.api.v1.core.recipe_endpoints.ingredient_scaling import scale_ingredients
+from app.api.v1.core.recipe_endpoints.recipe_similarity import similar_recipes
 
 from app.security import get_current_user
+from app.credits import NonRefundableError, credit_reservation, refund_credits, refund_user_credits, reserve_credits
 
 from app.api.v1.core.recipe_endpoints.recipe_db import (
     get_recipe_db,
@@ -53,671 +74,269 @@ from app.api.v1.core.schemas import (
     FileImageDetectionResponse,
     ChatRequest,
     SavedItemsSchema,
-    UpdateItemSchema
+    UpdateItemSchema,
+    ShoppingListResponse,
+    GeneratedRecipesResponse,
+    ImageRecipesResponse,
+    BoughtItemsResponse
 )
 
-from app.db_setup import get_db
-
 router = APIRouter()
 
-GEMINI_API_KEY = settings.GEMINI_API_KEY
+# Gemini konfigureras och anropas via gemini_client.py
 
-# Konfigurera Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
+# Ingår i nyckeln till ai_response_cache, öka när promptarna ändras så att gamla svar inte används
+PROMPT_VERSION = 3
 
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
+logger = logging.getLogger(__name__)
 
-# Initialize Cache with no TTL
-cache = Cache(maxsize=1000)
-
-# Load the model using the transformers pipeline
-model = pipeline("image-classification", model="falconsai/nsfw_image_detection")
+# NSFW-modellen (transformers/TensorFlow) laddas först vid användning, se model_registry.py,
+# och anropas i mikrobatchar via nsfw_inference.py eller i inferensservern (nsfw_remote.py)
 
-# Detect the device used by TensorFlow
-DEVICE = "GPU" if tf.config.list_physical_devices("GPU") else "CPU"
-logging.info("TensorFlow version: %s", tf.__version__)
-logging.info("Model is using: %s", DEVICE)
 
-if DEVICE == "GPU":
-    logging.info("GPUs available: %d", len(tf.config.list_physical_devices("GPU")))
+def gemini_unavailable(e: Exception) -> HTTPException:
+    """Öppen circuit breaker, full kö eller passerad deadline: svara direkt så att klienten kan försöka senare"""
+    logger.warning("Gemini unavailable: %s", e)
+    if isinstance(e, GeminiTimeout):
+        return HTTPException(status_code=504, detail=str(e))
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(settings.GEMINI_CIRCUIT_OPEN_SECONDS))})
 
 
-@router.get("/shopping-list/{recipe_id}")
-def modify_recipes(recipe_id: int, portions: int, db: Session = Depends(get_db)):
-    """ Generate a shopping list for the recipe, scaled to the specified number of servings """
-
-    # Retrieve the recipe object from the database
-    recipe = get_one_recipe_db(recipe_id, db)
-
-    # Convert SQLAlchemy object to dictionary
-    # You might need to adjust this based on your specific model
-    recipe_dict = {
-        "name": recipe.name,
-        "servings": recipe.servings,
-        "ingredients": recipe.ingredients
-    }
-
-    # Parse the ingredients string into a more structured format
-    ingredients_list = recipe_dict['ingredients'].split(' | ')
-
-    prompt_text = (
-        f"Jag har följande recept: {recipe_dict['name']}.\n"
-        f"Originalportioner: {recipe_dict['servings']}\n"
-        f"Önskat antal portioner: {portions}\n"
-        "Ingredienser:\n" +
-        "\n".join(ingredients_list) + "\n\n"
-        "Uppgift: Skapa en detaljerad inköpslista med justerade ingredienskvantiteter för det önskade antalet portioner.\n"
-        "Regler för svaret:\n"
-        "1. Svara ENDAST i JSON-format\n"
-        "2. Ingen extra text eller förklaringar\n"
-        "3. Använd följande JSON-struktur exakt:\n"
-        "{\n"
-        "  \"recipes\": [\n"
-        "    {\n"
-        "      \"name\": \"Ingrediensnamn\",\n"
-        "      \"amount\": \"Justerad mängd\",\n"
-        "      \"unit\": \"Enhet\"\n"
-        "    }\n"
-        "  ]\n"
-        "}"
-    )
-
+async def generate_structured(contents, schema, endpoint: str) -> dict:
+    """Gemini i JSON-läge mot schema (se schemas.py), svaret valideras en gång"""
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt_text)
-
-        print(" Gemini API Response:", response)
-
-        if response and response.text:
-            cleaned_text = response.text.strip()
-
-            # Remove markdown json formatting if present
-            cleaned_text = re.sub(r"^```json\n|\n```$", "", cleaned_text)
+        result = await gemini.generate_json(contents, schema, endpoint=endpoint)
+    except (GeminiUnavailable, GeminiTimeout) as e:
+        raise gemini_unavailable(e) from e
+    except GeminiInvalidResponse as e:
+        logger.warning("Invalid structured response from Gemini (%s): %s", endpoint, e)
+        raise HTTPException(
+            status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON") from e
+    except Exception as e:
+        logger.exception("Gemini request failed (%s)", endpoint)
+        raise HTTPException(
+            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}") from e
+    return result.model_dump()
 
-            # Clean up extra commas and whitespace
-            cleaned_text = cleaned_text.strip().rstrip(",")
 
-            try:
-                # Parse JSON
-                recipes = json.loads(cleaned_text)
+@dataclass(frozen=True)
+class ImagePipeline:
+    prompt: str
+    schema: type
+    credits: int
+    credit_reason: str
 
-                # Validate the JSON structure
-                if "recipes" not in recipes:
-                    raise ValueError("JSON saknar 'recipes'-nyckeln.")
 
-                return JSONResponse(content={"recipes": recipes["recipes"]})
-            except json.JSONDecodeError as e:
-                print(" JSON-dekodningsfel:", e)
-                raise HTTPException(
-                    status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON")
-            except ValueError as e:
-                print(" JSON-fel:", e)
-                raise HTTPException(
-                    status_code=500, detail=f"500: JSON-formatfel - {str(e)}")
+# Bild-endpoints, körs direkt i anropet eller som bakgrundsjobb via ai_jobs.py
+IMAGE_PIPELINES = {
+    "suggest-recipe-from-image": ImagePipeline(
+        INGREDIENT_IMAGE_PROMPT, ImageRecipesResponse, 2, "suggest_recipe_from_image"),
+    "suggest-recipe-from-plateimage": ImagePipeline(
+        PLATE_IMAGE_PROMPT, ImageRecipesResponse, 2, "suggest_recipe_from_plateimage"),
+    "save-bought-items": ImagePipeline(
+        BOUGHT_ITEMS_PROMPT, BoughtItemsResponse, 1, "save_bought_items"),
+}
 
-        return JSONResponse(content={"recipes": []}, status_code=200)
 
-    except Exception as e:
-        print(f" Fel vid API-förfrågan: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
+async def run_image_pipeline(kind: str, image_data: bytes, file_name: str | None) -> dict:
+    """NSFW-kontroll och sedan Gemini för en uppladdad bild enligt IMAGE_PIPELINES[kind]"""
+    pipeline = IMAGE_PIPELINES[kind]
+    response, pil_image = await classify_image(image_data, file_name)
 
-    except Exception as e:
-        print(f" Fel vid API-förfrågan: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
+    logger.debug("Image classification response: %s", response)
 
+    # Check if the image is NSFW
+    if response.is_nsfw:
+        # Credits behålls vid NSFW-avslag, som innan reservationerna infördes
+        raise NonRefundableError(
+            status_code=400,
+            detail="Bilden innehåller innehåll som inte är lämpligt för arbete.",
+        )
 
-@router.get("/suggest-recipe/{recipe_id}")
-def modify_recipes(recipe_id: int, db: Session = Depends(get_db)):
-    """ Anropar Gemini API för att föreslå recept baserat på ingredienser """
+    # pil_image är redan avkodad, roterad enligt EXIF och nedskalad (se image_preprocessing.py)
+    return await generate_structured([pipeline.prompt, pil_image], pipeline.schema, kind)
 
-    recipe = get_one_recipe_db(recipe_id, db)
-
-    prompt_text = (
-        f"Jag har följande recept: {recipe}. \n"
-        "Skapa en detaljerad lista på **tre recept** som liknar detta recept.\n"
-        "Ge även näringsinformation per portion: energi (kcal), protein, kolhydrater och fett. \n\n"
-        "Svar endast i JSON-format, ingen extra text. \n"
-        "Använd exakt följande JSON-struktur:\n"
-        "{\n"
-        '  "recipes": [\n'
-        "    {\n"
-        '      "title": "Titel på receptet",\n'
-        '      "description": "En kort beskrivning av rätten.",\n'
-        '      "category": "Ange kategori: Fågel, Kött, Fisk, Vegetarisk, Frukost, Bakning.",\n'
-        '      "ingredients": [\n'
-        '        {"name": "Ingrediensnamn", "amount": "Mängd", "unit": "Enhet"}\n'
-        "      ],\n"
-        '      "instructions": [\n'
-        '        "Steg 1: Beskrivning",\n'
-        '        "Steg 2: Beskrivning",\n'
-        '        "Steg 3: Beskrivning"\n'
-        "      ],\n"
-        '      "cook_time": "Total tillagningstid (t.ex. 30 min)",\n'
-        '      "servings": "Antal portioner (t.ex. 4 portioner)",\n'
-        '      "energy": "Antal kcal per portion",\n'
-        '      "protein": "Gram protein per portion",\n'
-        '      "carbohydrates": "Gram kolhydrater per portion",\n'
-        '      "fat": "Gram fett per portion"\n'
-        "    }\n"
-        "  ]\n"
-        "}"
-    )
 
+async def classify_image(image_data: bytes, file_name: str | None):
+    """Function analyzing image. Returns the moderation result and the prepared PIL image."""
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt_text)
+        logger.info("Processing %s", file_name)
 
-        #  Logga API-svaret
-        print(" Gemini API Response:", response)
+        # Samma fil igen (t.ex. omförsök efter ett Gemini-fel) behöver inte klassas om
+        digest = content_hash(image_data)
+        response_data = moderation_cache.get_exact(digest)
 
-        if response and response.text:
-            cleaned_text = response.text.strip()
+        # En enda avkodning i minnet, samma bild går sedan till både modellen och Gemini
+        image = await run_in_threadpool(prepare_image, image_data)
 
-            # ✅ Ta bort markdown ```json ... ``` om det finns
-            cleaned_text = re.sub(r"^```json\n|\n```$", "", cleaned_text)
+        if response_data is None:
+            # En omkodad kopia av en redan avvisad bild känns igen på dHash,
+            # ett "säkert" resultat återanvänds däremot bara för exakt samma fil
+            image_hash = dhash(image)
+            response_data = moderation_cache.get_rejected(image_hash)
 
-            # ✅ Rensa bort extra kommatecken och blanksteg i slutet av JSON-strängen
-            cleaned_text = cleaned_text.strip().rstrip(",")
+            if response_data is None:
+                # Classify the image, batched together with concurrent uploads
+                results = await classify_nsfw(image)
 
-            try:
-                # ✅ Försök att tolka JSON
-                recipes = json.loads(cleaned_text)
+                # Find the prediction with the highest confidence using the max() function
+                best_prediction = max(results, key=lambda x: x["score"])
 
-                # ✅ Kontrollera att JSON innehåller "recipes"-nyckeln
-                if "recipes" not in recipes:
-                    raise ValueError("JSON saknar 'recipes'-nyckeln.")
+                # Calculate the confidence score, rounded to the nearest tenth and as a percentage
+                confidence_percentage = round(best_prediction["score"] * 100, 1)
 
-                return JSONResponse(content={"recipes": recipes["recipes"]})
-            except json.JSONDecodeError as e:
-                print(" JSON-dekodningsfel:", e)
-                raise HTTPException(
-                    status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON")
-            except ValueError as e:
-                print(" JSON-fel:", e)
-                raise HTTPException(
-                    status_code=500, detail=f"500: JSON-formatfel - {str(e)}")
+                # Prepare the custom response data
+                response_data = {
+                    "is_nsfw": best_prediction["label"] == "nsfw",
+                    "confidence_percentage": confidence_percentage,
+                }
+            moderation_cache.put(digest, image_hash, response_data)
 
-        return JSONResponse(content={"recipes": []}, status_code=200)
+        # Add file_name to the API response
+        return FileImageDetectionResponse(**response_data, file_name=file_name or ""), image
 
+    except (InvalidImageError, PIL.UnidentifiedImageError) as e:
+        logger.error("Error processing image: %s", str(e))
+        raise HTTPException(
+            status_code=400, detail=f"Invalid image file: {str(e)}"
+        ) from e
     except Exception as e:
-        print(f" Fel vid API-förfrågan: {str(e)}")
+        logger.exception("Unexpected error processing image: %s", e)
         raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
-
-
-@router.get("/change-ingredients/{recipe_id}")
-def modify_recipes(recipe_id: int,
-                   ingredients: str = Query(
-                       ..., description="Lista över ingredienser, separerade med komma"),
-                   db: Session = Depends(get_db)):
-    """ Anropar Gemini API för att föreslå recept baserat på ingredienser """
+            status_code=500, detail=f"Unexpected error processing image: {str(e)}"
+        ) from e
 
-    recipe = get_one_recipe_db(recipe_id, db)
 
-    ingredient_list = [ing.strip() for ing in ingredients.split(",")]
+@router.get("/shopping-list/{recipe_id}")
+async def modify_recipes(recipe_id: int, portions: int = Query(..., gt=0), db: AsyncSession = Depends(get_async_db)):
+    """ Generate a shopping list for the recipe, scaled to the specified number of servings """
 
-    prompt_text = (
-        f"Jag har följande recept: {recipe}. \n"
-        f"jag behöver byta ut dessa ingredienser{', '.join(ingredient_list)} med andra ingredienser som passar.\n"
-        "Skapa en detaljerad lista på **tre recept** med dem utbytta ingredienserna.\n"
-        "Ge även näringsinformation per portion: energi (kcal), protein, kolhydrater och fett. \n\n"
-        "Svar endast i JSON-format, ingen extra text. \n"
-        "Använd exakt följande JSON-struktur:\n"
-        "{\n"
-        '  "recipes": [\n'
-        "    {\n"
-        '      "title": "Titel på receptet",\n'
-        '      "description": "En kort beskrivning av rätten.",\n'
-        '      "category": "Ange kategori: Fågel, Kött, Fisk, Vegetarisk, Frukost, Bakning.",\n'
-        '      "ingredients": [\n'
-        '        {"name": "Ingrediensnamn", "amount": "Mängd", "unit": "Enhet"}\n'
-        "      ],\n"
-        '      "instructions": [\n'
-        '        "Steg 1: Beskrivning",\n'
-        '        "Steg 2: Beskrivning",\n'
-        '        "Steg 3: Beskrivning"\n'
-        "      ],\n"
-        '      "cook_time": "Total tillagningstid (t.ex. 30 min)",\n'
-        '      "servings": "Antal portioner (t.ex. 4 portioner)",\n'
-        '      "energy": "Antal kcal per portion",\n'
-        '      "protein": "Gram protein per portion",\n'
-        '      "carbohydrates": "Gram kolhydrater per portion",\n'
-        '      "fat": "Gram fett per portion"\n'
-        "    }\n"
-        "  ]\n"
-        "}"
-    )
+    recipe = await get_one_recipe_db(recipe_id, db)
 
-    try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt_text)
+    # Recipes har ingen portionskolumn, recepten i datasetet är skrivna för DEFAULT_RECIPE_SERVINGS
+    factor = Fraction(portions, settings.DEFAULT_RECIPE_SERVINGS)
+    scaled, unparsed = scale_ingredients(recipe.ingredients, factor)
+    if not unparsed:
+        return JSONResponse(content={"recipes": scaled})
 
-        #  Logga API-svaret
-        print(" Gemini API Response:", response)
+    # Bara raderna som parsern inte klarar skickas till Gemini
+    cache_key = make_key("shopping-list", recipe_id, {"portions": portions}, PROMPT_VERSION)
+    cached = await ai_response_cache.get(cache_key, "shopping-list")
+    if cached is not None:
+        return JSONResponse(content=cached)
 
-        if response and response.text:
-            cleaned_text = response.text.strip()
+    prompt_text = shopping_list_prompt(recipe.name, settings.DEFAULT_RECIPE_SERVINGS, portions, unparsed)
+    result = await generate_structured(prompt_text, ShoppingListResponse, "shopping-list")
 
-            # ✅ Ta bort markdown ```json ... ``` om det finns
-            cleaned_text = re.sub(r"^```json\n|\n```$", "", cleaned_text)
+    payload = {"recipes": scaled + result["recipes"]}
+    await ai_response_cache.put(cache_key, "shopping-list", recipe_id, payload)
+    return JSONResponse(content=payload)
 
-            # ✅ Rensa bort extra kommatecken och blanksteg i slutet av JSON-strängen
-            cleaned_text = cleaned_text.strip().rstrip(",")
 
-            try:
-                # ✅ Försök att tolka JSON
-                recipes = json.loads(cleaned_text)
+@router.get("/suggest-recipe/{recipe_id}")
+async def modify_recipes(recipe_id: int,
+                   mode: Literal["similar", "generate"] = "similar",
+                   limit: int = Query(3, ge=1, le=20),
+                   db: AsyncSession = Depends(get_async_db)):
+    """ Liknande recept ur katalogen, eller med mode=generate tre nya recept från Gemini API """
 
-                # ✅ Kontrollera att JSON innehåller "recipes"-nyckeln
-                if "recipes" not in recipes:
-                    raise ValueError("JSON saknar 'recipes'-nyckeln.")
+    if mode == "similar":
+        await get_one_recipe_db(recipe_id, db)
+        return JSONResponse(content={"recipes": await similar_recipes(db, recipe_id, limit)})
 
-                return JSONResponse(content={"recipes": recipes["recipes"]})
-            except json.JSONDecodeError as e:
-                print(" JSON-dekodningsfel:", e)
-                raise HTTPException(
-                    status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON")
-            except ValueError as e:
-                print(" JSON-fel:", e)
-                raise HTTPException(
-                    status_code=500, detail=f"500: JSON-formatfel - {str(e)}")
+    cache_key = make_key("suggest-recipe", recipe_id, {}, PROMPT_VERSION)
+    cached = await ai_response_cache.get(cache_key, "suggest-recipe")
+    if cached is not None:
+        return JSONResponse(content=cached)
 
-        return JSONResponse(content={"recipes": []}, status_code=200)
+    recipe = await get_one_recipe_db(recipe_id, db)
 
-    except Exception as e:
-        print(f" Fel vid API-förfrågan: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
+    payload = await generate_structured(
+        similar_recipes_prompt(recipe), GeneratedRecipesResponse, "suggest-recipe")
+    await ai_response_cache.put(cache_key, "suggest-recipe", recipe_id, payload)
+    return JSONResponse(content=payload)
 
 
-@router.get("/add-ingredients/{recipe_id}")
-def modify_recipes(recipe_id: int,
+@router.get("/change-ingredients/{recipe_id}")
+async def modify_recipes(recipe_id: int,
                    ingredients: str = Query(
                        ..., description="Lista över ingredienser, separerade med komma"),
-                   db: Session = Depends(get_db)):
+                   db: AsyncSession = Depends(get_async_db)):
     """ Anropar Gemini API för att föreslå recept baserat på ingredienser """
 
-    recipe = get_one_recipe_db(recipe_id, db)
-
-    ingredient_list = [ing.strip() for ing in ingredients.split(",")]
+    cache_key = make_key("change-ingredients", recipe_id, {"ingredients": ingredients.split(",")}, PROMPT_VERSION)
+    cached = await ai_response_cache.get(cache_key, "change-ingredients")
+    if cached is not None:
+        return JSONResponse(content=cached)
 
-    prompt_text = (
-        f"Jag har följande recept: {recipe}. \n"
-        f"jag behöver lägga till dessa ingredienser{', '.join(ingredient_list)}.\n"
-        "Skapa en detaljerad lista på **tre recept** med dem tillagda ingredienserna.\n"
-        "Ge även näringsinformation per portion: energi (kcal), protein, kolhydrater och fett. \n\n"
-        "Svar endast i JSON-format, ingen extra text. \n"
-        "Använd exakt följande JSON-struktur:\n"
-        "{\n"
-        '  "recipes": [\n'
-        "    {\n"
-        '      "title": "Titel på receptet",\n'
-        '      "description": "En kort beskrivning av rätten.",\n'
-        '      "category": "Ange kategori: Fågel, Kött, Fisk, Vegetarisk, Frukost, Bakning.",\n'
-        '      "ingredients": [\n'
-        '        {"name": "Ingrediensnamn", "amount": "Mängd", "unit": "Enhet"}\n'
-        "      ],\n"
-        '      "instructions": [\n'
-        '        "Steg 1: Beskrivning",\n'
-        '        "Steg 2: Beskrivning",\n'
-        '        "Steg 3: Beskrivning"\n'
-        "      ],\n"
-        '      "cook_time": "Total tillagningstid (t.ex. 30 min)",\n'
-        '      "servings": "Antal portioner (t.ex. 4 portioner)",\n'
-        '      "energy": "Antal kcal per portion",\n'
-        '      "protein": "Gram protein per portion",\n'
-        '      "carbohydrates": "Gram kolhydrater per portion",\n'
-        '      "fat": "Gram fett per portion"\n'
-        "    }\n"
-        "  ]\n"
-        "}"
-    )
+    recipe = await get_one_recipe_db(recipe_id, db)
 
-    try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt_text)
-
-        #  Logga API-svaret
-        print(" Gemini API Response:", response)
-
-        if response and response.text:
-            cleaned_text = response.text.strip()
-
-            # ✅ Ta bort markdown ```json ... ``` om det finns
-            cleaned_text = re.sub(r"^```json\n|\n```$", "", cleaned_text)
-
-            # ✅ Rensa bort extra kommatecken och blanksteg i slutet av JSON-strängen
-            cleaned_text = cleaned_text.strip().rstrip(",")
+    ingredient_list = [ing.strip() for ing in ingredients.split(",")]
+    payload = await generate_structured(
+        change_ingredients_prompt(recipe, ingredient_list), GeneratedRecipesResponse, "change-ingredients")
+    await ai_response_cache.put(cache_key, "change-ingredients", recipe_id, payload)
+    return JSONResponse(content=payload)
 
-            try:
-                # ✅ Försök att tolka JSON
-                recipes = json.loads(cleaned_text)
 
-                # ✅ Kontrollera att JSON innehåller "recipes"-nyckeln
-                if "recipes" not in recipes:
-                    raise ValueError("JSON saknar 'recipes'-nyckeln.")
+@router.get("/add-ingredients/{recipe_id}")
+async def modify_recipes(recipe_id: int,
+                   ingredients: str = Query(
+                       ..., description="Lista över ingredienser, separerade med komma"),
+                   db: AsyncSession = Depends(get_async_db)):
+    """ Anropar Gemini API för att föreslå recept baserat på ingredienser """
 
-                return JSONResponse(content={"recipes": recipes["recipes"]})
-            except json.JSONDecodeError as e:
-                print(" JSON-dekodningsfel:", e)
-                raise HTTPException(
-                    status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON")
-            except ValueError as e:
-                print(" JSON-fel:", e)
-                raise HTTPException(
-                    status_code=500, detail=f"500: JSON-formatfel - {str(e)}")
+    cache_key = make_key("add-ingredients", recipe_id, {"ingredients": ingredients.split(",")}, PROMPT_VERSION)
+    cached = await ai_response_cache.get(cache_key, "add-ingredients")
+    if cached is not None:
+        return JSONResponse(content=cached)
 
-        return JSONResponse(content={"recipes": []}, status_code=200)
+    recipe = await get_one_recipe_db(recipe_id, db)
 
-    except Exception as e:
-        print(f" Fel vid API-förfrågan: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
+    ingredient_list = [ing.strip() for ing in ingredients.split(",")]
+    payload = await generate_structured(
+        add_ingredients_prompt(recipe, ingredient_list), GeneratedRecipesResponse, "add-ingredients")
+    await ai_response_cache.put(cache_key, "add-ingredients", recipe_id, payload)
+    return JSONResponse(content=payload)
 
 
 @router.post("/suggest_recipe_from_image")
 async def suggest_recipe_from_image(
     file: UploadFile = File(...),
     current_user: Users = Depends(get_current_user),  # Nytt: kräver inloggad användare
-    db: Session = Depends(get_db)                     # Nytt: för att hantera DB-uppdatering
+    db: AsyncSession = Depends(get_async_db)                     # Nytt: för att hantera DB-uppdatering
 ):
     """
-    Tar emot en bildfil, sparar den, anropar Gemini API för receptförslag, och drar 5 credits från den inloggade användaren.
+    Tar emot en bildfil, sparar den, anropar Gemini API för receptförslag, och drar 2 credits från den inloggade användaren.
     """
+    pipeline = IMAGE_PIPELINES["suggest-recipe-from-image"]
 
-    # Kontrollera att användaren har tillräckligt med credits
-    if current_user.credits < 2:
-        raise HTTPException(
-            status_code=402,
-            detail="Du har inte tillräckligt med credits för att utföra denna förfrågan."
-        )
-
-    # Dra 5 credits och spara i databasen
-    current_user.credits -= 2
-    db.commit()
-
-    response, restored_file = classify_image(file=file)
-
-    print("Image classification response:", response)
-
-    # Check if the image is NSFW
-    if response.is_nsfw:
-        raise HTTPException(
-            status_code=400,
-            detail="Bilden innehåller innehåll som inte är lämpligt för arbete.",
-        )
-
-    try:
-        # Generera ett unikt filnamn
-        file_extension = restored_file.filename.split('.')[-1] if '.' in restored_file.filename else 'jpg'
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(os.path.dirname(__file__), "images", unique_filename)
-
-        # Spara bilden på disk
-        with open(file_path, "wb") as buffer:
-            buffer.write(await restored_file.read())
-
-        # Öppna bilden med PIL
-        pil_image = Image.open(file_path)
-
-        # Skapa prompt-texten
-        prompt_text = (
-            "Du är en mästerkock och ska nu följa instruktionerna nedan. "
-            "Analysera bilden med ingredienser och identifiera de ingredienser som syns i bilden. "
-            "Utöver de ingredienser du identifierar, anta att basvaror som salt, peppar, smör och olja redan finns hemma och inkludera dem i receptet om de är nödvändiga. "
-            "Skapa en detaljerad lista på ett recept som kan lagas med de ingredienser du har identifierat samt de nödvändiga basvarorna. "
-            "Ge även näringsinformation per portion med ENDAST siffran så det är en float: energi (kcal), protein, kolhydrater och fett. \n\n"
-            "Svar endast i JSON-format, ingen extra text. \n"
-            "Använd exakt följande JSON-struktur:\n"
-            "{\n"
-            '  "recipes": [\n'
-            "    {\n"
-            '      "name": "Titel på receptet",\n'
-            '      "descriptions": "En kort beskrivning av rätten.",\n'
-            '      "category": "Ange kategori: Fågel, Kött, Fisk, Vegetarisk, Frukost, Bakning.",\n'
-            '      "ingredients": [\n'
-            '        "Ingrediensnamn mängd enhet"\n'
-            "      ],\n"
-            '      "instructions": [\n'
-            '        "Beskrivning",\n'
-            '        "Beskrivning",\n'
-            '        "Beskrivning"\n'
-            "      ],\n"
-            '      "cook_time": "Total tillagningstid (t.ex. 30 min)",\n'
-            '      "servings": "Antal portioner (t.ex. 4 portioner)",\n'
-            '      "calories": "Antal kcal per portion",\n'
-            '      "protein": "Gram protein per portion",\n'
-            '      "carbohydrates": "Gram kolhydrater per portion",\n'
-            '      "fat": "Gram fett per portion"\n'
-            "    }\n"
-            "  ]\n"
-            "}"
-        )
-
-        
-
-        # Anropa Gemini API med bilden och prompten
-        model = genai.GenerativeModel("gemini-2.0-flash")
-
-        print(model.count_tokens([prompt_text, pil_image]))
-        
-        response = model.generate_content([prompt_text, pil_image])
-        
-
-        print("Gemini API Response for image analysis:", response)
-
-        if response and response.text:
-            cleaned_text = response.text.strip()
-            # Ta bort eventuell markdown (```json ... ```)
-            cleaned_text = re.sub(r"^```json\n|\n```$", "", cleaned_text)
-            cleaned_text = cleaned_text.strip().rstrip(",")
-
-            try:
-                result = json.loads(cleaned_text)
-                if "recipes" not in result:
-                    raise ValueError("JSON saknar 'recipes'-nyckeln.")
-                return JSONResponse(content={"recipes": result["recipes"]})
-            except json.JSONDecodeError as e:
-                print("JSON-dekodningsfel:", e)
-                raise HTTPException(
-                    status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON")
-
-        return JSONResponse(content={"recipes": []}, status_code=200)
-    except Exception as e:
-        print(f"Fel vid API-förfrågan: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
-    finally:
-        # Rensa upp bildfilen efter användning (valfritt)
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+    # Reservera credits atomiskt, de betalas tillbaka om anropet misslyckas
+    async with credit_reservation(db, current_user, pipeline.credits, pipeline.credit_reason):
+        image_data = read_image_upload(file)
+        result = await run_image_pipeline("suggest-recipe-from-image", image_data, file.filename)
+        return JSONResponse(content=result)
 
 @router.post("/suggest-recipe-from-plateimage")
-async def suggest_recipe_from_plateimage(file: UploadFile = File(...), current_user: Users = Depends(get_current_user), db: Session = Depends(get_db)):
+async def suggest_recipe_from_plateimage(file: UploadFile = File(...), current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Tar emot en bildfil, sparar den i images-mappen, 
     öppnar bilden med PIL, och anropar Gemini API för att få receptförslag.
     """
-    # Kontrollera att användaren har tillräckligt med credits
-    if current_user.credits < 2:
-        raise HTTPException(
-            status_code=402,
-            detail="Du har inte tillräckligt med credits för att utföra denna förfrågan."
-        )
-
-    # Dra 5 credits och spara i databasen
-    current_user.credits -= 2
-    db.commit()
-
-    response, restored_file = classify_image(file=file)
-
-    print("Image classification response:", response)
-
-    # Check if the image is NSFW
-    if response.is_nsfw:
-        raise HTTPException(
-            status_code=400,
-            detail="Bilden innehåller innehåll som inte är lämpligt för arbete.",
-        )
-
-    try:
-        # Generera ett unikt filnamn
-        file_extension = restored_file.filename.split('.')[-1] if '.' in restored_file.filename else 'jpg'
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(os.path.dirname(__file__), "images", unique_filename)
-
-        # Spara bilden på disk
-        with open(file_path, "wb") as buffer:
-            buffer.write(await restored_file.read())
-
-        # Öppna bilden med PIL
-        pil_image = Image.open(file_path)
-
-        # Skapa prompt-texten
-        prompt_text = (
-            "Du är en mästerkock och ska nu följa instruktionerna nedan. "
-            "Analysera och identifiera maträtten på bilden och föreslå ett recept med instruktioerna nedan som passar till den maten du ser på tallriken. "
-            "Utöver de ingredienser du identifierar, anta att basvaror som salt, peppar, smör och olja redan finns hemma och inkludera dem i receptet om de är nödvändiga. "
-            "Skapa en detaljerad lista på ett recept som kan lagas med de ingredienser du har identifierat samt de nödvändiga basvarorna. "
-            "Ge även näringsinformation per portion med ENDAST siffran så det är en float: energi (kcal), protein, kolhydrater och fett. \n\n"
-            "Svar endast i JSON-format, ingen extra text. \n"
-            "Använd exakt följande JSON-struktur:\n"
-            "{\n"
-            '  "recipes": [\n'
-            "    {\n"
-            '      "name": "Titel på receptet",\n'
-            '      "descriptions": "En kort beskrivning av rätten.",\n'
-            '      "category": "Ange kategori: Fågel, Kött, Fisk, Vegetarisk, Frukost, Bakning.",\n'
-            '      "ingredients": [\n'
-            '        "Ingrediensnamn mängd enhet"\n'
-            "      ],\n"
-            '      "instructions": [\n'
-            '        "Beskrivning",\n'
-            '        "Beskrivning",\n'
-            '        "Beskrivning"\n'
-            "      ],\n"
-            '      "cook_time": "Total tillagningstid (t.ex. 30 min)",\n'
-            '      "servings": "Antal portioner (t.ex. 4 portioner)",\n'
-            '      "calories": "Antal kcal per portion",\n'
-            '      "protein": "Gram protein per portion",\n'
-            '      "carbohydrates": "Gram kolhydrater per portion",\n'
-            '      "fat": "Gram fett per portion"\n'
-            "    }\n"
-            "  ]\n"
-            "}"
-        )
-
-        
-
-        # Anropa Gemini API med bilden och prompten
-        model = genai.GenerativeModel("gemini-2.0-flash")
-
-        print(model.count_tokens([prompt_text, pil_image]))
-        
-        response = model.generate_content([prompt_text, pil_image])
-        
-
-        print("Gemini API Response for image analysis:", response)
-
-        if response and response.text:
-            cleaned_text = response.text.strip()
-            # Ta bort eventuell markdown (```json ... ```)
-            cleaned_text = re.sub(r"^```json\n|\n```$", "", cleaned_text)
-            cleaned_text = cleaned_text.strip().rstrip(",")
+    pipeline = IMAGE_PIPELINES["suggest-recipe-from-plateimage"]
 
-            try:
-                result = json.loads(cleaned_text)
-                if "recipes" not in result:
-                    raise ValueError("JSON saknar 'recipes'-nyckeln.")
-                return JSONResponse(content={"recipes": result["recipes"]})
-            except json.JSONDecodeError as e:
-                print("JSON-dekodningsfel:", e)
-                raise HTTPException(
-                    status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON")
+    # Reservera credits atomiskt, de betalas tillbaka om anropet misslyckas
+    async with credit_reservation(db, current_user, pipeline.credits, pipeline.credit_reason):
+        image_data = read_image_upload(file)
+        result = await run_image_pipeline("suggest-recipe-from-plateimage", image_data, file.filename)
+        return JSONResponse(content=result)
 
-        return JSONResponse(content={"recipes": []}, status_code=200)
-    except Exception as e:
-        print(f"Fel vid API-förfrågan: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
-    finally:
-        # Rensa upp bildfilen efter användning (valfritt)
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
-
-
-def classify_image(file: UploadFile = File(None)):
-    """Function analyzing image."""
-    if file is None:
-        raise HTTPException(
-            status_code=400,
-            detail="An image file must be provided.",
-        )
-
-    try:
-        logging.info("Processing %s", file.filename)
-
-        # Reset file cursor to the beginning
-        file.file.seek(0)
-
-        # Read the image file
-        image_data = file.file.read()
-
-        file.file.seek(0)
 
-        restored_file = UploadFile(
-            filename=file.filename, 
-            file=io.BytesIO(image_data), 
-        )
-
-        # Check if image data is empty
-        if not image_data:
-            raise HTTPException(
-                status_code=400,
-                detail="Empty image file provided.",
-            )
-
-        # Open the image using BytesIO to avoid file path issues
-        image = Image.open(io.BytesIO(image_data))
-
-        # Use the model to classify the image
-        results = model(image)
-
-        # Find the prediction with the highest confidence using the max() function
-        best_prediction = max(results, key=lambda x: x["score"])
-
-        # Calculate the confidence score, rounded to the nearest tenth and as a percentage
-        confidence_percentage = round(best_prediction["score"] * 100, 1)
-
-        # Prepare the custom response data
-        response_data = {
-            "is_nsfw": best_prediction["label"] == "nsfw",
-            "confidence_percentage": confidence_percentage,
-        }
-
-        # Add file_name to the API response
-        response_data["file_name"] = file.filename
-
-        return FileImageDetectionResponse(**response_data), restored_file
-
-    except (PipelineException, PIL.UnidentifiedImageError) as e:
-        logging.error("Error processing image: %s", str(e))
-        raise HTTPException(
-            status_code=400, detail=f"Invalid image file: {str(e)}"
-        ) from e
-    except Exception as e:
-        logging.error("Unexpected error processing image: %s", str(e))
-        raise HTTPException(
-            status_code=500, detail=f"Unexpected error processing image: {str(e)}"
-        ) from e
-    
 @router.post("/chat", response_model=dict)
-async def chat_with_context(request: ChatRequest, current_user: Users = Depends(get_current_user), db: Session = Depends(get_db)):
+async def chat_with_context(request: ChatRequest, current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Tar emot en JSON-body med 'context' (exempelvis en HTML-sida eller text från den aktuella sidan)
     och 'message' (användarens fråga). Dessa kombineras till en prompt som skickas till Gemini‑API:t,
@@ -729,137 +348,105 @@ async def chat_with_context(request: ChatRequest, current_user: Users = Depends(
       "message": "Hur lagar jag detta recept?"
     }
     """
-    # Kontrollera att användaren har tillräckligt med credits
-    if current_user.credits < 1:
-        raise HTTPException(
-            status_code=402,
-            detail="Du har inte tillräckligt med credits för att utföra denna förfrågan."
-        )
-
-    # Dra 5 credits och spara i databasen
-    current_user.credits -= 1
-    db.commit()
-
-    prompt_text = (
-        "Du är en hjälpsam och kreativ kockassistent. "
-        "Använd följande kontext från användarens webbsida som bakgrundsinformation:\n"
-        f"{request.context}\n\n"
-        "Svara endast på användarens fråga om den är relaterad till kontexten fått innan"
-        "Användarens fråga: " + request.message + "\n\n"
-        "Svara tydligt och koncist på användarens fråga, ENDAST i ren text."
-    )
-
+    # Reservera credits atomiskt, de betalas tillbaka om anropet misslyckas
+    async with credit_reservation(db, current_user, 1, "chat"):
+        # Sidans HTML som ren text inom CHAT_CONTEXT_TOKEN_BUDGET, promptstorleken styr latens och kostnad
+        context = await run_in_threadpool(chat_context_compactor.compact, request.context)
+        prompt_text = chat_prompt(context, request.message)
+
+        try:
+            # Latenskänsligt: ett andra, hedgat försök om det första dröjer
+            response = await gemini.generate(prompt_text, endpoint="chat", hedge=True)
+            if response and response.text:
+                return JSONResponse(content={"response": response.text.strip()})
+            return JSONResponse(content={"response": "Inget svar mottaget."})
+        except (GeminiUnavailable, GeminiTimeout) as e:
+            raise gemini_unavailable(e) from e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_with_context_stream(request: ChatRequest, current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Som /chat men svaret strömmas som server-sent events allteftersom Gemini
+    genererar det: 'chunk' med {"text"} för varje bit, sedan 'done' med hela
+    svaret {"response"}. Fel innan första biten ger ett vanligt HTTP-fel,
+    fel mitt i strömmen ett 'error'-event {"detail", "status_code"} och
+    crediten betalas tillbaka i båda fallen.
+    """
+    # Reservera credits atomiskt, de betalas tillbaka om anropet misslyckas
+    await reserve_credits(db, current_user, 1, "chat")
+    user_id = current_user.id
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt_text)
-        if response and response.text:
-            return JSONResponse(content={"response": response.text.strip()})
-        return JSONResponse(content={"response": "Inget svar mottaget."})
+        context = await run_in_threadpool(chat_context_compactor.compact, request.context)
+        chunks = gemini.stream(chat_prompt(context, request.message), endpoint="chat_stream")
+        # Första biten hämtas innan svaret påbörjas, så att statuskoden kan visa fel
+        first = await anext(chunks, None)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # Avbrott (CancelledError) betalas inte tillbaka, som i credit_reservation
+        await refund_credits(db, current_user, 1, "chat")
+        if isinstance(e, (GeminiUnavailable, GeminiTimeout)):
+            raise gemini_unavailable(e) from e
+        if not isinstance(e, HTTPException):
+            raise HTTPException(status_code=500, detail=str(e)) from e
+        raise
+
+    async def events():
+        if first is None:
+            yield sse_event("done", {"response": "Inget svar mottaget."})
+            return
+
+        parts = [first]
+        yield sse_event("chunk", {"text": first})
+        try:
+            async for text in chunks:
+                parts.append(text)
+                yield sse_event("chunk", {"text": text})
+        except Exception as e:
+            error = gemini_unavailable(e) if isinstance(e, (GeminiUnavailable, GeminiTimeout)) else HTTPException(status_code=500, detail=str(e))
+            # Request-sessionen kan redan vara stängd när strömmen körs
+            async with AsyncSession(async_engine) as refund_db:
+                await refund_user_credits(refund_db, user_id, 1, "chat")
+            yield sse_event("error", {"detail": error.detail, "status_code": error.status_code})
+            return
+        finally:
+            # Klienten kan ha gått, släpp Gemini-anropet och dess plats direkt
+            await chunks.aclose()
+        # Avbryter klienten strömmen behålls crediten, svaret har redan genererats
+        yield sse_event("done", {"response": "".join(parts).strip()})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/save-bought-items")
 async def save_bought_ingredients(file: UploadFile = File(...), 
                                   current_user: Users = Depends(get_current_user), 
-                                  db: Session = Depends(get_db)):
+                                  db: AsyncSession = Depends(get_async_db)):
     """
     Tar emot en bildfil, sparar den i images-mappen, 
     öppnar bilden med PIL, och anropar Gemini API för att få receptförslag.
     """
-    if current_user.credits < 1:
-        raise HTTPException(
-            status_code=402,
-            detail="Du har inte tillräckligt med credits för att utföra denna förfrågan."
-        )
-
-    # Dra 5 credits och spara i databasen
-    current_user.credits -= 1
-    db.commit()
+    pipeline = IMAGE_PIPELINES["save-bought-items"]
 
-    response, restored_file = classify_image(file=file)
-
-    # Check if the image is NSFW
-    if response.is_nsfw:
-        raise HTTPException(
-            status_code=400,
-            detail="Bilden innehåller innehåll som inte är lämpligt för arbete.",
-        )
-
-    try:
-        # Generera ett unikt filnamn
-        file_extension = restored_file.filename.split('.')[-1] if '.' in restored_file.filename else 'jpg'
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(os.path.dirname(__file__), "images", unique_filename)
-
-        # Spara bilden på disk
-        with open(file_path, "wb") as buffer:
-            buffer.write(await restored_file.read())
-
-        # Öppna bilden med PIL
-        pil_image = Image.open(file_path)
-
-        # Skapa prompt-texten
-        prompt_text = (
-            "Du är en AI-specialist på att identifiera livsmedelsprodukter. "
-            "Analysera bilden och identifiera alla matvaror som finns på bilden. "
-            "För varje identifierad vara, extrahera dess namn och storlek (vikt, volym eller antal beroende på kontext). "
-            "Om storleken inte är tydlig, gör en kvalificerad gissning baserat på standardstorlekar. "
-            "Svar endast i JSON-format, ingen extra text.\n\n"
-            "Använd exakt följande JSON-struktur:\n"
-            "{\n"
-            '  "items": [\n'
-            "    {\n"
-            '      "name": "Namn på matvaran",\n'
-            '      "size": "Storlek eller mängd (t.ex. 500g, 1L, 6-pack)"\n'
-            "    }\n"
-            "  ]\n"
-            "}"
-        )
-
-        
-
-        # Anropa Gemini API med bilden och prompten
-        model = genai.GenerativeModel("gemini-2.0-flash")
-
-        print(model.count_tokens([prompt_text, pil_image]))
-        
-        response = model.generate_content([prompt_text, pil_image])
-        
-
-        print("Gemini API Response for image analysis:", response)
-
-        if response and response.text:
-            cleaned_text = response.text.strip()
-            # Ta bort eventuell markdown (```json ... ```)
-            cleaned_text = re.sub(r"^```json\n|\n```$", "", cleaned_text)
-            cleaned_text = cleaned_text.strip().rstrip(",")
-
-            try:
-                result = json.loads(cleaned_text)
-                if "items" not in result:
-                    raise ValueError("JSON saknar 'items'-nyckeln.")
-                return JSONResponse(content={"items": result["items"]})
-            except json.JSONDecodeError as e:
-                print("JSON-dekodningsfel:", e)
-                raise HTTPException(
-                    status_code=500, detail="500: Misslyckades att tolka svaret från AI som JSON"
-                )
-
-        return JSONResponse(content={"items": []}, status_code=200)
-    except Exception as e:
-        print(f"Fel vid API-förfrågan: {str(e)}")
-        raise HTTPException(
-            status_code=500, detail=f"Fel vid API-förfrågan: {str(e)}")
-    finally:
-        # Rensa upp bildfilen efter användning (valfritt)
-        if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+    # Reservera credits atomiskt, de betalas tillbaka om anropet misslyckas
+    async with credit_reservation(db, current_user, pipeline.credits, pipeline.credit_reason):
+        image_data = read_image_upload(file)
+        result = await run_image_pipeline("save-bought-items", image_data, file.filename)
+        return JSONResponse(content=result)
 
 @router.post("/saved-items")
-def save_items(items: SavedItemsSchema,
+async def save_items(items: SavedItemsSchema,
                current_user: Users = Depends(get_current_user),
-               db: Session = Depends(get_db)
+               db: AsyncSession = Depends(get_async_db)
             ):
 
     saved_items = SavedItems(
@@ -869,17 +456,34 @@ def save_items(items: SavedItemsSchema,
     )
 
     db.add(saved_items)
-    db.commit()
+    await db.commit()
     return saved_items
 
 @router.get("/saved-items")
-def get_saved_items(
+async def get_saved_items(
+    cursor: str = Query(None, description="Keyset cursor from next_cursor, empty for the first page"),
+    page_size: int = Query(20, ge=1, le=100, description="Number of items per page"),
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    saved_items = db.scalars(
-        select(SavedItems).where(SavedItems.user_id == current_user.id)
-    ).all()
+    stmt = select(SavedItems).where(SavedItems.user_id == current_user.id)
+
+    if cursor is not None:
+        # Nyaste först, keyset på id
+        stmt = stmt.order_by(SavedItems.id.desc())
+        after = decode_cursor(cursor, SAVED_ITEMS)
+        if after is not None:
+            stmt = stmt.where(keyset_condition(None, SavedItems.id, after))
+
+        rows = (await db.scalars(stmt.limit(page_size + 1))).all()
+        if not rows and not cursor:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="couldnt find any saved items"
+            )
+        return cursor_page(rows, page_size, key=lambda item: (None, item.id), kind=SAVED_ITEMS)
+
+    saved_items = (await db.scalars(stmt)).all()
 
     if not saved_items:
         raise HTTPException(
@@ -892,16 +496,16 @@ def get_saved_items(
 
     
 @router.put("/saved-items/{item_id}")
-def update_saved_items(
+async def update_saved_items(
     item_id: int,
     item: UpdateItemSchema,
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     
-    saved_item = db.scalars(select(SavedItems).where(
+    saved_item = (await db.scalars(select(SavedItems).where(
         SavedItems.user_id == current_user.id).where(
-            SavedItems.id == item_id)).first()
+            SavedItems.id == item_id))).first()
 
     
 
@@ -909,23 +513,23 @@ def update_saved_items(
         if value != "":
             setattr(saved_item, key, value)
 
-    db.commit()
+    await db.commit()
     return saved_item
 
 
 @router.delete("/saved-items/{item_id}")
-def delete_saved_item(
+async def delete_saved_item(
     item_id: int,
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     
-    item = db.scalars(select(SavedItems).where(SavedItems.user_id == current_user.id).where(SavedItems.id == item_id))
+    item = await db.scalars(select(SavedItems).where(SavedItems.user_id == current_user.id).where(SavedItems.id == item_id))
     if not item:
         return False
 
-    db.execute(delete(SavedItems).where(SavedItems.user_id == current_user.id).where(SavedItems.id == item_id))
+    await db.execute(delete(SavedItems).where(SavedItems.user_id == current_user.id).where(SavedItems.id == item_id))
     
     
-    db.commit()
+    await db.commit()
     return True
\ No newline at end of file
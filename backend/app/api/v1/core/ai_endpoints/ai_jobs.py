@@ -0,0 +1,354 @@
+"""
+Bakgrundsjobb för bild-endpoints. POST /jobs/{kind} sparar bilden i ai_jobs
+och svarar direkt med ett job_id, workers i varje API-process hämtar jobben
+med FOR UPDATE SKIP LOCKED och kör samma pipeline som de synkrona endpoints.
+Klienten pollar GET /jobs/{id} eller följer GET /jobs/{id}/events (SSE).
+
+Jobben körs på API-workerns egen event-loop. Leasen förnyas medan jobbet
+körs, så om workern startas om eller dör tar en annan worker (eller samma
+efter omstarten) upp jobbet när leasen gått ut, inom AI_JOB_LEASE_SECONDS.
+"""
+import asyncio
+import json
+import logging
+from datetime import UTC, datetime, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.v1.core.ai_endpoints.ai import IMAGE_PIPELINES, run_image_pipeline
+from app.api.v1.core.ai_endpoints.image_preprocessing import read_image_upload
+from app.api.v1.core.models import AiJobs, Users
+from app.credits import NonRefundableError, refund_credits, refund_user_credits, reserve_credits
+from app.db_setup import async_engine, get_async_db
+from app.security import get_current_user
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = {SUCCEEDED, FAILED}
+
+router = APIRouter(tags=["jobs"], prefix="/jobs")
+
+
+def job_status(job: AiJobs) -> dict:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": job.result,
+        "error": job.error,
+        "status_code": job.status_code,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobWorkerPool:
+    """
+    concurrency workers per process. Medan ett jobb körs förnyas leasen var
+    tredjedel av lease_seconds, ett jobb som fortfarande är "running" efter
+    lease_expires_at har alltså tappats av en process som dött och tas upp
+    igen, högst max_attempts gånger. Vid avstängning läggs pågående jobb
+    tillbaka i kön direkt.
+    """
+
+    def __init__(self, concurrency: int, poll_seconds: float, lease_seconds: float,
+                 timeout_seconds: float, max_attempts: int):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.timeout_seconds = timeout_seconds
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._run(), name=f"ai-job-worker-{i}")
+                for i in range(self.concurrency)
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Ett nytt jobb i den här processen, väck workers utan att vänta på nästa poll"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Could not claim AI job")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._process(job)
+
+    async def _claim(self) -> AiJobs | None:
+        now = datetime.now(UTC)
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            job = await db.scalar(
+                select(AiJobs)
+                .where(or_(
+                    AiJobs.status == QUEUED,
+                    and_(AiJobs.status == RUNNING, AiJobs.lease_expires_at < now),
+                ))
+                .order_by(AiJobs.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            if job is None:
+                return None
+
+            # Villkorad på status och attempts, så att två workers aldrig tar samma jobb
+            # även där databasen saknar SKIP LOCKED
+            claimed = (await db.execute(
+                update(AiJobs)
+                .where(AiJobs.id == job.id, AiJobs.status == job.status, AiJobs.attempts == job.attempts)
+                .values(
+                    status=RUNNING,
+                    attempts=job.attempts + 1,
+                    started_at=now,
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                )
+                .returning(AiJobs.id)
+                .execution_options(synchronize_session=False)
+            )).first()
+            await db.commit()
+            if claimed is None:
+                return None
+
+            await db.refresh(job)
+            return job
+
+    async def _process(self, job: AiJobs):
+        if job.attempts > self.max_attempts:
+            await self._finish(job, FAILED, error="Jobbet avbröts upprepade gånger", status_code=500)
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await asyncio.wait_for(
+                run_image_pipeline(job.kind, job.image, job.file_name), self.timeout_seconds
+            )
+        except asyncio.CancelledError:
+            await asyncio.shield(self._requeue(job))
+            raise
+        except asyncio.TimeoutError:
+            await self._finish(job, FAILED, error="Jobbet tog för lång tid", status_code=504)
+        except NonRefundableError as e:
+            await self._finish(job, FAILED, error=str(e.detail), status_code=e.status_code, refund=False)
+        except HTTPException as e:
+            await self._finish(job, FAILED, error=str(e.detail), status_code=e.status_code)
+        except Exception as e:
+            logger.exception("AI job %s failed", job.id)
+            await self._finish(job, FAILED, error=str(e), status_code=500)
+        else:
+            await self._finish(job, SUCCEEDED, result=result)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job: AiJobs):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with AsyncSession(async_engine) as db:
+                    await db.execute(
+                        update(AiJobs)
+                        .where(AiJobs.id == job.id, AiJobs.status == RUNNING, AiJobs.attempts == job.attempts)
+                        .values(lease_expires_at=datetime.now(UTC) + timedelta(seconds=self.lease_seconds))
+                    )
+                    await db.commit()
+            except Exception:
+                # Nästa förnyelse kan lyckas, annars tas jobbet upp igen när leasen gått ut
+                logger.exception("Could not renew lease for AI job %s", job.id)
+
+    async def _finish(self, job: AiJobs, new_status: str, result: dict | None = None,
+                      error: str | None = None, status_code: int | None = None, refund: bool = True):
+        async with AsyncSession(async_engine) as db:
+            # attempts identifierar det här försöket, ett jobb som hunnit tas över av en annan worker lämnas
+            finished = (await db.execute(
+                update(AiJobs)
+                .where(AiJobs.id == job.id, AiJobs.status == RUNNING, AiJobs.attempts == job.attempts)
+                .values(
+                    status=new_status,
+                    result=result,
+                    error=error,
+                    status_code=status_code,
+                    finished_at=datetime.now(UTC),
+                    lease_expires_at=None,
+                    image=None,
+                )
+                .returning(AiJobs.id)
+            )).first()
+            await db.commit()
+
+            # Credits reserverades när jobbet lämnades in, NSFW-avslag behåller dem som de synkrona endpoints
+            if finished is not None and new_status == FAILED and refund:
+                pipeline = IMAGE_PIPELINES[job.kind]
+                await refund_user_credits(db, job.user_id, job.credits, pipeline.credit_reason)
+
+    async def _requeue(self, job: AiJobs):
+        try:
+            async with AsyncSession(async_engine) as db:
+                await db.execute(
+                    update(AiJobs)
+                    .where(AiJobs.id == job.id, AiJobs.status == RUNNING, AiJobs.attempts == job.attempts)
+                    .values(status=QUEUED, attempts=AiJobs.attempts - 1, lease_expires_at=None)
+                )
+                await db.commit()
+        except Exception:
+            # Leasen går ut och jobbet tas upp ändå
+            logger.exception("Could not requeue AI job %s", job.id)
+
+
+job_worker_pool = JobWorkerPool(
+    concurrency=settings.AI_JOB_WORKERS,
+    poll_seconds=settings.AI_JOB_POLL_SECONDS,
+    lease_seconds=settings.AI_JOB_LEASE_SECONDS,
+    timeout_seconds=settings.AI_JOB_TIMEOUT_SECONDS,
+    max_attempts=settings.AI_JOB_MAX_ATTEMPTS,
+)
+
+
+async def prune_finished_jobs(retention_seconds: float) -> int:
+    cutoff = datetime.now(UTC) - timedelta(seconds=retention_seconds)
+    async with AsyncSession(async_engine) as db:
+        result = await db.execute(
+            delete(AiJobs).where(AiJobs.status.in_(FINISHED), AiJobs.finished_at < cutoff)
+        )
+        await db.commit()
+        return result.rowcount
+
+
+async def run_ai_job_pruning():
+    """Körs från lifespan och tar bort klara jobb äldre än AI_JOB_RETENTION_SECONDS"""
+    while True:
+        try:
+            removed = await prune_finished_jobs(settings.AI_JOB_RETENTION_SECONDS)
+            logger.info("AI job pruning: %d rows removed", removed)
+        except Exception:
+            logger.exception("AI job pruning failed")
+        await asyncio.sleep(settings.AI_JOB_PRUNE_SECONDS)
+
+
+async def _get_own_job(db: AsyncSession, job_id: int, user: Users) -> AiJobs:
+    job = await db.get(AiJobs, job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.post("/{kind}", status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(kind: Literal["suggest-recipe-from-image", "suggest-recipe-from-plateimage", "save-bought-items"],
+                     file: UploadFile = File(...),
+                     current_user: Users = Depends(get_current_user),
+                     db: AsyncSession = Depends(get_async_db)):
+    """Lägger en bild i kön för samma behandling som POST /{kind} och svarar direkt med job_id"""
+    image_data = read_image_upload(file)
+
+    active = await db.scalar(
+        select(func.count()).select_from(AiJobs)
+        .where(AiJobs.user_id == current_user.id, AiJobs.status.in_([QUEUED, RUNNING]))
+    )
+    if active >= settings.AI_JOB_MAX_ACTIVE_PER_USER:
+        raise HTTPException(status_code=429, detail="För många pågående jobb, vänta tills något är klart.")
+
+    # Credits reserveras nu och betalas tillbaka om jobbet misslyckas
+    pipeline = IMAGE_PIPELINES[kind]
+    await reserve_credits(db, current_user, pipeline.credits, pipeline.credit_reason)
+    try:
+        job = AiJobs(
+            user_id=current_user.id,
+            kind=kind,
+            status=QUEUED,
+            image=image_data,
+            file_name=file.filename,
+            credits=pipeline.credits,
+        )
+        db.add(job)
+        await db.commit()
+    except BaseException:
+        # Inget AI-anrop har gjorts än, så även avbrott betalas tillbaka
+        await refund_credits(db, current_user, pipeline.credits, pipeline.credit_reason)
+        raise
+
+    job_worker_pool.notify()
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job.id, "status": QUEUED},
+        headers={"Location": f"/v1/jobs/{job.id}"},
+    )
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: int, current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    return job_status(await _get_own_job(db, job_id, current_user))
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: int, current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-sent events: ett 'status'-event vid varje ändring, strömmen stängs
+    när jobbet är klart. Efter AI_JOB_EVENTS_MAX_SECONDS kommer 'timeout' och
+    klienten får koppla upp igen eller polla, försvinner jobbet kommer 'error'.
+    """
+    job = await _get_own_job(db, job_id, current_user)
+    first = job_status(job)
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.AI_JOB_EVENTS_MAX_SECONDS
+        last = first
+        yield f"event: status\ndata: {json.dumps(last)}\n\n"
+        idle = 0.0
+        while last["status"] not in FINISHED:
+            if loop.time() >= deadline:
+                yield f"event: timeout\ndata: {json.dumps(last)}\n\n"
+                return
+            await asyncio.sleep(settings.AI_JOB_EVENTS_POLL_SECONDS)
+            # Kort session per poll, strömmen ska inte hålla en anslutning ur poolen
+            async with AsyncSession(async_engine) as poll_db:
+                row = await poll_db.get(AiJobs, job_id)
+            if row is None:
+                # Borttaget, t.ex. när användaren raderats
+                yield f"event: error\ndata: {json.dumps({'detail': 'Job not found', 'status_code': 404})}\n\n"
+                return
+            current = job_status(row)
+            if current["status"] != last["status"]:
+                last = current
+                idle = 0.0
+                yield f"event: status\ndata: {json.dumps(last)}\n\n"
+            else:
+                idle += settings.AI_JOB_EVENTS_POLL_SECONDS
+                if idle >= 15:
+                    # Håller proxies från att stänga en tyst anslutning
+                    idle = 0.0
+                    yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import Counter
+from datetime import UTC, datetime, timedelta
+
+from cachetools import TTLCache
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.v1.core.models import AiResponseCacheEntry
+from app.db_setup import async_engine
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, (list, tuple, set)):
+        return sorted(_normalize(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in sorted(value.items())}
+    return value
+
+
+def make_key(endpoint: str, recipe_id: int | None, args: dict, prompt_version: int) -> str:
+    """sha256 över (endpoint, recipe_id, normaliserade argument, promptversion)"""
+    raw = json.dumps(
+        [endpoint, recipe_id, _normalize(args), prompt_version],
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class PostgresCacheStore:
+    """Svar i tabellen ai_response_cache, överlever omstarter och delas mellan workers"""
+
+    async def get(self, key: str) -> dict | None:
+        async with AsyncSession(async_engine) as db:
+            return await db.scalar(
+                select(AiResponseCacheEntry.payload)
+                .where(AiResponseCacheEntry.cache_key == key)
+                .where(AiResponseCacheEntry.expires_at > datetime.now(UTC))
+            )
+
+    async def put(self, key: str, endpoint: str, recipe_id: int | None, payload: dict, ttl: int):
+        values = {
+            "cache_key": key,
+            "endpoint": endpoint,
+            "recipe_id": recipe_id,
+            "payload": payload,
+            "created_at": datetime.now(UTC),
+            "expires_at": datetime.now(UTC) + timedelta(seconds=ttl),
+        }
+        async with AsyncSession(async_engine) as db:
+            insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+            stmt = insert(AiResponseCacheEntry).values(values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[AiResponseCacheEntry.cache_key],
+                set_={key: stmt.excluded[key] for key in ("payload", "created_at", "expires_at")},
+            )
+            await db.execute(stmt)
+            await db.commit()
+
+    async def prune(self, max_rows: int) -> int:
+        """Tar bort utgångna rader och de äldsta över max_rows"""
+        async with AsyncSession(async_engine) as db:
+            expired = await db.execute(
+                delete(AiResponseCacheEntry).where(AiResponseCacheEntry.expires_at <= datetime.now(UTC))
+            )
+            removed = expired.rowcount or 0
+
+            total = await db.scalar(select(func.count()).select_from(AiResponseCacheEntry))
+            if total > max_rows:
+                oldest = (
+                    select(AiResponseCacheEntry.id)
+                    .order_by(AiResponseCacheEntry.created_at)
+                    .limit(total - max_rows)
+                )
+                overflow = await db.execute(
+                    delete(AiResponseCacheEntry).where(AiResponseCacheEntry.id.in_(oldest))
+                )
+                removed += overflow.rowcount or 0
+            await db.commit()
+            return removed
+
+
+class AiResponseCache:
+    """
+    Tvånivåcache för AI-svar: en TTL/LRU-cache i processen framför en
+    valfri persistent store. Fel i den persistenta nivån loggas men
+    fäller aldrig anropet, då frågar vi bara Gemini som vanligt.
+    """
+
+    def __init__(self, store: PostgresCacheStore | None, ttl: int, memory_maxsize: int):
+        self.store = store
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=memory_maxsize, ttl=ttl)
+        self.hits = Counter()
+        self.persistent_hits = Counter()
+        self.misses = Counter()
+
+    async def get(self, key: str, endpoint: str) -> dict | None:
+        payload = self._memory.get(key)
+        if payload is not None:
+            self.hits[endpoint] += 1
+            return payload
+
+        if self.store is not None:
+            try:
+                payload = await self.store.get(key)
+            except Exception:
+                logger.exception("AI response cache lookup failed")
+            if payload is not None:
+                self._memory[key] = payload
+                self.persistent_hits[endpoint] += 1
+                return payload
+
+        self.misses[endpoint] += 1
+        return None
+
+    async def put(self, key: str, endpoint: str, recipe_id: int | None, payload: dict):
+        self._memory[key] = payload
+        if self.store is not None:
+            try:
+                await self.store.put(key, endpoint, recipe_id, payload, self.ttl)
+            except Exception:
+                logger.exception("AI response cache write failed")
+
+    def stats(self) -> dict:
+        endpoints = set(self.hits) | set(self.persistent_hits) | set(self.misses)
+        return {
+            endpoint: {
+                "hits": self.hits[endpoint],
+                "persistent_hits": self.persistent_hits[endpoint],
+                "misses": self.misses[endpoint],
+            }
+            for endpoint in sorted(endpoints)
+        }
+
+
+ai_response_cache = AiResponseCache(
+    store=PostgresCacheStore() if settings.AI_CACHE_BACKEND == "postgres" else None,
+    ttl=settings.AI_CACHE_TTL_SECONDS,
+    memory_maxsize=settings.AI_CACHE_MEMORY_MAXSIZE,
+)
+
+
+async def run_ai_cache_pruning():
+    """Körs från lifespan och håller tabellen inom AI_CACHE_MAX_ROWS"""
+    if ai_response_cache.store is None:
+        return
+    while True:
+        try:
+            removed = await ai_response_cache.store.prune(settings.AI_CACHE_MAX_ROWS)
+            logger.info("AI response cache pruning: %d rows removed", removed)
+        except Exception:
+            logger.exception("AI response cache pruning failed")
+        await asyncio.sleep(settings.AI_CACHE_PRUNE_SECONDS)
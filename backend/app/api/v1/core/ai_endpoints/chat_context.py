@@ -0,0 +1,188 @@
+import math
+import re
+import threading
+from html.parser import HTMLParser
+
+from app.settings import settings
+
+# Innehållet i de här taggarna är aldrig användbar kontext för kocken
+SKIPPED_TAGS = {
+    "script", "style", "noscript", "svg", "iframe", "template", "head",
+    "nav", "header", "footer", "aside", "form", "button", "select", "option",
+}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "br", "tr", "table",
+    "h1", "h2", "h3", "h4", "h5", "h6", "dt", "dd", "blockquote", "pre",
+}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+# Avsnitt som alltid får plats före annat när kontexten kortas
+PRIORITY_HEADINGS = re.compile(
+    r"ingrediens|gör så här|instruktion|tillagning|så gör du|portion|näring", re.IGNORECASE
+)
+BOILERPLATE = re.compile(
+    r"cookie|logga (in|ut)|registrera|prenumerera|nyhetsbrev|dela (på|receptet)|"
+    r"alla rättigheter|©|integritetspolicy|läs mer|visa mer|annons",
+    re.IGNORECASE,
+)
+# Kortare rester än så hoppas över i stället för att kortas
+MIN_TRUNCATED_CHARS = 20
+VOID_TAGS = {"br", "img", "input", "hr", "meta", "link", "source", "wbr", "area", "col", "embed"}
+
+
+class _TextExtractor(HTMLParser):
+    """Synlig text som rader, med rubrikerna markerade"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: list[tuple[bool, str]] = []  # (är rubrik, text)
+        self._parts: list[str] = []
+        self._skip_depth = 0
+        self._in_heading = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag == "br":
+                self._flush()
+            return
+        if self._skip_depth or tag in SKIPPED_TAGS or ("hidden", None) in attrs or ("aria-hidden", "true") in attrs:
+            self._skip_depth += 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in HEADING_TAGS:
+            self._in_heading = True
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in HEADING_TAGS:
+            self._in_heading = False
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def _flush(self):
+        text = " ".join("".join(self._parts).split())
+        self._parts = []
+        if text:
+            self.lines.append((self._in_heading, text))
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def estimate_tokens(text: str) -> int:
+    """Ungefär fyra tecken per token, räcker för budgeten och kräver inget API-anrop"""
+    return math.ceil(len(text) / 4)
+
+
+def truncate_line(line: str, budget: int) -> str:
+    """Kortar raden vid ett ordslut så att den ryms i budget tokens, tom sträng om inget ryms"""
+    # Ett tecken för radbrytningen och ett för "…"
+    max_chars = budget * 4 - 2
+    if max_chars < MIN_TRUNCATED_CHARS:
+        return ""
+    cut = line[:max_chars]
+    if " " in cut[MIN_TRUNCATED_CHARS:]:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip(" ,;:") + "…"
+
+
+def _sections(lines: list[tuple[bool, str]]) -> list[tuple[bool, list[str]]]:
+    """Delar upp raderna per rubrik, (prioriterat avsnitt, rader)"""
+    sections: list[tuple[bool, list[str]]] = []
+    for is_heading, text in lines:
+        if is_heading or not sections:
+            # Första rubriken är oftast receptets namn
+            priority = bool(PRIORITY_HEADINGS.search(text)) or (is_heading and not sections)
+            sections.append((priority, []))
+        sections[-1][1].append(text)
+    return sections
+
+
+class ChatContextCompactor:
+    """
+    Gör om sidans HTML till ren text, tar bort sidhuvud/meny/knappar och
+    upprepade rader och kortar till token_budget. Ingredienser och
+    instruktioner tas med först. Räknar hur många tokens som sparats.
+    """
+
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+        self.requests = 0
+        self.truncated = 0
+        self.original_tokens = 0
+        self.compacted_tokens = 0
+        # compact körs i trådpoolen
+        self._lock = threading.Lock()
+
+    def compact(self, context: str) -> str:
+        context = context or ""
+        if "<" in context:
+            extractor = _TextExtractor()
+            extractor.feed(context)
+            extractor.close()
+            extracted = extractor.lines
+        else:
+            # Ren text, behåll radbrytningarna
+            extracted = [(False, " ".join(line.split())) for line in context.splitlines()]
+
+        seen = set()
+        lines = []
+        for is_heading, text in extracted:
+            key = text.lower()
+            if key in seen or len(text) < 2 or BOILERPLATE.search(text):
+                continue
+            seen.add(key)
+            lines.append((is_heading, text))
+
+        compacted, truncated = self._fit(_sections(lines))
+
+        with self._lock:
+            self.requests += 1
+            self.truncated += truncated
+            self.original_tokens += estimate_tokens(context)
+            self.compacted_tokens += estimate_tokens(compacted)
+        return compacted
+
+    def _fit(self, sections: list[tuple[bool, list[str]]]) -> tuple[str, bool]:
+        budget = self.token_budget
+        kept: list[list[str]] = [[] for _ in sections]
+        truncated = False
+        # Prioriterade avsnitt först, sedan resten, men i sidans ordning i resultatet
+        order = [i for i, (priority, _) in enumerate(sections) if priority]
+        order += [i for i, (priority, _) in enumerate(sections) if not priority]
+        for i in order:
+            for line in sections[i][1]:
+                cost = estimate_tokens(line + "\n")
+                if cost > budget:
+                    # Början av raden är bättre än ingenting, särskilt i de prioriterade avsnitten
+                    truncated = True
+                    line = truncate_line(line, budget)
+                    if not line:
+                        continue
+                    cost = estimate_tokens(line + "\n")
+                kept[i].append(line)
+                budget -= cost
+
+        return "\n".join(line for lines in kept for line in lines), truncated
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "truncated": self.truncated,
+            "original_tokens": self.original_tokens,
+            "compacted_tokens": self.compacted_tokens,
+            "tokens_saved": self.original_tokens - self.compacted_tokens,
+        }
+
+
+chat_context_compactor = ChatContextCompactor(token_budget=settings.CHAT_CONTEXT_TOKEN_BUDGET)
@@ -0,0 +1,88 @@
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """
+    Stängd: anropen går igenom och utfallen sparas i ett glidande fönster.
+    Öppen (felandel >= failure_rate på minst min_calls anrop i fönstret):
+    anropen avvisas direkt i open_seconds. Halvöppen: ett provanrop släpps
+    igenom, lyckas det stängs brytaren, annars öppnas den igen.
+    Per process och bara från event-loopen, därför inget lås.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_seconds: float, min_calls: int, failure_rate: float, open_seconds: float):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self._outcomes: deque[tuple[float, bool]] = deque()  # (tid, lyckades)
+        self._opened_at: float | None = None
+        self._probe_started_at: float | None = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.open_seconds:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        # Ett provanrop åt gången, men ett som avbrutits utan utfall får inte låsa brytaren
+        if state == self.HALF_OPEN and (
+            self._probe_started_at is None or now - self._probe_started_at > self.open_seconds
+        ):
+            self._probe_started_at = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            self._opened_at = None
+            self._probe_started_at = None
+            self._outcomes.clear()
+        self._record(True)
+
+    def record_failure(self):
+        if self._opened_at is not None:
+            # Provanropet misslyckades
+            self._open()
+            return
+        self._record(False)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._probe_started_at = None
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    def stats(self) -> dict:
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_failures": failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,299 @@
+import asyncio
+import random
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from pydantic import BaseModel, ValidationError
+
+from app.api.v1.core.ai_endpoints.circuit_breaker import CircuitBreaker
+from app.api.v1.core.ai_endpoints.gemini_metrics import gemini_metrics
+from app.settings import settings
+
+# Konfigurera Gemini API
+genai.configure(api_key=settings.GEMINI_API_KEY)
+
+
+class GeminiTimeout(Exception):
+    """Gemini svarade inte inom GEMINI_TIMEOUT_SECONDS"""
+
+
+class _DeadlineTimeout(GeminiTimeout):
+    """Den totala deadlinen tog slut innan anropet fått hela attempt_timeout_seconds, räknas inte av brytaren"""
+
+
+class GeminiUnavailable(Exception):
+    """Circuit breakern är öppen, anropet skickades aldrig"""
+
+
+class GeminiBusy(GeminiUnavailable):
+    """Ingen av de lokala platserna (max_concurrency) blev ledig före deadline, anropet skickades aldrig"""
+
+
+class GeminiInvalidResponse(Exception):
+    """Svaret saknas (t.ex. blockerat) eller följer inte response_schema"""
+
+
+# Fel som tyder på att Gemini är överbelastat eller nere: försöks igen och räknas av brytaren.
+# Övriga fel (t.ex. InvalidArgument) beror på anropet och försöks inte igen.
+RETRYABLE_ERRORS = (
+    GeminiTimeout,
+    api_exceptions.ServerError,
+    api_exceptions.TooManyRequests,
+    ConnectionError,
+)
+
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        # Bit utan text, t.ex. den sista med bara finish_reason
+        return ""
+
+
+class GeminiClient:
+    """
+    En delad GenerativeModel per process. Anropen går via det asynkrona
+    API:t så att event-loopen aldrig blockeras, högst max_concurrency åt
+    gången. Varje anrop har en total deadline (timeout_seconds) och varje
+    försök en egen (attempt_timeout_seconds). Tillfälliga fel försöks igen
+    med exponentiell backoff och full jitter, och en circuit breaker avvisar
+    anrop direkt när felandelen är hög i stället för att låta dem vänta ut
+    sina timeouts. hedge=True startar ett andra försök om det första inte
+    svarat inom hedge_delay_seconds och använder det svar som kommer först.
+    Väntan på en ledig plats begränsas bara av den totala deadlinen och
+    räknas varken som timeout eller av brytaren, den säger inget om Gemini.
+    """
+
+    def __init__(self, model_name: str, max_concurrency: int, timeout_seconds: float,
+                 attempt_timeout_seconds: float, max_retries: int, retry_base_seconds: float,
+                 retry_max_backoff_seconds: float, hedge_delay_seconds: float, breaker: CircuitBreaker):
+        self.model = genai.GenerativeModel(model_name)
+        self.timeout_seconds = timeout_seconds
+        self.attempt_timeout_seconds = attempt_timeout_seconds
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_backoff_seconds = retry_max_backoff_seconds
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, contents, endpoint: str = "other", hedge: bool = False, **kwargs):
+        """endpoint används bara som etikett i gemini_metrics"""
+        deadline = time.monotonic() + self.timeout_seconds
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                gemini_metrics.record_rejected(endpoint)
+                raise GeminiUnavailable("Gemini är tillfälligt otillgängligt, försök igen om en stund")
+
+            if deadline - time.monotonic() <= 0:
+                raise GeminiTimeout(f"Gemini svarade inte inom {self.timeout_seconds} sekunder")
+
+            try:
+                if hedge and self.hedge_delay_seconds > 0:
+                    response = await self._hedged(contents, endpoint, deadline, kwargs)
+                else:
+                    response = await self._attempt(contents, endpoint, deadline, kwargs)
+            except GeminiBusy:
+                # Kön är full lokalt, ett omförsök skulle bara göra den längre
+                raise
+            except RETRYABLE_ERRORS as e:
+                if not isinstance(e, _DeadlineTimeout):
+                    self.breaker.record_failure()
+                backoff = random.uniform(0, min(self.retry_max_backoff_seconds, self.retry_base_seconds * 2 ** attempt))
+                if attempt == self.max_retries or time.monotonic() + backoff >= deadline:
+                    raise
+                gemini_metrics.record_retry(endpoint)
+                await asyncio.sleep(backoff)
+                continue
+            except Exception:
+                # Gemini svarade, felet ligger i anropet
+                self.breaker.record_success()
+                raise
+
+            self.breaker.record_success()
+            return response
+
+    @asynccontextmanager
+    async def _slot(self, deadline: float, endpoint: str):
+        """En av max_concurrency platser, GeminiBusy om ingen blir ledig före deadline"""
+        try:
+            if self._semaphore.locked():
+                await asyncio.wait_for(self._semaphore.acquire(), max(deadline - time.monotonic(), 0))
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            gemini_metrics.record_queue_timeout(endpoint)
+            raise GeminiBusy("För många samtidiga AI-anrop, försök igen om en stund") from None
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+    async def _attempt(self, contents, endpoint: str, deadline: float, kwargs: dict):
+        # Latensen räknas inklusive väntan på en ledig plats, det är den användaren märker
+        started = time.perf_counter()
+        async with self._slot(deadline, endpoint):
+            # Attempt-timeouten börjar först när anropet skickas
+            timeout = min(self.attempt_timeout_seconds, deadline - time.monotonic())
+            if timeout <= 0:
+                gemini_metrics.record_queue_timeout(endpoint)
+                raise GeminiBusy("För många samtidiga AI-anrop, försök igen om en stund")
+            try:
+                response = await asyncio.wait_for(self._call(contents, timeout, kwargs), timeout)
+            except asyncio.TimeoutError:
+                gemini_metrics.record(endpoint, _elapsed_ms(started), timeout=True)
+                # Fick anropet kortare tid än vanligt (kön åt upp deadlinen) säger timeouten inget om Gemini
+                error_type = GeminiTimeout if timeout >= self.attempt_timeout_seconds else _DeadlineTimeout
+                raise error_type(f"Gemini svarade inte inom {timeout:.1f} sekunder")
+            except Exception as e:
+                gemini_metrics.record(endpoint, _elapsed_ms(started), error=e)
+                raise
+
+        gemini_metrics.record(endpoint, _elapsed_ms(started), usage=getattr(response, "usage_metadata", None))
+        return response
+
+    async def _call(self, contents, timeout: float, kwargs: dict):
+        # Deadline även för gRPC-anropet, så att det avbryts på båda sidor
+        request_options = {**kwargs.get("request_options", {}), "timeout": timeout}
+        return await self.model.generate_content_async(
+            contents, **{**kwargs, "request_options": request_options}
+        )
+
+    async def _hedged(self, contents, endpoint: str, deadline: float, kwargs: dict):
+        tasks = {asyncio.create_task(self._attempt(contents, endpoint, deadline, kwargs))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay_seconds)
+            # Inget andra försök när alla platser är upptagna, det skulle bara öka kön
+            if not done and not self._semaphore.locked():
+                gemini_metrics.record_hedge(endpoint)
+                tasks.add(asyncio.create_task(self._attempt(contents, endpoint, deadline, kwargs)))
+
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, contents, endpoint: str = "other", **kwargs) -> AsyncIterator[str]:
+        """
+        Svaret som textbitar allteftersom Gemini genererar dem. Omförsök görs
+        bara innan första biten skickats vidare, annars skulle texten upprepas.
+        attempt_timeout_seconds gäller fram till första biten och mellan
+        bitarna, timeout_seconds för hela strömmen. Ingen hedging, två
+        strömmar skulle dubbla kostnaden för hela svaret.
+        """
+        deadline = time.monotonic() + self.timeout_seconds
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                gemini_metrics.record_rejected(endpoint)
+                raise GeminiUnavailable("Gemini är tillfälligt otillgängligt, försök igen om en stund")
+
+            started = time.perf_counter()
+            sent = False
+            # Tiden som gällde för den senaste väntan, se _DeadlineTimeout
+            window = self.attempt_timeout_seconds
+            try:
+                # Platsen hålls tills strömmen är slut eller klienten har gått
+                async with self._slot(deadline, endpoint):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        gemini_metrics.record_queue_timeout(endpoint)
+                        raise GeminiBusy("För många samtidiga AI-anrop, försök igen om en stund")
+                    request_options = {**kwargs.get("request_options", {}), "timeout": remaining}
+                    window = min(self.attempt_timeout_seconds, remaining)
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(
+                            contents, stream=True, **{**kwargs, "request_options": request_options}
+                        ),
+                        window,
+                    )
+                    chunks = aiter(response)
+                    while True:
+                        window = min(self.attempt_timeout_seconds, deadline - time.monotonic())
+                        if window <= 0:
+                            raise asyncio.TimeoutError
+                        try:
+                            chunk = await asyncio.wait_for(anext(chunks), window)
+                        except StopAsyncIteration:
+                            break
+                        text = _chunk_text(chunk)
+                        if not text:
+                            continue
+                        if not sent:
+                            sent = True
+                            gemini_metrics.record_first_chunk(endpoint, _elapsed_ms(started))
+                        yield text
+            except GeminiBusy:
+                raise
+            except (asyncio.TimeoutError, *RETRYABLE_ERRORS) as e:
+                timed_out = isinstance(e, (asyncio.TimeoutError, GeminiTimeout))
+                gemini_metrics.record(endpoint, _elapsed_ms(started), error=e, timeout=timed_out)
+                if not timed_out or window >= self.attempt_timeout_seconds:
+                    self.breaker.record_failure()
+                error = GeminiTimeout(f"Gemini svarade inte inom {self.attempt_timeout_seconds} sekunder") if timed_out else e
+                backoff = random.uniform(0, min(self.retry_max_backoff_seconds, self.retry_base_seconds * 2 ** attempt))
+                if sent or attempt == self.max_retries or time.monotonic() + backoff >= deadline:
+                    raise error from e
+                gemini_metrics.record_retry(endpoint)
+                await asyncio.sleep(backoff)
+                attempt += 1
+                continue
+            except Exception as e:
+                # Gemini svarade, felet ligger i anropet
+                gemini_metrics.record(endpoint, _elapsed_ms(started), error=e)
+                self.breaker.record_success()
+                raise
+
+            gemini_metrics.record(endpoint, _elapsed_ms(started), usage=getattr(response, "usage_metadata", None))
+            self.breaker.record_success()
+            return
+
+    async def generate_json(self, contents, schema: type[BaseModel], endpoint: str = "other") -> BaseModel:
+        """JSON-läge med schema härlett ur Pydantic-modellen, svaret valideras mot samma modell"""
+        response = await self.generate(
+            contents,
+            endpoint=endpoint,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=schema,
+            ),
+        )
+        try:
+            return schema.model_validate_json(response.text)
+        except (ValidationError, ValueError) as e:
+            # response.text ger ValueError när svaret saknar text, t.ex. vid safety-blockering
+            raise GeminiInvalidResponse(str(e)) from e
+
+
+gemini = GeminiClient(
+    settings.GEMINI_MODEL,
+    max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+    timeout_seconds=settings.GEMINI_TIMEOUT_SECONDS,
+    attempt_timeout_seconds=settings.GEMINI_ATTEMPT_TIMEOUT_SECONDS,
+    max_retries=settings.GEMINI_MAX_RETRIES,
+    retry_base_seconds=settings.GEMINI_RETRY_BASE_SECONDS,
+    retry_max_backoff_seconds=settings.GEMINI_RETRY_MAX_BACKOFF_SECONDS,
+    hedge_delay_seconds=settings.GEMINI_HEDGE_DELAY_SECONDS,
+    breaker=CircuitBreaker(
+        window_seconds=settings.GEMINI_CIRCUIT_WINDOW_SECONDS,
+        min_calls=settings.GEMINI_CIRCUIT_MIN_CALLS,
+        failure_rate=settings.GEMINI_CIRCUIT_FAILURE_RATE,
+        open_seconds=settings.GEMINI_CIRCUIT_OPEN_SECONDS,
+    ),
+)
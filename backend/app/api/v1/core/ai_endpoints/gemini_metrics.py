@@ -0,0 +1,102 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from app.settings import settings
+
+# Övre gränser (ms) för latenshistogrammet, sista hinken är allt över
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+@dataclass
+class _EndpointMetrics:
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    retries: int = 0
+    hedges: int = 0
+    rejected: int = 0
+    queue_timeouts: int = 0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    total_tokens: int = 0
+    latency_sum_ms: float = 0.0
+    streams: int = 0
+    first_chunk_sum_ms: float = 0.0
+    latency_buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+
+class GeminiMetrics:
+    """
+    Per endpoint: anrop, fel, omförsök, latens som histogram och tokens
+    från svarens usage_metadata, så att kostnaden per endpoint syns utan
+    ett extra count_tokens-anrop. Uppdateras bara från event-loopen.
+    """
+
+    def __init__(self):
+        self._endpoints: dict[str, _EndpointMetrics] = defaultdict(_EndpointMetrics)
+
+    def record(self, endpoint: str, latency_ms: float, usage=None, error: Exception | None = None, timeout: bool = False):
+        metrics = self._endpoints[endpoint]
+        metrics.calls += 1
+        metrics.latency_sum_ms += latency_ms
+        bucket = next((i for i, limit in enumerate(LATENCY_BUCKETS_MS) if latency_ms <= limit), len(LATENCY_BUCKETS_MS))
+        metrics.latency_buckets[bucket] += 1
+        if error is not None or timeout:
+            metrics.errors += 1
+        if timeout:
+            metrics.timeouts += 1
+        if usage is not None:
+            metrics.prompt_tokens += usage.prompt_token_count or 0
+            metrics.response_tokens += usage.candidates_token_count or 0
+            metrics.total_tokens += usage.total_token_count or 0
+
+    def record_retry(self, endpoint: str):
+        self._endpoints[endpoint].retries += 1
+
+    def record_hedge(self, endpoint: str):
+        self._endpoints[endpoint].hedges += 1
+
+    def record_rejected(self, endpoint: str):
+        """Avvisat av circuit breakern, inget anrop gjordes"""
+        self._endpoints[endpoint].rejected += 1
+
+    def record_queue_timeout(self, endpoint: str):
+        """Ingen ledig plats före deadline, inget anrop gjordes"""
+        self._endpoints[endpoint].queue_timeouts += 1
+
+    def record_first_chunk(self, endpoint: str, latency_ms: float):
+        """Strömmade anrop: tiden till första textbiten, den väntan användaren märker"""
+        metrics = self._endpoints[endpoint]
+        metrics.streams += 1
+        metrics.first_chunk_sum_ms += latency_ms
+
+    def snapshot(self) -> dict:
+        result = {}
+        for endpoint, metrics in sorted(self._endpoints.items()):
+            cost = (
+                metrics.prompt_tokens * settings.GEMINI_INPUT_PRICE_PER_MILLION
+                + metrics.response_tokens * settings.GEMINI_OUTPUT_PRICE_PER_MILLION
+            ) / 1_000_000
+            histogram = {f"le_{limit}": count for limit, count in zip(LATENCY_BUCKETS_MS, metrics.latency_buckets)}
+            histogram["inf"] = metrics.latency_buckets[-1]
+            result[endpoint] = {
+                "calls": metrics.calls,
+                "errors": metrics.errors,
+                "timeouts": metrics.timeouts,
+                "retries": metrics.retries,
+                "hedges": metrics.hedges,
+                "rejected": metrics.rejected,
+                "queue_timeouts": metrics.queue_timeouts,
+                "error_rate": round(metrics.errors / metrics.calls, 4) if metrics.calls else 0.0,
+                "prompt_tokens": metrics.prompt_tokens,
+                "response_tokens": metrics.response_tokens,
+                "total_tokens": metrics.total_tokens,
+                "estimated_cost": round(cost, 6),
+                "latency_avg_ms": round(metrics.latency_sum_ms / metrics.calls, 1) if metrics.calls else 0.0,
+                "latency_ms": histogram,
+                "first_chunk_avg_ms": round(metrics.first_chunk_sum_ms / metrics.streams, 1) if metrics.streams else None,
+            }
+        return result
+
+
+gemini_metrics = GeminiMetrics()
@@ -0,0 +1,46 @@
+import io
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps
+
+from app.settings import settings
+
+
+def prepare_image(image_data: bytes, max_edge: int = settings.IMAGE_MAX_EDGE) -> Image.Image:
+    """
+    Avkodar en uppladdad bild en gång, i minnet, till en RGB-bild som både
+    NSFW-modellen och Gemini använder: EXIF-orientering rättad och längsta
+    sidan högst max_edge pixlar.
+    """
+    image = Image.open(io.BytesIO(image_data))
+
+    # JPEG kan avkodas direkt i 1/2, 1/4 eller 1/8 storlek, mycket billigare än full storlek + resize
+    if image.format == "JPEG":
+        image.draft("RGB", (max_edge, max_edge))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    return image
+
+
+def read_image_upload(file: UploadFile | None) -> bytes:
+    """Hela den uppladdade filen, 400 om den saknas eller är tom"""
+    if file is None:
+        raise HTTPException(
+            status_code=400,
+            detail="An image file must be provided.",
+        )
+
+    # Reset file cursor to the beginning
+    file.file.seek(0)
+    image_data = file.file.read()
+
+    # Check if image data is empty
+    if not image_data:
+        raise HTTPException(
+            status_code=400,
+            detail="Empty image file provided.",
+        )
+    return image_data
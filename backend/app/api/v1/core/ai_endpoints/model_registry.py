@@ -0,0 +1,84 @@
+import logging
+import resource
+import threading
+import time
+from typing import Callable
+
+from app.settings import settings
+
+NSFW_MODEL = "nsfw"
+
+
+def _rss_bytes() -> int:
+    """Aktuellt RSS för processen (Linux), annars högsta RSS hittills"""
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModelRegistry:
+    """
+    Laddar tunga ML-modeller först när de används (eller vid warmup/preload)
+    i stället för vid import. Varje modell laddas en gång per process och
+    laddtid och RSS-ökning sparas för /admin/models.
+    """
+
+    def __init__(self):
+        self._loaders: dict[str, Callable] = {}
+        self._models: dict[str, object] = {}
+        self._stats: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable):
+        self._loaders[name] = loader
+
+    def get(self, name: str):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            # En annan tråd kan ha hunnit ladda modellen medan vi väntade
+            if name not in self._models:
+                rss_before = _rss_bytes()
+                start = time.perf_counter()
+                self._models[name] = self._loaders[name]()
+                self._stats[name] = {
+                    "load_seconds": round(time.perf_counter() - start, 3),
+                    "rss_delta_mb": round((_rss_bytes() - rss_before) / 2**20, 1),
+                    "loaded_at": time.time(),
+                }
+                logging.info("Loaded model %s: %s", name, self._stats[name])
+            return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def stats(self) -> dict:
+        return {
+            name: {"loaded": name in self._models, **self._stats.get(name, {})}
+            for name in self._loaders
+        }
+
+
+def _load_nsfw_pipeline():
+    # Importeras här så att varken API-workers utan bilduppladdning eller skript betalar för TensorFlow
+    import tensorflow as tf
+    from transformers import pipeline
+
+    device = "GPU" if tf.config.list_physical_devices("GPU") else "CPU"
+    logging.info("TensorFlow version: %s", tf.__version__)
+    logging.info("Model is using: %s", device)
+    if device == "GPU":
+        logging.info("GPUs available: %d", len(tf.config.list_physical_devices("GPU")))
+
+    return pipeline("image-classification", model=settings.NSFW_MODEL_NAME)
+
+
+model_registry = ModelRegistry()
+model_registry.register(NSFW_MODEL, _load_nsfw_pipeline)
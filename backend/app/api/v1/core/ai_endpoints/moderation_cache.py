@@ -0,0 +1,73 @@
+import hashlib
+
+from cachetools import TTLCache
+from PIL import Image
+
+from app.settings import settings
+
+
+def content_hash(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Differenshash: 64 bitar, en per jämförelse av grannpixlar i en 9x8 gråskala"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class ModerationCache:
+    """
+    Cachar NSFW-resultat (is_nsfw, confidence_percentage) för uppladdade bilder.
+    Ett resultat återanvänds bara för exakt samma fil (sha256). På dHash inom
+    max_distance bitar återanvänds enbart avvisningar: en annan bild får aldrig
+    ett "säkert" resultat från en bild som råkar ligga nära. Används bara från
+    event-loopen, därför inget lås.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, max_distance: int):
+        self.max_distance = max_distance
+        self._by_content = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bara avvisade bilder, så att en omkodad kopia av samma bild avvisas direkt
+        self._rejected_by_dhash = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+
+    def get_exact(self, digest: str) -> dict | None:
+        result = self._by_content.get(digest)
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def get_rejected(self, image_hash: int) -> dict | None:
+        """Ett tidigare NSFW-resultat för samma eller en nästan likadan bild, annars None"""
+        result = self._rejected_by_dhash.get(image_hash)
+        if result is None and self.max_distance > 0:
+            for cached_hash, cached_result in list(self._rejected_by_dhash.items()):
+                if (cached_hash ^ image_hash).bit_count() <= self.max_distance:
+                    result = cached_result
+                    break
+        if result is None:
+            self.misses += 1
+        else:
+            self.perceptual_hits += 1
+        return result
+
+    def put(self, digest: str, image_hash: int | None, result: dict):
+        self._by_content[digest] = result
+        if image_hash is not None and result["is_nsfw"]:
+            self._rejected_by_dhash[image_hash] = result
+
+
+moderation_cache = ModerationCache(
+    maxsize=settings.NSFW_CACHE_MAXSIZE,
+    ttl=settings.NSFW_CACHE_TTL_SECONDS,
+    max_distance=settings.NSFW_CACHE_DHASH_DISTANCE,
+)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+
+from app.api.v1.core.ai_endpoints.model_registry import NSFW_MODEL, model_registry
+from app.settings import settings
+
+
+class InvalidImageError(Exception):
+    """Pipelinen kunde inte tolka bilden (transformers PipelineException)"""
+
+
+@dataclass
+class _Pending:
+    image: object
+    future: asyncio.Future
+
+
+def _scores(logits: np.ndarray, problem_type: str | None) -> np.ndarray:
+    # Samma efterbehandling som image-classification-pipelinen
+    if problem_type == "multi_label_classification" or logits.shape[-1] == 1:
+        return 1 / (1 + np.exp(-logits))
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def predict_nsfw(images: list) -> list[list[dict]]:
+    """
+    Ett modellanrop för hela batchen, returnerar [{label, score}, ...] per bild
+    sorterat som pipelinens resultat. Pipelinen själv batchar bara med
+    PyTorch, på TensorFlow kör den en forward pass per bild, därför går
+    bilderna här direkt genom image processorn och modellen.
+    """
+    classifier = model_registry.get(NSFW_MODEL)
+    model = classifier.model
+
+    try:
+        inputs = classifier.image_processor(
+            images=[image.convert("RGB") for image in images], return_tensors=classifier.framework
+        )
+    except (ValueError, OSError) as e:
+        raise InvalidImageError(str(e)) from e
+
+    if classifier.framework == "pt":
+        import torch
+
+        with torch.no_grad():
+            logits = model(**inputs).logits.float().cpu().numpy()
+    else:
+        logits = model(**inputs, training=False).logits.numpy()
+
+    id2label = model.config.id2label
+    results = []
+    for row in _scores(logits, model.config.problem_type):
+        order = np.argsort(-row)
+        results.append([{"label": id2label[int(i)], "score": float(row[i])} for i in order])
+    return results
+
+
+class InferenceBatcher:
+    """
+    Samlar bilder från samtidiga anrop i upp till max_wait_ms eller
+    max_batch_size stycken, kör ett batchat modellanrop i en tråd och
+    löser varje anropares future med dess eget resultat.
+    """
+
+    def __init__(self, predict: Callable[[list], list], max_batch_size: int, max_wait_ms: float):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._in_flight: list[_Pending] = []
+
+    async def classify(self, image) -> list[dict]:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(image, future))
+        return await future
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Anrop i den avbrutna batchen och i kön får ett fel i stället för att hänga
+        for item in self._in_flight:
+            _resolve(item, exception=RuntimeError("NSFW inference stopped"))
+        self._in_flight = []
+        while self._queue is not None and not self._queue.empty():
+            _resolve(self._queue.get_nowait(), exception=RuntimeError("NSFW inference stopped"))
+
+    async def _collect(self) -> list[_Pending]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self._in_flight = batch
+            try:
+                results = await asyncio.to_thread(self.predict, [item.image for item in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    _resolve(batch[0], exception=e)
+                else:
+                    # En trasig bild ska inte fälla hela batchen, kör dem en och en
+                    logging.exception("Batched NSFW inference failed, retrying %d images one by one", len(batch))
+                    await self._run_individually(batch)
+                self._in_flight = []
+                continue
+
+            for item, result in zip(batch, results):
+                _resolve(item, result=result)
+            self._in_flight = []
+
+    async def _run_individually(self, batch: list[_Pending]):
+        for item in batch:
+            try:
+                result = (await asyncio.to_thread(self.predict, [item.image]))[0]
+            except Exception as e:
+                _resolve(item, exception=e)
+            else:
+                _resolve(item, result=result)
+
+
+def _resolve(item: _Pending, result=None, exception: Exception | None = None):
+    # Anroparen kan ha gett upp (klienten kopplade ner) och avbrutit sin future
+    if item.future.done():
+        return
+    if exception is not None:
+        item.future.set_exception(exception)
+    else:
+        item.future.set_result(result)
+
+
+nsfw_batcher = InferenceBatcher(
+    predict_nsfw,
+    max_batch_size=settings.NSFW_BATCH_MAX_SIZE,
+    max_wait_ms=settings.NSFW_BATCH_MAX_WAIT_MS,
+)
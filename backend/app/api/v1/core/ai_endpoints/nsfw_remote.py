@@ -0,0 +1,268 @@
+"""
+Valfri inferensserver för NSFW-modellen. En process äger modellen och
+betjänar alla API-workers över en Unix-socket, så att varje worker slipper
+hålla en egen kopia av TensorFlow-modellen.
+
+    python -m app.api.v1.core.ai_endpoints.nsfw_remote
+
+Med NSFW_INFERENCE_SOCKET satt skickar classify_image de förbehandlade bilderna hit, annars
+(eller vid timeout/fel om NSFW_INFERENCE_FALLBACK_LOCAL) körs modellen i workern.
+Båda sidor kräver NSFW_INFERENCE_AUTHKEY och autentiserar varandra, och svaren är
+JSON, aldrig pickle, så en process som tar över socketen kan inte köra kod i workern.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import stat
+import struct
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+
+from PIL import Image
+
+from app.api.v1.core.ai_endpoints.model_registry import NSFW_MODEL, model_registry
+from app.api.v1.core.ai_endpoints.nsfw_inference import (
+    InferenceBatcher,
+    InvalidImageError,
+    nsfw_batcher,
+    predict_nsfw,
+)
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Anrop: bredd och höjd (2 x uint32) följt av RGB-pixlarna från prepare_image,
+# så att servern slipper avkoda bilden en gång till. Svar: JSON [status, payload]
+OK = "ok"
+INVALID = "invalid"
+BUSY = "busy"
+ERROR = "error"
+
+
+_HEADER = struct.Struct("!II")
+
+
+def encode_image(image: Image.Image) -> bytes:
+    return _HEADER.pack(*image.size) + image.tobytes()
+
+
+def decode_image(message: bytes) -> Image.Image:
+    size = _HEADER.unpack_from(message)
+    return Image.frombytes("RGB", size, message[_HEADER.size:])
+
+
+class InferenceUnavailable(Exception):
+    """Servern svarar inte, är överbelastad eller gav ett internt fel"""
+
+
+# Standard för servern: en katalog som bara ägaren kan skriva i, inte direkt i /tmp
+DEFAULT_SOCKET = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"nsfw-inference-{os.getuid()}", "inference.sock"
+)
+
+
+def _authkey() -> bytes:
+    if not settings.NSFW_INFERENCE_AUTHKEY:
+        raise ValueError("NSFW_INFERENCE_AUTHKEY must be set to use the NSFW inference server")
+    return settings.NSFW_INFERENCE_AUTHKEY.encode()
+
+
+def encode_reply(status: str, payload) -> bytes:
+    return json.dumps([status, payload]).encode()
+
+
+def decode_reply(message: bytes) -> tuple[str, object]:
+    status, payload = json.loads(message)
+    return status, payload
+
+
+def prepare_socket_directory(address: str):
+    """Socketens katalog måste ägas av oss och inte vara skrivbar för andra"""
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o750, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"{directory} must be owned by this user and not writable by others")
+
+
+class RemoteNsfwClassifier:
+    """
+    Klient i API-workern. Återanvänder anslutningar, begränsar antalet
+    samtidiga anrop (backpressure) och ger upp efter timeout_seconds.
+    """
+
+    def __init__(self, address: str, timeout_seconds: float, max_in_flight: int):
+        self.address = address
+        self.authkey = _authkey()
+        self.timeout_seconds = timeout_seconds
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._idle: queue.SimpleQueue[Connection] = queue.SimpleQueue()
+
+    async def classify(self, image: Image.Image) -> list[dict]:
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise InferenceUnavailable("Too many NSFW requests in flight")
+        try:
+            return await asyncio.to_thread(self._request, encode_image(image))
+        finally:
+            self._semaphore.release()
+
+    def _connection(self) -> Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    def _request(self, message: bytes) -> list[dict]:
+        connection = self._connection()
+        try:
+            connection.send_bytes(message)
+            if not connection.poll(self.timeout_seconds):
+                raise InferenceUnavailable(f"No answer within {self.timeout_seconds}s")
+            status, payload = decode_reply(connection.recv_bytes())
+        except BaseException:
+            # Ett svar kan fortfarande vara på väg, anslutningen går inte att återanvända
+            connection.close()
+            raise
+
+        if status == OK:
+            self._idle.put(connection)
+            return payload
+        if status == INVALID:
+            self._idle.put(connection)
+            raise InvalidImageError(payload)
+        # Servern stänger anslutningen när den är full
+        connection.close()
+        raise InferenceUnavailable(payload)
+
+
+nsfw_client = (
+    RemoteNsfwClassifier(
+        settings.NSFW_INFERENCE_SOCKET,
+        timeout_seconds=settings.NSFW_INFERENCE_TIMEOUT_SECONDS,
+        max_in_flight=settings.NSFW_INFERENCE_MAX_IN_FLIGHT,
+    )
+    if settings.NSFW_INFERENCE_SOCKET
+    else None
+)
+
+
+async def classify_nsfw(image: Image.Image) -> list[dict]:
+    """Klassar via inferensservern om den är konfigurerad, annars i den här processen"""
+    if nsfw_client is None:
+        return await nsfw_batcher.classify(image)
+
+    try:
+        return await nsfw_client.classify(image)
+    except (InferenceUnavailable, AuthenticationError, OSError, EOFError) as e:
+        if not settings.NSFW_INFERENCE_FALLBACK_LOCAL:
+            raise
+        logger.warning("NSFW inference server unavailable (%s), classifying locally", e)
+        return await nsfw_batcher.classify(image)
+
+
+class InferenceServer:
+    """
+    En modellinstans och gemensam mikrobatchning. Varje klientanslutning
+    hanteras av en tråd ur en pool med max_connections trådar, anslutningar
+    utöver det får BUSY och stängs så att klienten kan falla tillbaka.
+    Inferens som tar längre än timeout_seconds avbryts och besvaras med ERROR.
+    """
+
+    def __init__(self, address: str, max_in_flight: int, max_connections: int, timeout_seconds: float):
+        self.address = address
+        self.authkey = _authkey()
+        self.timeout_seconds = timeout_seconds
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._connections = threading.BoundedSemaphore(max_connections)
+        self._pool = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="nsfw-client")
+        self._loop = asyncio.new_event_loop()
+        self._batcher = InferenceBatcher(
+            predict_nsfw,
+            max_batch_size=settings.NSFW_BATCH_MAX_SIZE,
+            max_wait_ms=settings.NSFW_BATCH_MAX_WAIT_MS,
+        )
+
+    def serve_forever(self):
+        model_registry.get(NSFW_MODEL)
+        threading.Thread(target=self._loop.run_forever, name="nsfw-batcher", daemon=True).start()
+
+        prepare_socket_directory(self.address)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            os.chmod(self.address, 0o660)
+            logger.info("NSFW inference server listening on %s", self.address)
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:
+                    logger.warning("Rejected NSFW client connection: %s", e)
+                    continue
+                if not self._connections.acquire(blocking=False):
+                    # Svaret ligger i klientens buffert när den skickar sitt första anrop
+                    with connection:
+                        try:
+                            connection.send_bytes(encode_reply(BUSY, "NSFW inference server has too many connections"))
+                        except OSError:
+                            pass
+                    continue
+                self._pool.submit(self._handle, connection)
+
+    def _handle(self, connection: Connection):
+        try:
+            with connection:
+                while True:
+                    try:
+                        message = connection.recv_bytes()
+                    except (EOFError, OSError):
+                        return
+                    reply = encode_reply(*self._classify(message))
+                    try:
+                        connection.send_bytes(reply)
+                    except OSError:
+                        # Klienten har redan gett upp och stängt anslutningen
+                        return
+        finally:
+            self._connections.release()
+
+    def _classify(self, message: bytes) -> tuple[str, object]:
+        # Full kö: svara direkt så att klienten kan falla tillbaka i stället för att vänta
+        if not self._slots.acquire(blocking=False):
+            return BUSY, "NSFW inference server is at capacity"
+        try:
+            image = decode_image(message)
+            future = asyncio.run_coroutine_threadsafe(self._batcher.classify(image), self._loop)
+            try:
+                return OK, future.result(timeout=self.timeout_seconds)
+            except TimeoutError:
+                # Frigör platsen, klienten har ändå slutat vänta på svaret
+                future.cancel()
+                logger.warning("NSFW inference timed out after %ss", self.timeout_seconds)
+                return ERROR, f"NSFW inference timed out after {self.timeout_seconds}s"
+        except (InvalidImageError, ValueError, struct.error) as e:
+            return INVALID, str(e)
+        except Exception as e:
+            logger.exception("NSFW inference failed")
+            return ERROR, str(e)
+        finally:
+            self._slots.release()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="NSFW inference server")
+    parser.add_argument("--socket", default=settings.NSFW_INFERENCE_SOCKET or DEFAULT_SOCKET)
+    parser.add_argument("--max-in-flight", type=int, default=settings.NSFW_INFERENCE_SERVER_MAX_IN_FLIGHT)
+    parser.add_argument("--max-connections", type=int, default=settings.NSFW_INFERENCE_SERVER_MAX_CONNECTIONS)
+    parser.add_argument("--timeout", type=float, default=settings.NSFW_INFERENCE_TIMEOUT_SECONDS)
+    args = parser.parse_args()
+    InferenceServer(args.socket, args.max_in_flight, args.max_connections, args.timeout).serve_forever()
@@ -0,0 +1,70 @@
+"""
+Gemensamma, korta promptar för Gemini-endpoints. I JSON-läge styrs svarets
+form av response_schema (Pydantic-modellerna i schemas.py), så promptarna
+beskriver bara uppgiften. Öka PROMPT_VERSION i ai.py när något här ändras.
+"""
+from app.api.v1.core.models import Recipes
+
+CHEF = "Du är en mästerkock. Svara på svenska. "
+NUTRITION = "Ange näringsvärden per portion. "
+PANTRY = "Anta att basvaror som salt, peppar, smör och olja finns hemma och ta med dem om de behövs. "
+
+
+def describe_recipe(recipe: Recipes) -> str:
+    return f"Recept: {recipe.name}\nIngredienser: {recipe.ingredients}\n"
+
+
+def shopping_list_prompt(name: str, servings: int, portions: int, lines: list[str]) -> str:
+    return (
+        f"Recept: {name}, skrivet för {servings} portioner.\n"
+        f"Skala ingredienserna till {portions} portioner som en inköpslista:\n"
+        + "\n".join(lines)
+    )
+
+
+def similar_recipes_prompt(recipe: Recipes) -> str:
+    return CHEF + describe_recipe(recipe) + "Föreslå tre recept som liknar detta. " + NUTRITION
+
+
+def change_ingredients_prompt(recipe: Recipes, ingredients: list[str]) -> str:
+    return (
+        CHEF + describe_recipe(recipe)
+        + f"Byt ut {', '.join(ingredients)} mot passande ingredienser och föreslå tre sådana recept. "
+        + NUTRITION
+    )
+
+
+def add_ingredients_prompt(recipe: Recipes, ingredients: list[str]) -> str:
+    return (
+        CHEF + describe_recipe(recipe)
+        + f"Lägg till {', '.join(ingredients)} och föreslå tre sådana recept. "
+        + NUTRITION
+    )
+
+
+def chat_prompt(context: str, message: str) -> str:
+    """/chat och /chat/stream, svaret är ren text"""
+    return (
+        "Du är en hjälpsam och kreativ kockassistent. "
+        "Använd följande kontext från användarens webbsida som bakgrundsinformation:\n"
+        f"{context}\n\n"
+        "Svara endast på användarens fråga om den är relaterad till kontexten fått innan"
+        "Användarens fråga: " + message + "\n\n"
+        "Svara tydligt och koncist på användarens fråga, ENDAST i ren text."
+    )
+
+
+INGREDIENT_IMAGE_PROMPT = (
+    CHEF + "Identifiera ingredienserna på bilden och skapa ett recept som kan lagas med dem. "
+    + PANTRY + NUTRITION
+)
+
+PLATE_IMAGE_PROMPT = (
+    CHEF + "Identifiera maträtten på tallriken och skapa ett recept på den. "
+    + PANTRY + NUTRITION
+)
+
+BOUGHT_ITEMS_PROMPT = (
+    "Identifiera alla matvaror på bilden med namn och storlek (vikt, volym eller antal). "
+    "Gissa på en standardstorlek om den inte syns."
+)
@@ -6,12 +6,16 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
+    JSON,
+    LargeBinary,
     String,
     Text,
     UniqueConstraint,
     func,
-    Numeric
+    Numeric,
+    SmallInteger
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
@@ -33,6 +37,8 @@ class Recipes(Base):
     ratings_count: Mapped[float] = mapped_column(Numeric, nullable=True)
     rating: Mapped[float] = mapped_column(Numeric, nullable=True)
     recipe_url: Mapped[str] = mapped_column(Text, nullable=True)
+    # Bitmask (fågel/fisk/kött) som sätts vid insert/update, se recipe_classification.py
+    recipe_type_flags: Mapped[int] = mapped_column(SmallInteger, nullable=True, index=True)
     
     reviews: Mapped["Reviews"] = relationship(
         back_populates="recipes"
@@ -50,10 +56,11 @@ class Token(Base):
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
-        server_default=func.now() 
+        server_default=func.now(),
+        index=True
     )
     token: Mapped[str] = mapped_column(unique=True, index=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     user: Mapped["Users"] = relationship(back_populates="tokens")
 
 
@@ -152,7 +159,7 @@ class UserRecipes(Base):
         server_default=func.now()  # Uses database server time
     )
     user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     user: Mapped["Users"] = relationship(
         back_populates="user_recipes"
     )
@@ -177,9 +184,9 @@ class Images(Base):
     __tablename__ = "images"
     link: Mapped[str] = mapped_column(String(255))
     user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     user_recipes_id: Mapped[int] = mapped_column(
-        ForeignKey("user_recipes.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("user_recipes.id", ondelete="SET NULL"), nullable=True, index=True)
     user: Mapped["Users"] = relationship(
         back_populates="images"
     )
@@ -196,9 +203,9 @@ class Comments(Base):
         server_default=func.now()  # Uses database server time
     )
     user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     user_recipes_id: Mapped[int] = mapped_column(
-        ForeignKey("user_recipes.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("user_recipes.id", ondelete="SET NULL"), nullable=True, index=True)
     user: Mapped["Users"] = relationship(
         back_populates="comments"
     )
@@ -215,9 +222,9 @@ class Reviews(Base):
         server_default=func.now()
     )
     user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     recipes_id: Mapped[int] = mapped_column(
-        ForeignKey("recipes.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("recipes.id", ondelete="SET NULL"), nullable=True, index=True)
     user: Mapped["Users"] = relationship(
         back_populates="reviews"
     )
@@ -234,9 +241,9 @@ class Messages(Base):
         server_default=func.now()  # Uses database server time
     )
     sender_user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     receiver_user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     user_sender: Mapped["Users"] = relationship(
         "Users", foreign_keys=[sender_user_id],
         back_populates="messages_sender"
@@ -251,9 +258,9 @@ class UserFollows(Base):
     __tablename__ = "user_follows"
     # Primärnyckel bestående av båda kolumnerna
     follower_user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), primary_key=True, nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), primary_key=True, nullable=True, index=True)
     followee_user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), primary_key=True, nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), primary_key=True, nullable=True, index=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -277,11 +284,16 @@ class UserFollows(Base):
 
 class SavedUserRecipes(Base):
     __tablename__ = "saved_user_recipes"
+    # Id från Base leder primärnyckeln, så user_id och user_recipe_id behöver egna index.
+    # (user_id, saved_at, user_recipe_id) täcker både filtret och keyset-sorteringen (bakåtskanning för DESC)
+    __table_args__ = (
+        Index("ix_saved_user_recipes_user_id_saved_at", "user_id", "saved_at", "user_recipe_id"),
+    )
     # Primärnyckel bestående av båda kolumnerna
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     user_recipe_id: Mapped[int] = mapped_column(
-        ForeignKey("user_recipes.id", ondelete="CASCADE"), primary_key=True)
+        ForeignKey("user_recipes.id", ondelete="CASCADE"), primary_key=True, index=True)
     saved_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -304,11 +316,15 @@ class SavedUserRecipes(Base):
     
 class SavedRecipes(Base):
     __tablename__ = "saved_recipes"
+    # Samma indexupplägg som SavedUserRecipes
+    __table_args__ = (
+        Index("ix_saved_recipes_user_id_saved_at", "user_id", "saved_at", "recipe_id"),
+    )
     # Primärnyckel bestående av båda kolumnerna
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     recipe_id: Mapped[int] = mapped_column(
-        ForeignKey("recipes.id", ondelete="CASCADE"), primary_key=True)
+        ForeignKey("recipes.id", ondelete="CASCADE"), primary_key=True, index=True)
     saved_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -333,7 +349,7 @@ class PasswordResetToken(Base):
     __tablename__ = "password_reset_tokens"
     created: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     token: Mapped[str] = mapped_column(String(255), unique=True, index=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     user: Mapped["Users"] = relationship("Users", back_populates="reset_tokens")
     used: Mapped[bool] = mapped_column(Boolean, default=False)
 
@@ -342,7 +358,7 @@ class ActivationToken(Base):
     __tablename__ = "activation_tokens"
     created: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     token: Mapped[str] = mapped_column(String(255), unique=True, index=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
     user: Mapped["Users"] = relationship("Users", back_populates="activation_tokens")
     used: Mapped[bool] = mapped_column(Boolean, default=False)
 
@@ -352,10 +368,69 @@ class SavedItems(Base):
     size: Mapped[str] = mapped_column(Text)
 
     user_id: Mapped[int] = mapped_column(
-        ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     user: Mapped["Users"] = relationship(
         back_populates="saved_items"
     )
 
     def __repr__(self):
-        return f"<item={self.item}>"
\ No newline at end of file
+        return f"<item={self.item}>"
+
+class CreditTransactions(Base):
+    """Append-only logg över alla credit-förändringar, skrivs i batchar av app/credits.py"""
+    __tablename__ = "credit_transactions"
+    amount: Mapped[int]
+    reason: Mapped[str] = mapped_column(String(100))
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now()
+    )
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
+
+    def __repr__(self):
+        return f"<CreditTransaction user={self.user_id} amount={self.amount} reason={self.reason}>"
+
+
+class AiResponseCacheEntry(Base):
+    """Persistent nivå för AI-svarscachen i ai_endpoints/ai_response_cache.py"""
+    __tablename__ = "ai_response_cache"
+    cache_key: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    endpoint: Mapped[str] = mapped_column(String(100))
+    payload: Mapped[dict] = mapped_column(JSON)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now()
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+    recipe_id: Mapped[int] = mapped_column(
+        ForeignKey("recipes.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    def __repr__(self):
+        return f"<AiResponseCacheEntry endpoint={self.endpoint} recipe={self.recipe_id}>"
+
+
+class AiJobs(Base):
+    """Köade bildjobb (ai_endpoints/ai_jobs.py), bilden sparas tills jobbet är klart"""
+    __tablename__ = "ai_jobs"
+    __table_args__ = (
+        Index("ix_ai_jobs_status_created_at", "status", "created_at"),
+    )
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    kind: Mapped[str] = mapped_column(String(50))
+    status: Mapped[str] = mapped_column(String(20), default="queued")
+    image: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+    file_name: Mapped[str] = mapped_column(String(255), nullable=True)
+    credits: Mapped[int]
+    attempts: Mapped[int] = mapped_column(default=0)
+    result: Mapped[dict] = mapped_column(JSON, nullable=True)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    status_code: Mapped[int] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Ett jobb som är "running" efter lease_expires_at har tappats av en worker som dött och tas upp igen
+    lease_expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<ai_job={self.id} {self.kind} {self.status}>"
@@ -0,0 +1,80 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+# Opak keyset-cursor: base64(json([kind, rank, id])). kind talar om vilken lista
+# cursorn hör till, rank är sökrankningen för /search/recipe, saved_at för sparade
+# recept och saknas (None) för /saved-items.
+SEARCH = "search"
+SAVED_RECIPES = "saved_recipes"
+SAVED_USER_RECIPES = "saved_user_recipes"
+SAVED_ITEMS = "saved_items"
+
+# Typen på rank per lista, en cursor från en annan lista ger 400 i stället för ett SQL-fel
+RANK_TYPES = {
+    SEARCH: float,
+    SAVED_RECIPES: datetime,
+    SAVED_USER_RECIPES: datetime,
+    SAVED_ITEMS: type(None),
+}
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor"
+    )
+
+
+def encode_cursor(kind: str, rank, row_id: int) -> str:
+    if isinstance(rank, datetime):
+        rank = {"t": rank.isoformat()}
+    payload = json.dumps([kind, rank, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str | None, kind: str):
+    """Returnerar (rank, id) eller None för första sidan (tom cursor)"""
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_kind, rank, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if isinstance(rank, dict):
+            rank = datetime.fromisoformat(rank["t"])
+        elif isinstance(rank, (int, float)) and not isinstance(rank, bool):
+            rank = float(rank)
+        elif rank is not None:
+            raise ValueError("Unexpected rank")
+        if isinstance(row_id, bool) or not isinstance(row_id, int):
+            raise ValueError("Unexpected id")
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise _invalid_cursor()
+
+    if cursor_kind != kind or not isinstance(rank, RANK_TYPES[kind]):
+        raise _invalid_cursor()
+    return rank, row_id
+
+
+def keyset_condition(rank_column, id_column, after):
+    """Rader som kommer efter cursorn vid ORDER BY rank DESC, id DESC"""
+    rank, row_id = after
+    if rank_column is None:
+        return id_column < row_id
+    return tuple_(rank_column, id_column) < tuple_(rank, row_id)
+
+
+def cursor_page(rows: list, page_size: int, key, kind: str) -> dict:
+    """
+    rows ska vara hämtade med limit page_size + 1 så att vi vet om det finns fler.
+    key(row) returnerar (rank, id) för raden, kind är listan (SEARCH, SAVED_RECIPES, ...).
+    """
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(kind, *key(rows[-1])) if has_more else None
+    return {"items": rows, "next_cursor": next_cursor}
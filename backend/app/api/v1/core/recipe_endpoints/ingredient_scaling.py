@@ -0,0 +1,135 @@
+import math
+import re
+from dataclasses import dataclass
+from fractions import Fraction
+
+# Ingredienserna i Recipes.ingredients är rader som "2 dl mjölk | 1 1/2 msk smör | salt"
+INGREDIENT_SEPARATOR = " | "
+
+UNICODE_FRACTIONS = {
+    "½": Fraction(1, 2),
+    "¼": Fraction(1, 4),
+    "¾": Fraction(3, 4),
+    "⅓": Fraction(1, 3),
+    "⅔": Fraction(2, 3),
+    "⅛": Fraction(1, 8),
+}
+
+UNITS = (
+    "krm", "tsk", "msk", "ml", "cl", "dl", "l", "liter",
+    "g", "gram", "hg", "kg",
+    "st", "styck", "port", "nypa",
+    "burk", "burkar", "paket", "förp", "påse", "påsar", "flaska", "flaskor",
+    "klyfta", "klyftor", "kruka", "krukor", "knippe", "knippen", "skiva", "skivor",
+)
+
+# Det man köper i hela förpackningar/styck avrundas uppåt, "1,5 burk" är 2 burkar på inköpslistan
+WHOLE_UNITS = {
+    "st", "styck", "burk", "burkar", "paket", "förp", "påse", "påsar", "flaska", "flaskor",
+    "klyfta", "klyftor", "kruka", "krukor", "knippe", "knippen", "skiva", "skivor",
+}
+
+# Utan enhet avrundas bara det som inte går att dela, "0,5 lime" ska stå kvar som 1/2
+WHOLE_NAMES = {"ägg", "äggula", "äggulor", "äggvita", "äggvitor"}
+
+_FRACTION_CHARS = "".join(UNICODE_FRACTIONS)
+_QUANTITY = rf"(?:\d+\s+\d+/\d+|\d+\s*[{_FRACTION_CHARS}]|\d+/\d+|\d+(?:[.,]\d+)?|[{_FRACTION_CHARS}])"
+# Längsta enheten först så att "kg" inte tolkas som "k" + "g", \b så att "l" inte matchar "lök"
+_UNIT = "|".join(sorted(map(re.escape, UNITS), key=len, reverse=True))
+_LINE = re.compile(
+    rf"^(?:ca\.?\s+)?(?P<low>{_QUANTITY})(?:\s*[-–]\s*(?P<high>{_QUANTITY}))?"
+    rf"\s*(?:(?P<unit>{_UNIT})\b\.?)?\s*(?P<name>.*)$",
+    re.IGNORECASE,
+)
+_PARENTHESES = re.compile(r"\([^)]*\)")
+_NICE_FRACTIONS = {Fraction(1, 4), Fraction(1, 3), Fraction(1, 2), Fraction(2, 3), Fraction(3, 4)}
+
+
+@dataclass
+class Ingredient:
+    name: str
+    unit: str = ""
+    low: Fraction | None = None
+    high: Fraction | None = None
+
+
+def parse_quantity(text: str) -> Fraction:
+    """ "2", "1,5", "1/2", "1 1/2", "½" och "1½" """
+    text = text.strip().replace(",", ".")
+    total = Fraction(0)
+    if text[-1] in UNICODE_FRACTIONS:
+        total += UNICODE_FRACTIONS[text[-1]]
+        text = text[:-1]
+    for part in text.split():
+        total += Fraction(part)
+    return total
+
+
+def parse_ingredient(line: str) -> Ingredient | None:
+    """
+    Tolkar en ingrediensrad. Rader utan mängd ("salt och peppar") ger en
+    Ingredient utan mängd, None betyder att raden innehåller siffror som
+    inte går att tolka säkert ("smör, 50 g", "1 msk + 1 tsk olja").
+    """
+    line = " ".join(line.split())
+    match = _LINE.match(line)
+    if match is None:
+        return None if re.search(r"\d", line) else Ingredient(name=line)
+
+    name = match["name"].strip()
+    # "1 burk krossade tomater (400 g)" är okej, förpackningsstorleken ska inte skalas
+    if not name or re.search(r"\d", _PARENTHESES.sub("", name)):
+        return None
+    return Ingredient(
+        name=name,
+        unit=(match["unit"] or "").lower(),
+        low=parse_quantity(match["low"]),
+        high=parse_quantity(match["high"]) if match["high"] else None,
+    )
+
+
+def _is_whole(unit: str, name: str = "") -> bool:
+    if unit:
+        return unit in WHOLE_UNITS
+    words = name.lower().split()
+    return bool(words) and words[0].strip(",") in WHOLE_NAMES
+
+
+def format_quantity(value: Fraction, unit: str, name: str = "") -> str:
+    if _is_whole(unit, name):
+        return str(math.ceil(value))
+    if value.denominator == 1:
+        return str(value.numerator)
+
+    whole, rest = divmod(value, 1)
+    if rest in _NICE_FRACTIONS:
+        return f"{whole} {rest}" if whole else str(rest)
+
+    digits = 0 if value >= 100 else 1 if value >= 10 else 2
+    return f"{float(value):.{digits}f}".rstrip("0").rstrip(".").replace(".", ",")
+
+
+def scale_ingredient(ingredient: Ingredient, factor: Fraction) -> dict:
+    """Samma form som Gemini-svaret: name, amount, unit"""
+    if ingredient.low is None:
+        amount = ""
+    else:
+        amount = format_quantity(ingredient.low * factor, ingredient.unit, ingredient.name)
+        if ingredient.high is not None:
+            amount += "-" + format_quantity(ingredient.high * factor, ingredient.unit, ingredient.name)
+    return {"name": ingredient.name, "amount": amount, "unit": ingredient.unit}
+
+
+def scale_ingredients(ingredients: str, factor: Fraction) -> tuple[list[dict], list[str]]:
+    """Skalade ingredienser samt de rader som inte gick att tolka"""
+    scaled, unparsed = [], []
+    for line in (ingredients or "").split(INGREDIENT_SEPARATOR):
+        line = line.strip()
+        if not line:
+            continue
+        ingredient = parse_ingredient(line)
+        if ingredient is None:
+            unparsed.append(line)
+        else:
+            scaled.append(scale_ingredient(ingredient, factor))
+    return scaled, unparsed
@@ -0,0 +1,71 @@
+from sqlalchemy import event, inspect
+
+from app.api.v1.core.models import Recipes
+
+# Bitmask i Recipes.recipe_type_flags. 0 betyder vegetariskt, NULL att receptet inte klassats än.
+POULTRY = 1
+FISH = 2
+MEAT = 4
+ALL_FLAGS = POULTRY | FISH | MEAT
+
+RECIPE_TYPE_KEYWORDS = {
+    POULTRY: ("kyckling", "anka", "kalkon"),
+    FISH: ("fisk", "skaldjur", "tonfisk", "lax", "bläckfisk", "räkor", "krabba", "hummer"),
+    MEAT: ("nötkött", "fläsk", "bacon", "kött", "lamm"),
+}
+
+RECIPE_TYPE_ALIASES = {
+    "fågel": POULTRY,
+    "poultry": POULTRY,
+    "fisk": FISH,
+    "fish": FISH,
+    "kött": MEAT,
+    "meat": MEAT,
+    "vegetarisk": 0,
+    "vegetarian": 0,
+}
+
+
+def classify_ingredients(ingredients: str | None) -> int:
+    """Samma substrängsmatchning som de tidigare ILIKE '%...%'-villkoren"""
+    text = (ingredients or "").lower()
+    flags = 0
+    for flag, keywords in RECIPE_TYPE_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            flags |= flag
+    return flags
+
+
+def recipe_type_flag(recipe_type: str | None) -> int | None:
+    """Flaggan för en recipe_type (svensk eller engelsk), None om typen är okänd"""
+    if not recipe_type:
+        return None
+    return RECIPE_TYPE_ALIASES.get(recipe_type.lower())
+
+
+def flag_condition(flag: int | None):
+    """Indexvänligt villkor för en flagga, None betyder inget filter"""
+    if flag is None:
+        return None
+    if flag == 0:
+        return Recipes.recipe_type_flags == 0
+
+    # Bara tre bitar, så IN över alla matchande värden kan använda btree-indexet
+    return Recipes.recipe_type_flags.in_(
+        [value for value in range(ALL_FLAGS + 1) if value & flag]
+    )
+
+
+def recipe_type_condition(recipe_type: str | None):
+    return flag_condition(recipe_type_flag(recipe_type))
+
+
+@event.listens_for(Recipes, "before_insert")
+def classify_new_recipe(mapper, connection, target):
+    target.recipe_type_flags = classify_ingredients(target.ingredients)
+
+
+@event.listens_for(Recipes, "before_update")
+def reclassify_updated_recipe(mapper, connection, target):
+    if inspect(target).attrs.ingredients.history.has_changes():
+        target.recipe_type_flags = classify_ingredients(target.ingredients)
@@ -0,0 +1,92 @@
+import asyncio
+import random
+import time
+from array import array
+from dataclasses import dataclass, field
+
+from sqlalchemy import select
+
+from app.api.v1.core.models import Recipes
+from app.api.v1.core.recipe_endpoints.recipe_classification import flag_condition
+from app.settings import settings
+
+RANDOM_RECIPE_COUNT = 11
+
+_sysrand = random.SystemRandom()
+
+
+@dataclass
+class _IdEntry:
+    ids: array = field(default_factory=lambda: array("q"))
+    refreshed_at: float = 0.0
+    full_refreshed_at: float = 0.0
+
+
+class RecipeIdCache:
+    """
+    Sorterad, tät array med recept-id:n per recipe_type-flagga (None = alla recept).
+    Nya recept hämtas inkrementellt (id > största kända id), en full omladdning
+    med jämna mellanrum fångar raderade och omklassade recept.
+    """
+
+    def __init__(self, refresh_seconds: int, full_refresh_seconds: int):
+        self.refresh_seconds = refresh_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self._entries: dict[int | None, _IdEntry] = {}
+        self._lock = asyncio.Lock()
+
+    async def ids(self, db, flag: int | None) -> array:
+        now = time.monotonic()
+        async with self._lock:
+            entry = self._entries.setdefault(flag, _IdEntry())
+            if now - entry.full_refreshed_at > self.full_refresh_seconds:
+                entry.ids = array("q", await self._load_ids(db, flag))
+                entry.refreshed_at = entry.full_refreshed_at = now
+            elif now - entry.refreshed_at > self.refresh_seconds:
+                after_id = entry.ids[-1] if entry.ids else 0
+                entry.ids.extend(await self._load_ids(db, flag, after_id))
+                entry.refreshed_at = now
+            return entry.ids
+
+    def invalidate(self):
+        self._entries.clear()
+
+    @staticmethod
+    async def _load_ids(db, flag: int | None, after_id: int = 0) -> list[int]:
+        query_stmt = select(Recipes.id).where(Recipes.id > after_id).order_by(Recipes.id)
+        condition = flag_condition(flag)
+        if condition is not None:
+            query_stmt = query_stmt.where(condition)
+        return (await db.scalars(query_stmt)).all()
+
+
+recipe_id_cache = RecipeIdCache(
+    refresh_seconds=settings.RANDOM_RECIPE_ID_REFRESH_SECONDS,
+    full_refresh_seconds=settings.RANDOM_RECIPE_ID_FULL_REFRESH_SECONDS,
+)
+
+
+async def sample_recipes(db, flag: int | None, count: int = RANDOM_RECIPE_COUNT, seed: int | None = None) -> list[Recipes]:
+    """Hämtar upp till count unika, slumpade recept i en enda fråga"""
+    rng = random.Random(seed) if seed is not None else _sysrand
+
+    for _attempt in range(2):
+        ids = await recipe_id_cache.ids(db, flag)
+        if not ids:
+            return []
+
+        sampled_ids = rng.sample(ids, min(count, len(ids)))
+        rows = (await db.scalars(select(Recipes).where(Recipes.id.in_(sampled_ids)))).all()
+
+        # Ett recept har raderats sedan cachen laddades, ladda om och försök igen
+        if len(rows) < len(sampled_ids) and _attempt == 0:
+            recipe_id_cache.invalidate()
+            if seed is not None:
+                rng = random.Random(seed)
+            continue
+
+        # Behåll urvalsordningen så att samma seed ger samma lista
+        by_id = {row.id: row for row in rows}
+        return [by_id[recipe_id] for recipe_id in sampled_ids if recipe_id in by_id]
+
+    return []
@@ -0,0 +1,145 @@
+import re
+
+from sqlalchemy import func, literal, literal_column, or_, select
+# Registrerar to_tsvector m.fl. för func innan SEARCH_DOCUMENT byggs, annars går
+# uttrycket inte att kompilera om modulen importeras före Postgres-motorn
+from sqlalchemy.dialects import postgresql  # noqa: F401
+
+from app.api.v1.core.models import Recipes
+from app.api.v1.core.pagination import keyset_condition
+from app.api.v1.core.schemas import SearchRecipeSchema
+
+# Konstanter renderas som literaler (inte bundna parametrar) så att Postgres
+# kan matcha uttrycket mot ix_recipes_search_document, se migrations/versions/0001
+SEARCH_CONFIG = literal_column("'swedish'::regconfig")
+_EMPTY = literal_column("''")
+SEARCH_DOCUMENT = func.to_tsvector(
+    SEARCH_CONFIG,
+    func.coalesce(Recipes.name, _EMPTY) + literal_column("' '") + func.coalesce(Recipes.ingredients, _EMPTY),
+)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_postgres(db) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def filter_conditions(recipe: SearchRecipeSchema) -> list:
+    """Näringsvärdes- och ingrediensfilter, gemensamma för båda sökmotorerna"""
+    conditions = []
+
+    if recipe.carbohydrates is not None:
+        conditions.append(Recipes.carbohydrates <= recipe.carbohydrates)
+
+    if recipe.calories is not None:
+        conditions.append(Recipes.calories <= recipe.calories)
+
+    if recipe.protein is not None:
+        conditions.append(Recipes.protein >= recipe.protein)
+
+    # Trigram-indexet på ingredients täcker dessa ILIKE-villkor i Postgres
+    if recipe.ingredients:
+        for ingredient in recipe.ingredients.split(','):
+            conditions.append(Recipes.ingredients.ilike(f"%{ingredient.strip()}%"))
+
+    return conditions
+
+
+def rank_expression(search_term: str | None):
+    """Returnerar (villkor, rank) för söktermen i Postgres"""
+    if not search_term:
+        return None, literal(0.0)
+
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, search_term)
+    condition = or_(
+        Recipes.name.ilike(f"%{search_term}%"),
+        SEARCH_DOCUMENT.op("@@")(tsquery),
+    )
+    rank = func.ts_rank_cd(SEARCH_DOCUMENT, tsquery) + func.similarity(Recipes.name, search_term)
+    return condition, rank
+
+
+def _words(text: str | None) -> list[str]:
+    return _WORD_RE.findall((text or "").lower())
+
+
+def _trigrams(text: str | None) -> set[str]:
+    """Samma uppdelning som pg_trgm: varje ord paddas med två blanksteg före och ett efter"""
+    grams = set()
+    for word in _words(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def trigram_similarity(a: str | None, b: str | None) -> float:
+    left, right = _trigrams(a), _trigrams(b)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def python_rank(recipe: Recipes, search_term: str | None) -> float:
+    """Ren Python-motsvarighet till ts_rank_cd + similarity, används av SQLite"""
+    if not search_term:
+        return 0.0
+
+    query_words = _words(search_term)
+    document_words = _words(recipe.name) + _words(recipe.ingredients)
+    if not query_words:
+        return 0.0
+
+    # Prefixmatchning är en grov ersättning för den svenska stemmern
+    matched = sum(
+        1 for word in query_words
+        if any(doc_word.startswith(word) for doc_word in document_words)
+    )
+    return matched / len(query_words) + trigram_similarity(recipe.name, search_term)
+
+
+def postgres_search_statement(recipe: SearchRecipeSchema, limit: int, offset: int = 0, after=None):
+    """SELECT (Recipes, rank) för Postgres, ska kunna använda indexen i migrations/versions/0001"""
+    conditions = filter_conditions(recipe)
+    term_condition, rank = rank_expression(recipe.query)
+    # Utan sökterm är rank en konstant, och "ORDER BY 0.0" godtas inte av Postgres
+    order_by = [Recipes.id.desc()]
+    if term_condition is not None:
+        conditions.append(term_condition)
+        order_by.insert(0, rank.desc())
+    if after is not None:
+        conditions.append(keyset_condition(rank, Recipes.id, after))
+
+    return (
+        select(Recipes, rank)
+        .where(*conditions)
+        .order_by(*order_by)
+        .offset(offset)
+        .limit(limit)
+    )
+
+
+async def search_recipes(recipe: SearchRecipeSchema, db, limit: int, offset: int = 0, after=None) -> list[tuple[Recipes, float]]:
+    """
+    Rankad receptsökning. Postgres använder fulltext (swedish) och pg_trgm-index,
+    övriga databaser (SQLite i tester) filtrerar med ILIKE och rankar i Python.
+    after är en avkodad keyset-cursor (rank, id) och ersätter offset.
+    """
+    search_term = recipe.query
+
+    if is_postgres(db):
+        query_stmt = postgres_search_statement(recipe, limit, offset, after)
+        return [(row, float(score)) for row, score in (await db.execute(query_stmt)).all()]
+
+    conditions = filter_conditions(recipe)
+    if search_term:
+        conditions.append(Recipes.name.ilike(f"%{search_term}%"))
+
+    results = (await db.scalars(select(Recipes).where(*conditions))).all()
+    ranked = sorted(
+        ((row, python_rank(row, search_term)) for row in results),
+        key=lambda item: (-item[1], -item[0].id),
+    )
+    if after is not None:
+        ranked = [item for item in ranked if (item[1], item[0].id) < after]
+    return ranked[offset:offset + limit]
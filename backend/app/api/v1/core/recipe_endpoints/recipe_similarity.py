@@ -0,0 +1,234 @@
+import asyncio
+import math
+import re
+import time
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import event, select
+
+from app.api.v1.core.models import Recipes
+from app.api.v1.core.recipe_endpoints.ingredient_scaling import INGREDIENT_SEPARATOR, parse_ingredient
+from app.settings import settings
+
+_WORD = re.compile(r"[a-zåäöéèü]+")
+_PARENTHESES = re.compile(r"\([^)]*\)")
+
+# Ord i ingrediensraderna som inte säger något om vilken rätt det är
+STOP_WORDS = frozenset({
+    "och", "eller", "till", "att", "med", "utan", "för", "från", "som", "samt", "gärna", "valfri",
+    "valfritt", "servering", "garnering", "stekning", "smörjning", "finhackad", "finhackade",
+    "hackad", "hackade", "skivad", "skivade", "riven", "rivet", "rivna", "färsk", "färska",
+    "fryst", "frysta", "stor", "stora", "liten", "små", "ca", "eventuellt",
+})
+
+NUTRITION_COLUMNS = ("calories", "protein", "carbohydrates", "fat")
+
+
+def ingredient_terms(ingredients: str | None) -> Counter:
+    """Ingrediensorden i ett recept, utan mängder, enheter och fyllnadsord"""
+    terms = Counter()
+    for line in (ingredients or "").split(INGREDIENT_SEPARATOR):
+        ingredient = parse_ingredient(line)
+        name = ingredient.name if ingredient is not None else line
+        for word in _WORD.findall(_PARENTHESES.sub("", name.lower())):
+            if len(word) > 2 and word not in STOP_WORDS:
+                terms[word] += 1
+    return terms
+
+
+def _nutrition_value(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+class _IndexState:
+    """
+    TF-IDF-vektorer över ingredienserna som inverterat index (term -> rader,
+    vikter) plus en z-normaliserad näringsvektor per recept. IDF och
+    normaliseringen räknas vid full ombyggnad, nya recept läggs till med dem.
+    """
+
+    def __init__(self, rows):
+        documents = [ingredient_terms(row.ingredients) for row in rows]
+        document_frequency = Counter()
+        for terms in documents:
+            document_frequency.update(terms.keys())
+        self._default_idf = math.log(1 + len(rows)) + 1
+        self._idf = {
+            term: math.log((1 + len(rows)) / (1 + count)) + 1
+            for term, count in document_frequency.items()
+        }
+
+        # Medelvärde och spridning över de recept som har fullständiga näringsvärden
+        nutrition = self._raw_nutrition(rows)
+        nutrition = nutrition[np.isfinite(nutrition).all(axis=1)]
+        self._mean = nutrition.mean(axis=0) if len(nutrition) else np.zeros(len(NUTRITION_COLUMNS))
+        std = nutrition.std(axis=0) if len(nutrition) else np.ones(len(NUTRITION_COLUMNS))
+        self._std = np.where(std > 0, std, 1.0)
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.rows: dict[int, int] = {}
+        self.vectors: list[dict[str, float]] = []
+        self.postings: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.nutrition = np.empty((0, len(NUTRITION_COLUMNS)), dtype=np.float32)
+        self._append(rows, documents)
+
+    @staticmethod
+    def _raw_nutrition(rows) -> np.ndarray:
+        return np.array(
+            [[_nutrition_value(getattr(row, column)) for column in NUTRITION_COLUMNS] for row in rows],
+            dtype=np.float64,
+        ).reshape(len(rows), len(NUTRITION_COLUMNS))
+
+    @property
+    def max_id(self) -> int:
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def extend(self, rows):
+        self._append(rows, [ingredient_terms(row.ingredients) for row in rows])
+
+    def _append(self, rows, documents):
+        if not rows:
+            return
+        first_row = len(self.ids)
+        new_postings: dict[str, tuple[list[int], list[float]]] = {}
+        for offset, (row, terms) in enumerate(zip(rows, documents)):
+            weights = {term: count * self._idf.get(term, self._default_idf) for term, count in terms.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            vector = {term: weight / norm for term, weight in weights.items()}
+            self.vectors.append(vector)
+            self.rows[row.id] = first_row + offset
+            for term, weight in vector.items():
+                posting_rows, posting_weights = new_postings.setdefault(term, ([], []))
+                posting_rows.append(first_row + offset)
+                posting_weights.append(weight)
+
+        for term, (posting_rows, posting_weights) in new_postings.items():
+            new_rows = np.array(posting_rows, dtype=np.int64)
+            new_weights = np.array(posting_weights, dtype=np.float32)
+            if term in self.postings:
+                old_rows, old_weights = self.postings[term]
+                new_rows = np.concatenate([old_rows, new_rows])
+                new_weights = np.concatenate([old_weights, new_weights])
+            self.postings[term] = (new_rows, new_weights)
+
+        # Saknade näringsvärden ger en nollvektor, dvs inget bidrag till likheten
+        raw = self._raw_nutrition(rows)
+        complete = np.isfinite(raw).all(axis=1, keepdims=True)
+        nutrition = np.where(complete, (np.nan_to_num(raw) - self._mean) / self._std, 0.0)
+        norms = np.linalg.norm(nutrition, axis=1, keepdims=True)
+        nutrition = np.divide(nutrition, norms, out=np.zeros_like(nutrition), where=norms > 0)
+
+        self.ids = np.concatenate([self.ids, np.array([row.id for row in rows], dtype=np.int64)])
+        self.nutrition = np.vstack([self.nutrition, nutrition.astype(np.float32)])
+
+    def similar(self, recipe_id: int, k: int, nutrition_weight: float) -> list[tuple[int, float]]:
+        row = self.rows.get(recipe_id)
+        if row is None or len(self.ids) < 2:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term, weight in self.vectors[row].items():
+            posting_rows, posting_weights = self.postings[term]
+            scores[posting_rows] += weight * posting_weights
+        scores *= 1.0 - nutrition_weight
+        # Motsatt näringsprofil ska inte väga tyngre än saknade näringsvärden
+        scores += nutrition_weight * np.maximum(self.nutrition @ self.nutrition[row], 0.0)
+        scores[row] = -np.inf
+
+        k = min(k, len(self.ids) - 1)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
+
+
+class RecipeSimilarityIndex:
+    """
+    Liknande recept ur katalogen. Byggs vid första anropet, nya recept
+    (id > största kända id) läggs till inkrementellt och en full ombyggnad
+    med jämna mellanrum fångar ändrade och raderade recept samt ny IDF.
+    """
+
+    def __init__(self, refresh_seconds: int, full_refresh_seconds: int, nutrition_weight: float):
+        self.refresh_seconds = refresh_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self.nutrition_weight = nutrition_weight
+        self._state: _IndexState | None = None
+        self._refreshed_at = 0.0
+        self._full_refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def similar(self, db, recipe_id: int, k: int) -> list[tuple[int, float]]:
+        state = await self._current_state(db, recipe_id)
+        return state.similar(recipe_id, k, self.nutrition_weight)
+
+    def invalidate(self):
+        self._full_refreshed_at = -math.inf
+
+    async def _current_state(self, db, recipe_id: int) -> _IndexState:
+        now = time.monotonic()
+        async with self._lock:
+            if self._state is None or now - self._full_refreshed_at > self.full_refresh_seconds:
+                rows = await self._load(db)
+                # Tokenisering och IDF för hela katalogen tar en stund, håll event-loopen fri
+                self._state = await asyncio.to_thread(_IndexState, rows)
+                self._refreshed_at = self._full_refreshed_at = now
+            elif recipe_id not in self._state.rows or now - self._refreshed_at > self.refresh_seconds:
+                self._state.extend(await self._load(db, self._state.max_id))
+                self._refreshed_at = now
+            return self._state
+
+    @staticmethod
+    async def _load(db, after_id: int = 0):
+        query_stmt = (
+            select(Recipes.id, Recipes.ingredients, *(getattr(Recipes, column) for column in NUTRITION_COLUMNS))
+            .where(Recipes.id > after_id)
+            .order_by(Recipes.id)
+        )
+        return (await db.execute(query_stmt)).all()
+
+
+recipe_similarity_index = RecipeSimilarityIndex(
+    refresh_seconds=settings.RECIPE_SIMILARITY_REFRESH_SECONDS,
+    full_refresh_seconds=settings.RECIPE_SIMILARITY_FULL_REFRESH_SECONDS,
+    nutrition_weight=settings.RECIPE_SIMILARITY_NUTRITION_WEIGHT,
+)
+
+
+@event.listens_for(Recipes, "after_update")
+@event.listens_for(Recipes, "after_delete")
+def invalidate_similarity_index(mapper, connection, target):
+    # Gäller bara den här processen, andra workers tar det vid nästa fulla ombyggnad
+    recipe_similarity_index.invalidate()
+
+
+def _number(value) -> float | None:
+    return None if value is None else float(value)
+
+
+async def similar_recipes(db, recipe_id: int, k: int) -> list[dict]:
+    """De k mest lika katalogrecepten, med likheten (0-1) per recept"""
+    matches = await recipe_similarity_index.similar(db, recipe_id, k)
+    if not matches:
+        return []
+
+    rows = (await db.scalars(select(Recipes).where(Recipes.id.in_([match_id for match_id, _ in matches])))).all()
+    by_id = {row.id: row for row in rows}
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "ingredients": row.ingredients,
+            "cook_time": row.cook_time,
+            "calories": _number(row.calories),
+            "protein": _number(row.protein),
+            "carbohydrates": _number(row.carbohydrates),
+            "fat": _number(row.fat),
+            "images": row.images,
+            "rating": _number(row.rating),
+            "recipe_url": row.recipe_url,
+            "similarity": round(score, 4),
+        }
+        for match_id, score in matches
+        if (row := by_id.get(match_id)) is not None
+    ]
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status, Query
 from sqlalchemy import delete, insert, select, update, and_, or_, exists
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import Optional, Annotated
 from random import randint
@@ -8,8 +9,10 @@ from datetime import datetime, timezone
 
 
 from app.security import get_current_user
+from app.credits import grant_recipe_saved_bonus
 from app.api.v1.core.recipe_endpoints.recipe_db import (
     get_recipe_db,
+    get_recipe_page_db,
     get_random_recipe_db,
     get_one_recipe_db,
     save_recipe_db
@@ -32,12 +35,13 @@ from app.api.v1.core.schemas import (
     SavedRecipeSchema,
 )
 
-from app.db_setup import get_db
+from app.api.v1.core.pagination import SAVED_RECIPES, cursor_page, decode_cursor, keyset_condition
+from app.db_setup import get_async_db
 
 router = APIRouter()
 
 @router.get("/search/recipe", status_code=200)
-def search_recipe(
+async def search_recipe(
     query: str = Query(..., description="Search term for recipes"),
     carbohydrates: int = Query(None, description="Maximum carbohydrates"),
     calories: int = Query(None, description="Maximum calories"),
@@ -45,7 +49,8 @@ def search_recipe(
     ingredients: str = Query(None, description="Ingredients to filter by"),
     page: int = Query(0, ge=0, description="Page number, starting from 0"),
     page_size: int = Query(20, ge=1, le=100, description="Number of recipes per page"),
-    db: Session = Depends(get_db)
+    cursor: str = Query(None, description="Keyset cursor from next_cursor, empty for the first page"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Create a SearchRecipeSchema instance with the parameters
     recipe_params = SearchRecipeSchema(
@@ -58,7 +63,17 @@ def search_recipe(
         page_size=page_size
     )
     
-    result = get_recipe_db(recipe=recipe_params, page=page, page_size=page_size, db=db)
+    # Med cursor (även tom) svarar vi med {"items", "next_cursor"}, annars som tidigare med en lista
+    if cursor is not None:
+        result = await get_recipe_page_db(recipe=recipe_params, cursor=cursor, page_size=page_size, db=db)
+        if not result["items"] and not cursor:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No recipes found"
+            )
+        return result
+
+    result = await get_recipe_db(recipe=recipe_params, page=page, page_size=page_size, db=db)
     
     if not result and page == 0:
         raise HTTPException(
@@ -69,11 +84,11 @@ def search_recipe(
 
 
 @router.get("/random/recipe", status_code=200)
-def get_random_recipe(
+async def get_random_recipe(
         recipe_type: RandomRecipeSchema = Depends(),
-        db: Session = Depends(get_db)):
+        db: AsyncSession = Depends(get_async_db)):
 
-    result = get_random_recipe_db(recipe=recipe_type, db=db)
+    result = await get_random_recipe_db(recipe=recipe_type, db=db)
 
     if not result:
         raise HTTPException(
@@ -83,8 +98,8 @@ def get_random_recipe(
     return result
 
 @router.get("/recipe/{recipe_id}", status_code=200)
-def get_recipe(recipe_id: int, db: Session = Depends(get_db)):
-    recipe = get_one_recipe_db(recipe_id, db)
+async def get_recipe(recipe_id: int, db: AsyncSession = Depends(get_async_db)):
+    recipe = await get_one_recipe_db(recipe_id, db)
     if not recipe:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -93,8 +108,8 @@ def get_recipe(recipe_id: int, db: Session = Depends(get_db)):
     return recipe
 
 @router.post("/recipe/saved", status_code=201)
-def save_recipe(recipe: SavedRecipeSchema, current_user: Users = Depends(get_current_user), db: Session = Depends(get_db)):
-    recipe = save_recipe_db(recipe, db, current_user)
+async def save_recipe(recipe: SavedRecipeSchema, current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    recipe = await save_recipe_db(recipe, db, current_user)
 
     if not recipe:
         raise HTTPException(
@@ -102,19 +117,17 @@ def save_recipe(recipe: SavedRecipeSchema, current_user: Users = Depends(get_cur
             detail="couldnt save recipe"
         )
     
-    now = datetime.now(timezone.utc)
-    if not current_user.last_recipe_saved_credit or current_user.last_recipe_saved_credit.date() != now.date():
-        current_user.credits += 1
-        current_user.last_recipe_saved_credit = now
-        db.commit()  # Uppdatera användarens credit och tid
-        db.refresh(current_user)
+    # Daglig bonus för att spara recept, skriver bara om den inte redan getts idag
+    await grant_recipe_saved_bonus(db, current_user, datetime.now(timezone.utc))
 
     return recipe
 
 @router.get("/saved/recipe", status_code=200)
-def get_saved_recipes(
+async def get_saved_recipes(
+    cursor: str = Query(None, description="Keyset cursor from next_cursor, empty for the first page"),
+    page_size: int = Query(20, ge=1, le=100, description="Number of recipes per page"),
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
 
     stmt = (
@@ -123,7 +136,26 @@ def get_saved_recipes(
         .where(SavedRecipes.user_id == current_user.id)
     )
 
-    saved_recipes = db.scalars(stmt).all()
+    if cursor is not None:
+        # Senast sparade först, keyset på (saved_at, recipe_id)
+        stmt = stmt.add_columns(SavedRecipes.saved_at).order_by(
+            SavedRecipes.saved_at.desc(), SavedRecipes.recipe_id.desc()
+        )
+        after = decode_cursor(cursor, SAVED_RECIPES)
+        if after is not None:
+            stmt = stmt.where(keyset_condition(SavedRecipes.saved_at, SavedRecipes.recipe_id, after))
+
+        rows = (await db.execute(stmt.limit(page_size + 1))).all()
+        if not rows and not cursor:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="couldnt find saved recipe"
+            )
+        page = cursor_page(rows, page_size, key=lambda row: (row.saved_at, row.Recipes.id), kind=SAVED_RECIPES)
+        page["items"] = [row.Recipes for row in page["items"]]
+        return page
+
+    saved_recipes = (await db.scalars(stmt)).all()
     
 
     if not saved_recipes:
@@ -134,22 +166,22 @@ def get_saved_recipes(
     return saved_recipes
 
 @router.delete("/recipe/saved", status_code=200)
-def delete_saved_recipe(recipe_id: SavedRecipeSchema, current_user: Users = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_saved_recipe(recipe_id: SavedRecipeSchema, current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     stmt = (
         delete(SavedRecipes)
         .where(SavedRecipes.recipe_id == recipe_id.recipe_id)
         .where(SavedRecipes.user_id == current_user.id)
     )
-    db.execute(stmt)
-    db.commit()
+    await db.execute(stmt)
+    await db.commit()
     return {"message": "Recipe deleted successfully"}
 
 
 @router.post("/recipe/saved/check", status_code=200)
-def check_recipe_saved(
+async def check_recipe_saved(
     recipe: SavedRecipeSchema, 
     current_user: Users = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Create a query to check if the recipe is saved by this user
     stmt = (
@@ -160,7 +192,7 @@ def check_recipe_saved(
     )
     
     # Execute the query
-    result = db.execute(stmt).scalar()
+    result = (await db.execute(stmt)).scalar()
     
     # Return a dictionary with the result
     return {"isSaved": result}
\ No newline at end of file
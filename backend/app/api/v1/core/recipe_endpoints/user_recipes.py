@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status, File, UploadFile, Form
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, status, File, UploadFile, Form, Query
 from starlette.responses import StreamingResponse
 from sqlalchemy import delete, insert, select, update, and_, or_, exists
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload, selectinload
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, Annotated
 from random import randint
 from app.security import get_current_user
+from app.credits import grant_recipe_saved_bonus
 from datetime import datetime, timezone
 from app.s3_utils import upload_image_to_s3
 from app.settings import settings
@@ -43,7 +46,8 @@ from app.api.v1.core.schemas import (
     UploadImageSchema
 )
 
-from app.db_setup import get_db
+from app.api.v1.core.pagination import SAVED_USER_RECIPES, cursor_page, decode_cursor, keyset_condition
+from app.db_setup import get_async_db
 
 router = APIRouter()
 
@@ -56,9 +60,9 @@ s3_client = boto3.client(
 
 
 @router.post("/user/recipe", response_model=UserRecipeSchema, status_code=200)
-def create_user_recipe(user_recipe: UserRecipeSchema, db: Session = Depends(get_db), current_user: Users = Depends(get_current_user)):
+async def create_user_recipe(user_recipe: UserRecipeSchema, db: AsyncSession = Depends(get_async_db), current_user: Users = Depends(get_current_user)):
     
-    result = create_user_recipe_db(user_recipe, db, current_user)
+    result = await create_user_recipe_db(user_recipe, db, current_user)
 
     if not result:
         raise HTTPException(
@@ -68,9 +72,9 @@ def create_user_recipe(user_recipe: UserRecipeSchema, db: Session = Depends(get_
     return result
 
 @router.post("/user-recipe/saved", status_code=204)
-def save_recipe(user_recipe: SavedUserRecipeSchema, db: Session = Depends(get_db), current_user: Users = Depends(get_current_user)):
+async def save_recipe(user_recipe: SavedUserRecipeSchema, db: AsyncSession = Depends(get_async_db), current_user: Users = Depends(get_current_user)):
     
-    user_recipe = save_user_recipe_db(user_recipe, db, current_user)
+    user_recipe = await save_user_recipe_db(user_recipe, db, current_user)
     
     if not user_recipe:
         raise HTTPException(
@@ -78,20 +82,18 @@ def save_recipe(user_recipe: SavedUserRecipeSchema, db: Session = Depends(get_db
             detail="couldnt save recipe"
         )
     
-    now = datetime.now(timezone.utc)
-    if not current_user.last_recipe_saved_credit or current_user.last_recipe_saved_credit.date() != now.date():
-        current_user.credits += 1
-        current_user.last_recipe_saved_credit = now
-        db.commit()  # Uppdatera användarens credit och tid
-        db.refresh(current_user)
+    # Daglig bonus för att spara recept, skriver bara om den inte redan getts idag
+    await grant_recipe_saved_bonus(db, current_user, datetime.now(timezone.utc))
 
 
     return user_recipe
 
 @router.get("/saved/user-recipe", status_code=200)
-def get_saved_user_recipes(
+async def get_saved_user_recipes(
+    cursor: str = Query(None, description="Keyset cursor from next_cursor, empty for the first page"),
+    page_size: int = Query(20, ge=1, le=100, description="Number of recipes per page"),
     current_user: Users = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
 
     stmt = (
@@ -100,7 +102,26 @@ def get_saved_user_recipes(
         .where(SavedUserRecipes.user_id == current_user.id)
     )
 
-    saved_user_recipes = db.scalars(stmt).all()
+    if cursor is not None:
+        # Senast sparade först, keyset på (saved_at, user_recipe_id)
+        stmt = stmt.add_columns(SavedUserRecipes.saved_at).order_by(
+            SavedUserRecipes.saved_at.desc(), SavedUserRecipes.user_recipe_id.desc()
+        )
+        after = decode_cursor(cursor, SAVED_USER_RECIPES)
+        if after is not None:
+            stmt = stmt.where(keyset_condition(SavedUserRecipes.saved_at, SavedUserRecipes.user_recipe_id, after))
+
+        rows = (await db.execute(stmt.limit(page_size + 1))).all()
+        if not rows and not cursor:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="couldnt find saved recipe"
+            )
+        page = cursor_page(rows, page_size, key=lambda row: (row.saved_at, row.UserRecipes.id), kind=SAVED_USER_RECIPES)
+        page["items"] = [row.UserRecipes for row in page["items"]]
+        return page
+
+    saved_user_recipes = (await db.scalars(stmt)).all()
     
 
     if not saved_user_recipes:
@@ -111,22 +132,22 @@ def get_saved_user_recipes(
     return saved_user_recipes
 
 @router.delete("/user-recipe/saved", status_code=200)
-def delete_saved_recipe(recipe_id: SavedUserRecipeSchema, current_user: Users = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_saved_recipe(recipe_id: SavedUserRecipeSchema, current_user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     stmt = (
         delete(SavedUserRecipes)
         .where(SavedUserRecipes.user_recipe_id == recipe_id.user_recipe_id)
         .where(SavedUserRecipes.user_id == current_user.id)
     )
-    db.execute(stmt)
-    db.commit()
+    await db.execute(stmt)
+    await db.commit()
     return {"message": "Recipe deleted successfully"}
 
 
 @router.post("/user-recipe/saved/check", status_code=200)
-def check_recipe_saved(
+async def check_recipe_saved(
     recipe: SavedUserRecipeSchema, 
     current_user: Users = Depends(get_current_user), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Create a query to check if the recipe is saved by this user
     stmt = (
@@ -137,15 +158,15 @@ def check_recipe_saved(
     )
     
     # Execute the query
-    result = db.execute(stmt).scalar()
+    result = (await db.execute(stmt)).scalar()
     
     # Return a dictionary with the result
     return {"isSaved": result}
 
 @router.post("/ai/recipe", response_model=AiRecipeOutSchema, status_code=200)
-def create_ai_recipe(ai_recipe: AiRecipeSchema, db: Session = Depends(get_db), current_user: Users = Depends(get_current_user)):
+async def create_ai_recipe(ai_recipe: AiRecipeSchema, db: AsyncSession = Depends(get_async_db), current_user: Users = Depends(get_current_user)):
     
-    result = create_ai_recipe_db(ai_recipe, db, current_user)
+    result = await create_ai_recipe_db(ai_recipe, db, current_user)
 
     if not result:
         raise HTTPException(
@@ -158,7 +179,7 @@ def create_ai_recipe(ai_recipe: AiRecipeSchema, db: Session = Depends(get_db), c
 async def upload_image(
     user_recipe_id: int = Form(...), 
     file: UploadFile = File(...), 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     current_user: Users = Depends(get_current_user)
 ):
     """Upload an image and store its information in the database using SQLAlchemy 2.0"""
@@ -166,8 +187,8 @@ async def upload_image(
     if file.content_type not in ["image/jpeg", "image/png", "image/gif"]:
         raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG, PNG, and GIF are supported.")
 
-    # Upload to S3
-    s3_url = upload_image_to_s3(file)
+    # Upload to S3 (boto3 blockerar, så i en tråd)
+    s3_url = await run_in_threadpool(upload_image_to_s3, file)
     
     # Create a new image record in the database using SQLAlchemy 2.0 pattern
     new_image = Images(
@@ -178,8 +199,8 @@ async def upload_image(
     
     # Add, commit and refresh using SQLAlchemy 2.0 pattern
     db.add(new_image)
-    db.commit()
-    db.refresh(new_image)
+    await db.commit()
+    await db.refresh(new_image)
 
     # Return the image ID for the client to use with the new endpoint
     return {
@@ -190,14 +211,14 @@ async def upload_image(
 @router.get("/images/{user_recipe_id}")
 async def get_image(
     user_recipe_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
     """
     Endpoint to serve private S3 images through your API with authentication.
     """
     stmt = select(Images).where(Images.user_recipes_id == user_recipe_id)
-    result = db.execute(stmt)
+    result = await db.execute(stmt)
     image = result.scalar_one_or_none()
     
     if not image:
@@ -208,7 +229,7 @@ async def get_image(
         # Check if the user has permission to view this recipe's images
         # This is just an example - implement your own permission logic
         stmt = select(UserRecipes).where(UserRecipes.id == image.user_recipes_id)
-        result = db.execute(stmt)
+        result = await db.execute(stmt)
         user_recipe = result.scalar_one_or_none()
         
         if not user_recipe or user_recipe.user_id != current_user.id:
@@ -223,7 +244,7 @@ async def get_image(
     
     try:
         # Get the image file from S3
-        response = s3_client.get_object(Bucket=settings.AWS_BUCKET_NAME, Key=s3_key)
+        response = await run_in_threadpool(s3_client.get_object, Bucket=settings.AWS_BUCKET_NAME, Key=s3_key)
         
         # Determine content type based on the file extension
         content_type = "image/jpeg"  # Default
@@ -244,9 +265,9 @@ async def get_image(
         raise HTTPException(status_code=500, detail=f"Error retrieving image: {str(e)}")
 
 @router.get("/user/recipe/{user_id}", status_code=200)
-def get_user_recipes(user_id: int, db: Session = Depends(get_db)):
+async def get_user_recipes(user_id: int, db: AsyncSession = Depends(get_async_db)):
 
-    result = get_user_recipes_db(user_id, db)
+    result = await get_user_recipes_db(user_id, db)
 
     if not result:
         raise HTTPException(
@@ -256,9 +277,9 @@ def get_user_recipes(user_id: int, db: Session = Depends(get_db)):
     return result
 
 @router.delete("/user/recipe/delete/{user_recipe_id}", status_code=200)
-def delete_user_recipe(user_recipe_id: int, db: Session = Depends(get_db)):
+async def delete_user_recipe(user_recipe_id: int, db: AsyncSession = Depends(get_async_db)):
     
-    result = delete_user_recipe_db(user_recipe_id, db)
+    result = await delete_user_recipe_db(user_recipe_id, db)
 
     if not result:
         raise HTTPException(
@@ -268,12 +289,12 @@ def delete_user_recipe(user_recipe_id: int, db: Session = Depends(get_db)):
     return result
 
 @router.patch("/user/recipe/update/{user_recipe_id}", response_model=UserUpdateRecipeSchema)
-def update_user_recipe(
+async def update_user_recipe(
     user_recipe_id: int,
     user_update_recipe: UserUpdateRecipeSchema,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    db_user_recipe = update_user_recipe_db(user_update_recipe, user_recipe_id, db)
+    db_user_recipe = await update_user_recipe_db(user_update_recipe, user_recipe_id, db)
 
     return db_user_recipe
 
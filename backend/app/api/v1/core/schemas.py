@@ -26,6 +26,7 @@ class UploadImageSchema(BaseModel):
 
 class RandomRecipeSchema(BaseModel):
     recipe_type: str | None = None
+    seed: int | None = None  # Samma seed ger samma urval (så länge receptkatalogen är oförändrad)
 
 
 class UserSearchSchema(BaseModel):
@@ -199,3 +200,59 @@ class SavedItemsSchema(BaseModel):
 class UpdateItemSchema(BaseModel):
     item: str | None = None
     size: str | None = None
+
+
+# Strukturerade Gemini-svar: används som response_schema i JSON-läge och valideras en gång,
+# beskrivningarna går med till modellen i stället för exempel-JSON i prompten
+
+class ShoppingListItem(BaseModel):
+    name: str = Field(..., description="Ingrediensnamn")
+    amount: str = Field(..., description="Justerad mängd")
+    unit: str = Field(..., description="Enhet, tom om mängden är i styck")
+
+class ShoppingListResponse(BaseModel):
+    recipes: List[ShoppingListItem]
+
+class IngredientAmount(BaseModel):
+    name: str
+    amount: str
+    unit: str
+
+class GeneratedRecipe(BaseModel):
+    title: str
+    description: str = Field(..., description="En kort beskrivning av rätten")
+    category: str = Field(..., description="Fågel, Kött, Fisk, Vegetarisk, Frukost eller Bakning")
+    ingredients: List[IngredientAmount]
+    instructions: List[str] = Field(..., description="Ett steg per rad")
+    cook_time: str = Field(..., description="Total tillagningstid, t.ex. 30 min")
+    servings: str = Field(..., description="Antal portioner, t.ex. 4 portioner")
+    energy: str = Field(..., description="kcal per portion")
+    protein: str = Field(..., description="Gram protein per portion")
+    carbohydrates: str = Field(..., description="Gram kolhydrater per portion")
+    fat: str = Field(..., description="Gram fett per portion")
+
+class GeneratedRecipesResponse(BaseModel):
+    recipes: List[GeneratedRecipe]
+
+class ImageRecipe(BaseModel):
+    name: str
+    descriptions: str = Field(..., description="En kort beskrivning av rätten")
+    category: str = Field(..., description="Fågel, Kött, Fisk, Vegetarisk, Frukost eller Bakning")
+    ingredients: List[str] = Field(..., description="Ingrediensnamn mängd enhet")
+    instructions: List[str]
+    cook_time: str = Field(..., description="Total tillagningstid, t.ex. 30 min")
+    servings: str = Field(..., description="Antal portioner, t.ex. 4 portioner")
+    calories: float = Field(..., description="kcal per portion")
+    protein: float = Field(..., description="Gram protein per portion")
+    carbohydrates: float = Field(..., description="Gram kolhydrater per portion")
+    fat: float = Field(..., description="Gram fett per portion")
+
+class ImageRecipesResponse(BaseModel):
+    recipes: List[ImageRecipe]
+
+class BoughtItem(BaseModel):
+    name: str = Field(..., description="Namn på matvaran")
+    size: str = Field(..., description="Storlek eller mängd, t.ex. 500g, 1L, 6-pack")
+
+class BoughtItemsResponse(BaseModel):
+    items: List[BoughtItem]
@@ -6,7 +6,7 @@ from app.api.v1.core.schemas import (
     UserOutSchema,
     UserRegisterSchema,
 )
-from app.db_setup import get_db
+from app.db_setup import get_async_db
 from app.security import (
     create_database_token,
     get_current_token,
@@ -18,32 +18,33 @@ from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import ValidationError
 from sqlalchemy import delete, select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.token_cache import token_cache
 
 router = APIRouter(tags=["auth"], prefix="/auth")
 
 @router.post("/token")
-def login(
+async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ) -> TokenSchema:
     # Keep in mind that without the response model or return schema
     # we would expose the hashed password, which absolutely cannot happen
     # Perhaps better to use .only or select the columns explicitly
     user = (
-        db.execute(
+        await db.execute(
             select(Users).where(Users.email == form_data.username),
         )
-        .scalars()
-        .first()
-    )
+    ).scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User does not exist",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    if not verify_password(form_data.password, user.hashed_password):
+    # bcrypt är medvetet långsamt, kör det utanför event-loopen
+    if not await run_in_threadpool(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Passwords do not match",
@@ -56,15 +57,16 @@ def login(
             detail="Account not activated. Please check your email and activate your account.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_database_token(user_id=user.id, db=db)
+    access_token = await create_database_token(user_id=user.id, db=db)
     return {"access_token": access_token.token, "token_type": "bearer"}
 
 
 @router.delete("/logout", status_code=status.HTTP_204_NO_CONTENT)
-def logout(
+async def logout(
     current_token: Token = Depends(get_current_token),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    db.execute(delete(Token).where(Token.token == current_token.token))
-    db.commit()
+    await db.execute(delete(Token).where(Token.token == current_token.token))
+    await db.commit()
+    token_cache.invalidate_token(current_token.token)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -18,6 +18,7 @@ from app.email import (
 )
 from app.db_setup import get_db
 from app.security import hash_password
+from app.token_cache import token_cache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -48,6 +49,7 @@ def confirm_password_reset(
     user.hashed_password = hash_password(reset_confirm.new_password)
     invalidate_password_reset_token(reset_confirm.token, db)
     db.commit()
+    token_cache.invalidate_user(user.id)
     return {"message": "Vi har nu bytt ditt lösenord"}
 
 @router.post("/activate/confirm", status_code=status.HTTP_200_OK)
@@ -6,6 +6,7 @@ from typing import Optional
 from random import randint
 import bcrypt
 from app.security import hash_password
+from app.token_cache import token_cache
 
 from app.api.v1.core.models import (
     Users,
@@ -52,5 +53,6 @@ def delete_user_db(user_id: int, db):
     # Utför delete-operationen
     db.execute(delete(Users).where(Users.id == user_id))
     db.commit()
+    token_cache.invalidate_user(user_id)
     return True
 
@@ -29,6 +29,7 @@ from app.security import (
     get_current_admin
 )
 from app.db_setup import get_db
+from app.token_cache import token_cache
 
 router = APIRouter()
 
@@ -150,6 +151,7 @@ def change_password(
             )
         db_user.hashed_password = hash_password(password_data.new_password)
         db.commit()
+        token_cache.invalidate_user(current_user.id)
         return {
             "message": "Password updated successfully",
             "timestamp": datetime.now(timezone.utc).isoformat(),
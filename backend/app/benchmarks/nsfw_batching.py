@@ -0,0 +1,93 @@
+"""
+Jämför NSFW-inferens en bild i taget mot mikrobatchning via nsfw_batcher.
+
+    python -m app.benchmarks.nsfw_batching --images 64 --concurrency 16
+
+Bilderna är slumpbrus i uppladdningsstorlek, så siffrorna mäter modellen
+och batchningen, inte JPEG-avkodning. Körs på CPU om ingen GPU finns.
+--offline bygger samma arkitektur (ViT-base, två klasser) med slumpvikter
+när modellen inte kan hämtas, genomströmningen beror inte på vikterna.
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.api.v1.core.ai_endpoints.model_registry import NSFW_MODEL, model_registry
+from app.api.v1.core.ai_endpoints.nsfw_inference import InferenceBatcher, predict_nsfw
+
+
+def make_images(count: int, size: int) -> list[Image.Image]:
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def _load_offline_pipeline():
+    from transformers import TFViTForImageClassification, ViTConfig, ViTImageProcessor, pipeline
+
+    config = ViTConfig(num_labels=2, id2label={0: "normal", 1: "nsfw"}, label2id={"normal": 0, "nsfw": 1})
+    return pipeline(
+        "image-classification",
+        model=TFViTForImageClassification(config),
+        image_processor=ViTImageProcessor(),
+        framework="tf",
+    )
+
+
+def run_sequential(images: list) -> float:
+    model = model_registry.get(NSFW_MODEL)
+    start = time.perf_counter()
+    for image in images:
+        model(image)
+    return time.perf_counter() - start
+
+
+async def run_batched(images: list, concurrency: int, max_batch_size: int, max_wait_ms: float) -> float:
+    batcher = InferenceBatcher(predict_nsfw, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def classify(image):
+        async with semaphore:
+            await batcher.classify(image)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(classify(image) for image in images))
+    elapsed = time.perf_counter() - start
+    await batcher.stop()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--size", type=int, default=512, help="Bildens sida i pixlar")
+    parser.add_argument("--concurrency", type=int, default=16, help="Samtidiga anrop mot batchern")
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--offline", action="store_true", help="Slumpvikter i stället för att hämta modellen")
+    args = parser.parse_args()
+
+    if args.offline:
+        model_registry.register(NSFW_MODEL, _load_offline_pipeline)
+
+    images = make_images(args.images, args.size)
+
+    # Ladda modellen och värm upp så att laddtiden inte hamnar i mätningen
+    model_registry.get(NSFW_MODEL)(images[0])
+    print(f"model load: {model_registry.stats()[NSFW_MODEL]}")
+
+    elapsed = run_sequential(images)
+    print(f"per-image           {args.images / elapsed:8.1f} img/s  ({elapsed:.2f}s)")
+
+    for batch_size in (int(value) for value in args.batch_sizes.split(",")):
+        elapsed = asyncio.run(run_batched(images, args.concurrency, batch_size, args.max_wait_ms))
+        print(f"batched max={batch_size:<3}     {args.images / elapsed:8.1f} img/s  ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
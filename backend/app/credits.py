@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, time, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import insert, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.api.v1.core.models import CreditTransactions, Users
+from app.db_setup import engine
+from app.settings import settings
+from app.token_cache import token_cache
+
+LOGIN_BONUS_CREDITS = 1
+RECIPE_SAVED_BONUS_CREDITS = 1
+DAILY_REFILL_CREDITS = 10
+
+logger = logging.getLogger(__name__)
+
+
+class CreditLedger:
+    """
+    Buffrar rader till credit_transactions och skriver dem i batchar från en
+    egen tråd, så att själva credit-ändringen bara kostar ett UPDATE i anropet.
+    Bufferten rymmer högst max_pending rader, är databasen nere länge släpps
+    de äldsta och loggas i stället.
+    """
+
+    def __init__(self, batch_size: int, flush_seconds: float, max_pending: int):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._pending: list[dict] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def record(self, user_id: int, amount: int, reason: str):
+        with self._lock:
+            self._pending.append({
+                "user_id": user_id,
+                "amount": amount,
+                "reason": reason,
+                "created_at": datetime.now(UTC),
+            })
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+            dropped = self._drop_overflow()
+        self._log_dropped(dropped)
+
+    def flush(self) -> int:
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        try:
+            with Session(engine) as db:
+                db.execute(insert(CreditTransactions), rows)
+                db.commit()
+        except Exception:
+            # Lägg tillbaka raderna så att de skrivs vid nästa försök, inom max_pending
+            logger.exception("Could not write %d credit transactions", len(rows))
+            with self._lock:
+                self._pending[:0] = rows
+                dropped = self._drop_overflow()
+            self._log_dropped(dropped)
+            return 0
+        return len(rows)
+
+    def _drop_overflow(self) -> list[dict]:
+        """Anropas med låset taget, tar bort de äldsta raderna över max_pending"""
+        overflow = len(self._pending) - self.max_pending
+        if overflow <= 0:
+            return []
+        dropped, self._pending = self._pending[:overflow], self._pending[overflow:]
+        self.dropped += len(dropped)
+        return dropped
+
+    def _log_dropped(self, rows: list[dict]):
+        # Raderna finns bara kvar i loggen, så att saldot går att stämma av i efterhand
+        for row in rows:
+            logger.error(
+                "Credit ledger full, dropped transaction user_id=%s amount=%s reason=%s created_at=%s",
+                row["user_id"], row["amount"], row["reason"], row["created_at"].isoformat(),
+            )
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="credit-ledger", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+
+credit_ledger = CreditLedger(
+    batch_size=settings.CREDIT_LEDGER_BATCH_SIZE,
+    flush_seconds=settings.CREDIT_LEDGER_FLUSH_SECONDS,
+    max_pending=settings.CREDIT_LEDGER_MAX_PENDING,
+)
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
+
+
+def start_of_day(now: datetime) -> datetime:
+    return datetime.combine(now.astimezone(UTC).date(), time.min, tzinfo=UTC)
+
+
+async def _grant_daily_bonus(db: AsyncSession, user: Users, column: str, amount: int, now: datetime) -> bool:
+    """
+    Ger en bonus max en gång per dygn. Om användaren redan fått den idag
+    görs ingen skrivning alls, annars ett villkorat UPDATE ... RETURNING så att
+    parallella anrop inte kan ge bonusen två gånger.
+    """
+    today = start_of_day(now)
+    last_granted = _as_utc(getattr(user, column))
+    if last_granted is not None and last_granted >= today:
+        return False
+
+    timestamp_column = getattr(Users, column)
+    stmt = (
+        update(Users)
+        .where(Users.id == user.id)
+        .where(or_(timestamp_column.is_(None), timestamp_column < today))
+        .values({Users.credits: Users.credits + amount, timestamp_column: now})
+        .returning(Users.credits, timestamp_column)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(stmt)).first()
+    await db.commit()
+
+    if row is None:
+        return False
+
+    # Uppdatera objektet utan att markera det som ändrat (ingen extra flush)
+    set_committed_value(user, "credits", row[0])
+    set_committed_value(user, column, row[1])
+    token_cache.invalidate_user(user.id)
+    credit_ledger.record(user.id, amount, column)
+    return True
+
+
+async def grant_login_bonus(db: AsyncSession, user: Users, now: datetime) -> bool:
+    return await _grant_daily_bonus(db, user, "last_login_credit", LOGIN_BONUS_CREDITS, now)
+
+
+async def grant_recipe_saved_bonus(db: AsyncSession, user: Users, now: datetime) -> bool:
+    return await _grant_daily_bonus(db, user, "last_recipe_saved_credit", RECIPE_SAVED_BONUS_CREDITS, now)
+
+
+async def reserve_credits(db: AsyncSession, user: Users, amount: int, reason: str):
+    """
+    Drar credits atomiskt: UPDATE ... WHERE credits >= n RETURNING credits.
+    Parallella anrop kan därför inte ta användaren under noll.
+    """
+    stmt = (
+        update(Users)
+        .where(Users.id == user.id, Users.credits >= amount)
+        .values(credits=Users.credits - amount)
+        .returning(Users.credits)
+        .execution_options(synchronize_session=False)
+    )
+    new_credits = (await db.execute(stmt)).scalar()
+    await db.commit()
+
+    if new_credits is None:
+        raise HTTPException(
+            status_code=402,
+            detail="Du har inte tillräckligt med credits för att utföra denna förfrågan."
+        )
+
+    set_committed_value(user, "credits", new_credits)
+    token_cache.invalidate_user(user.id)
+    credit_ledger.record(user.id, -amount, reason)
+
+
+async def refund_user_credits(db: AsyncSession, user_id: int, amount: int, reason: str) -> int | None:
+    """Betalar tillbaka credits till user_id, returnerar nya saldot (None om användaren saknas)"""
+    stmt = (
+        update(Users)
+        .where(Users.id == user_id)
+        .values(credits=Users.credits + amount)
+        .returning(Users.credits)
+        .execution_options(synchronize_session=False)
+    )
+    new_credits = (await db.execute(stmt)).scalar()
+    await db.commit()
+
+    token_cache.invalidate_user(user_id)
+    credit_ledger.record(user_id, amount, f"{reason}:refund")
+    return new_credits
+
+
+async def refund_credits(db: AsyncSession, user: Users, amount: int, reason: str):
+    # Sessionen kan vara i ett felläge om det var databasen som fallerade
+    await db.rollback()
+    new_credits = await refund_user_credits(db, user.id, amount, reason)
+    if new_credits is not None:
+        set_committed_value(user, "credits", new_credits)
+
+
+class NonRefundableError(HTTPException):
+    """HTTP-fel där reserverade credits behålls, t.ex. när en bild stoppas av NSFW-kontrollen"""
+
+
+@asynccontextmanager
+async def credit_reservation(db: AsyncSession, user: Users, amount: int, reason: str):
+    """
+    Reserverar credits för ett AI-anrop och betalar tillbaka dem om anropet misslyckas.
+    NonRefundableError behåller credits som tidigare. Avbryts anropet (CancelledError,
+    klienten gick eller servern stängs) betalas inget tillbaka, Gemini kan redan ha
+    debiterat oss för anropet.
+    """
+    await reserve_credits(db, user, amount, reason)
+    try:
+        yield
+    except NonRefundableError:
+        raise
+    except Exception:
+        await refund_credits(db, user, amount, reason)
+        raise
+
+
+def refill_empty_credits(db: Session, now: datetime | None = None) -> int:
+    """
+    Daglig batch: användare med 0 credits som inte fått påfyllning idag får 10 nya.
+    Villkoret gör jobbet idempotent, det kan köras av flera workers samtidigt.
+    """
+    now = now or datetime.now(UTC)
+    stmt = (
+        update(Users)
+        .where(
+            Users.credits == 0,
+            Users.last_credit_refill.is_not(None),
+            Users.last_credit_refill < start_of_day(now),
+        )
+        .values(credits=Users.credits + DAILY_REFILL_CREDITS, last_credit_refill=now)
+        .returning(Users.id)
+        .execution_options(synchronize_session=False)
+    )
+    refilled_ids = db.scalars(stmt).all()
+    db.commit()
+
+    for user_id in refilled_ids:
+        credit_ledger.record(user_id, DAILY_REFILL_CREDITS, "daily_refill")
+    if refilled_ids:
+        token_cache.clear()
+    return len(refilled_ids)
+
+
+def _refill_once() -> int:
+    with Session(engine) as db:
+        return refill_empty_credits(db)
+
+
+async def run_daily_credit_refill():
+    """Körs från lifespan: en gång vid start (ifall ett dygn missats) och sedan varje midnatt UTC"""
+    while True:
+        try:
+            refilled = await asyncio.to_thread(_refill_once)
+            logger.info("Daily credit refill: %d users refilled", refilled)
+        except Exception:
+            logger.exception("Daily credit refill failed")
+
+        now = datetime.now(UTC)
+        next_run = start_of_day(now) + timedelta(days=1, seconds=5)
+        await asyncio.sleep((next_run - now).total_seconds())
+
+
+if __name__ == "__main__":
+    # python -m app.credits, för körning från cron
+    print(f"Refilled credits for {_refill_once()} users")
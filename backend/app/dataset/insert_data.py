@@ -3,6 +3,8 @@ import psycopg2
 from psycopg2 import sql
 import os
 
+from app.api.v1.core.recipe_endpoints.recipe_classification import classify_ingredients
+
 # Database connection parameters
 db_params = {
     'dbname': 'foodisave',
@@ -46,9 +48,10 @@ INSERT INTO recipes (
     images,
     rating,
     ratings_count,
-    recipe_url
+    recipe_url,
+    recipe_type_flags
     )
-VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
 """
 
 for index, row in df.iterrows():
@@ -56,7 +59,9 @@ for index, row in df.iterrows():
                 row['Ingredients'],
                 row['Time to cook'],
                 row['Energy'], row['Protein'], row['Carbohydrates'], row['Fat'],
-                row['Image'], row['Rating'], row['Ratings count'], row['Recipe URL']
+                row['Image'], row['Rating'], row['Ratings count'], row['Recipe URL'],
+                # Klassa receptet (fågel/fisk/kött/vegetariskt) redan vid import
+                classify_ingredients(row['Ingredients'] if isinstance(row['Ingredients'], str) else None)
                 ))
 
 cur.execute("DELETE FROM recipes WHERE LOWER(name::text) = 'nan';")
@@ -0,0 +1,115 @@
+import random
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+
+from app.logger import get_structured_logger
+
+query_logger = get_structured_logger("app.sql")
+
+
+class PoolMetrics:
+    """Räknare från pool-events för en motor, läses av /admin/db-pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def _increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def attach(self, engine: Engine):
+        event.listen(engine, "connect", lambda *args: self._increment("connects"))
+        event.listen(engine, "checkout", lambda *args: self._increment("checkouts"))
+        event.listen(engine, "checkin", lambda *args: self._increment("checkins"))
+        event.listen(engine, "invalidate", lambda *args: self._increment("invalidations"))
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            counters = {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_seconds_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_seconds_max * 1000, 3),
+            }
+        # Köbaserade pooler har storlek/overflow, t.ex. StaticPool saknar dem
+        state = {"pool": type(pool).__name__}
+        for key, method in (("size", "size"), ("checked_out", "checkedout"),
+                            ("checked_in", "checkedin"), ("overflow", "overflow")):
+            if hasattr(pool, method):
+                state[key] = getattr(pool, method)()
+        return {"engine": self.name, **state, **counters}
+
+
+def metered_pool_class(base, metrics: PoolMetrics):
+    """
+    Poolklass som mäter hur länge anropen väntar på en ledig anslutning.
+    Det finns inget pool-event för väntan, så vi mäter runt _do_get.
+    """
+
+    class MeteredPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - start)
+            return connection
+
+    MeteredPool.__name__ = f"Metered{base.__name__}"
+    return MeteredPool
+
+
+def attach_query_logging(engine: Engine, name: str, sample_rate: float, slow_query_ms: int):
+    """
+    Ersätter echo=True: en andel av frågorna loggas som JSON, långsamma
+    frågor loggas alltid. Parametrar loggas aldrig.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start_time"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def log_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_start_time", None)
+        if started is None:
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        slow = slow_query_ms > 0 and duration_ms >= slow_query_ms
+        if not slow and random.random() >= sample_rate:
+            return
+        query_logger.info(
+            "slow query" if slow else "query",
+            extra={"fields": {
+                "engine": name,
+                "duration_ms": round(duration_ms, 3),
+                "rowcount": cursor.rowcount,
+                "executemany": executemany,
+                "statement": " ".join(statement.split())[:1000],
+            }},
+        )
@@ -1,5 +1,12 @@
-from sqlalchemy import create_engine
+import time
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 
 from app.api.v1.core.models import (Base,
                                     Users, 
@@ -10,16 +17,127 @@ from app.api.v1.core.models import (Base,
                                     Messages, 
                                     Comments,
                                     Images)
+from app.db_metrics import PoolMetrics, attach_query_logging, metered_pool_class
 from app.settings import settings
 
-# echo = True to see the SQL queries
-engine = create_engine(f"{settings.DB_URL}", echo=True)
+
+def async_db_url(url: str):
+    """Samma databas som DB_URL men med en asynkron driver"""
+    db_url = make_url(url)
+    if db_url.get_backend_name() == "postgresql":
+        return db_url.set(drivername="postgresql+asyncpg")
+    if db_url.get_backend_name() == "sqlite":
+        return db_url.set(drivername="sqlite+aiosqlite")
+    return db_url
+
+
+def engine_options(url, pool_class, metrics: PoolMetrics) -> dict:
+    """Pool- och timeout-inställningar från Settings, se DB_* i settings.py"""
+    db_url = make_url(url)
+    if db_url.get_backend_name() != "postgresql":
+        # SQLite (lokalt/skript) kör med standardpoolen
+        return {}
+
+    options = {
+        "poolclass": metered_pool_class(pool_class, metrics),
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+    if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+        timeout = str(settings.DB_STATEMENT_TIMEOUT_MS)
+        if db_url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": timeout}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={timeout}"}
+    return options
+
+
+# Räknare per motor, exponeras via /admin/db-pool
+pool_metrics: dict[str, PoolMetrics] = {}
+
+
+def create_metered_engine(url, name: str, create, pool_class):
+    metrics = PoolMetrics(name)
+    new_engine = create(url, **engine_options(url, pool_class, metrics))
+    # Eventen sitter på den synkrona motorn även för AsyncEngine
+    sync_engine = getattr(new_engine, "sync_engine", new_engine)
+    metrics.attach(sync_engine)
+    attach_query_logging(sync_engine, name, settings.DB_QUERY_LOG_SAMPLE_RATE, settings.DB_SLOW_QUERY_MS)
+    pool_metrics[name] = metrics
+    return new_engine
+
+# Den synkrona motorn används av skript, migreringar och bakgrundstrådar
+engine = create_metered_engine(settings.DB_URL, "sync", create_engine, QueuePool)
+
+# Routrarna använder den asynkrona motorn så att frågor inte blockerar event-loopen
+async_engine = create_metered_engine(async_db_url(settings.DB_URL), "async", create_async_engine, AsyncAdaptedQueuePool)
+
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+
+# Godtycklig nyckel för pg_advisory_lock, samma i alla workers
+MIGRATION_LOCK_ID = 7_301_001
+
+
+def run_migrations(db_url: str | None = None):
+    """
+    create_all och alembic upgrade under ett advisory lock: workers som startar
+    samtidigt kör dem en i taget, och de som kommer efter ser att allt redan är klart.
+    Kan också köras som ett separat deploysteg: python -m app.db_setup
+    db_url är settings.DB_URL om inget annat anges (testerna kör mot en egen databas).
+    """
+    # Index och tillägg (pg_trgm m.m.) som create_all inte kan uttrycka ligger i migrations/
+    alembic_cfg = Config(str(ALEMBIC_INI))
+    # Egen anslutning utan pool: indexbyggen får ta längre tid än DB_STATEMENT_TIMEOUT_MS,
+    # och den inställningen ska inte följa med tillbaka in i poolen
+    migration_engine = create_engine(
+        db_url or settings.DB_URL, poolclass=NullPool, connect_args={"options": "-c statement_timeout=0"}
+    )
+    try:
+        with migration_engine.connect() as connection:
+            # pg_try_advisory_lock i korta transaktioner i stället för att blockera i pg_advisory_lock:
+            # CREATE INDEX CONCURRENTLY väntar ut alla öppna transaktioner, även en som väntar på låset
+            while not connection.execute(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID}
+            ).scalar():
+                connection.commit()
+                time.sleep(1)
+            connection.commit()
+            try:
+                Base.metadata.create_all(bind=connection)
+                connection.commit()
+                # Utan öppen transaktion, så att migreringarna kan använda autocommit_block
+                alembic_cfg.attributes["connection"] = connection
+                command.upgrade(alembic_cfg, "head")
+                connection.commit()
+            finally:
+                connection.rollback()
+                connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                connection.commit()
+    finally:
+        migration_engine.dispose()
 
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    if engine.dialect.name != "postgresql":
+        Base.metadata.create_all(bind=engine)
+    elif settings.DB_MIGRATE_ON_STARTUP:
+        run_migrations()
 
 
 def get_db():
     with Session(engine, expire_on_commit=False) as session:
         yield session
+
+
+async def get_async_db():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+if __name__ == "__main__":
+    run_migrations()
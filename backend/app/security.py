@@ -5,14 +5,17 @@ from typing import Annotated
 from uuid import UUID, uuid4
 
 from app.api.v1.core.models import Token, Users
-from app.db_setup import get_db
+from app.db_setup import get_async_db
 from app.settings import settings
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from pydantic import ValidationError
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from app.credits import grant_login_bonus
+from app.token_cache import attach_user, token_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/v1/auth/token")
 
@@ -59,28 +62,30 @@ def token_urlsafe(nbytes=None):
     return base64.urlsafe_b64encode(tok).rstrip(b"=").decode("ascii")
 
 
-def create_database_token(user_id: UUID, db: Session):
+async def create_database_token(user_id: UUID, db: AsyncSession):
     randomized_token = token_urlsafe()
     new_token = Token(token=randomized_token, user_id=user_id)
     db.add(new_token)
-    db.commit()
+    await db.commit()
     return new_token
 
 
 ### Getting users
 
 
-def verify_token_access(token_str: str, db: Session) -> Token:
+async def verify_token_access(token_str: str, db: AsyncSession) -> Token:
     """
     Return a token
     """
     max_age = timedelta(minutes=int(settings.ACCESS_TOKEN_EXPIRE_MINUTES))
     token = (
-        db.execute(
-            select(Token).where(
+        (await db.execute(
+            select(Token)
+            .options(joinedload(Token.user))  # Användaren i samma fråga
+            .where(
                 Token.token == token_str, Token.created_at >= datetime.now(UTC) - max_age
             ),
-        )
+        ))
         .scalars()
         .first()
     )
@@ -93,26 +98,24 @@ def verify_token_access(token_str: str, db: Session) -> Token:
     return token
 
 
-def get_current_user(
+async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Users:
-    token_obj = verify_token_access(token_str=token, db=db)
-    user = token_obj.user
-    now = datetime.now(timezone.utc)
-
-    # Automatisk kreditåterställning om användaren har 0 credits och inte redan fått dagens 10 credits
-    if user.credits == 0 and user.last_credit_refill is not None and now.date() > user.last_credit_refill.date():
-        user.credits += 10
-        user.last_credit_refill = now
-
-    # Ge 1 credit vid inloggning om bonusen inte redan beviljats idag
-    if not user.last_login_credit or user.last_login_credit.date() != now.date():
-        user.credits += 1
-        user.last_login_credit = now
-
-    db.commit()
-    db.refresh(user)
+    snapshot = token_cache.get(token)
+    if snapshot is not None:
+        user = await attach_user(db, snapshot)
+        token_obj = None
+    else:
+        token_obj = await verify_token_access(token_str=token, db=db)
+        user = token_obj.user
+    # Dagens inloggningsbonus. Skriver bara när bonusen faktiskt ges,
+    # påfyllningen av tomma konton sköts av det dagliga jobbet i app/credits.py
+    await grant_login_bonus(db, user, datetime.now(timezone.utc))
+
+    if token_obj is not None:
+        expires_at = token_obj.created_at + timedelta(minutes=int(settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+        token_cache.put(token, user, expires_at)
 
     if not user.is_active:
         raise HTTPException(
@@ -140,12 +143,12 @@ def get_current_admin(
         )
     return current_user
 
-def get_current_token(
-    token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)
+async def get_current_token(
+    token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_async_db)
 ):
     """
     oauth2_scheme automatically extracts the token from the authentication header
     Used when we simply want to return the token, instead of returning a user. E.g for logout
     """
-    token = verify_token_access(token_str=token, db=db)
+    token = await verify_token_access(token_str=token, db=db)
     return token
@@ -14,6 +14,100 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: str
     AWS_BUCKET_NAME: str
     AWS_REGION: str
+    # Id-cachen för /random/recipe: inkrementell resp. full uppdatering
+    RANDOM_RECIPE_ID_REFRESH_SECONDS: int = 60
+    RANDOM_RECIPE_ID_FULL_REFRESH_SECONDS: int = 900
+    # Cache för token -> användare i get_current_user
+    TOKEN_CACHE_TTL_SECONDS: int = 30
+    TOKEN_CACHE_MAXSIZE: int = 10000
+    # credit_transactions skrivs i batchar
+    CREDIT_LEDGER_BATCH_SIZE: int = 100
+    CREDIT_LEDGER_FLUSH_SECONDS: float = 5.0
+    # Max antal oskrivna rader i minnet (t.ex. när databasen är nere), äldre släpps och loggas
+    CREDIT_LEDGER_MAX_PENDING: int = 10000
+    # Connection pool, gäller per motor (sync och async) och per worker-process
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # 0 = ingen gräns
+    # Kör create_all och migreringar när en worker startar (under ett advisory lock).
+    # False när de körs som ett separat deploysteg: python -m app.db_setup
+    DB_MIGRATE_ON_STARTUP: bool = True
+    # SQL-loggning: andel frågor som loggas, långsammare än DB_SLOW_QUERY_MS loggas alltid
+    DB_QUERY_LOG_SAMPLE_RATE: float = 0.0
+    DB_SLOW_QUERY_MS: int = 500
+    # NSFW-modellen: ladda i lifespan resp. i gunicorns post_fork, alltid i workern och aldrig i mastern
+    NSFW_MODEL_NAME: str = "falconsai/nsfw_image_detection"
+    NSFW_MODEL_WARMUP: bool = False
+    NSFW_MODEL_PRELOAD: bool = False
+    # Mikrobatchning av NSFW-inferens: max bilder per anrop och max väntan på fler
+    NSFW_BATCH_MAX_SIZE: int = 8
+    NSFW_BATCH_MAX_WAIT_MS: float = 5.0
+    # Extern inferensserver (nsfw_remote.py), tom socket = modellen körs i workern.
+    # AUTHKEY krävs av både server och klient när servern används
+    NSFW_INFERENCE_SOCKET: str = ""
+    NSFW_INFERENCE_AUTHKEY: str = ""
+    NSFW_INFERENCE_TIMEOUT_SECONDS: float = 5.0
+    NSFW_INFERENCE_MAX_IN_FLIGHT: int = 16
+    NSFW_INFERENCE_SERVER_MAX_IN_FLIGHT: int = 128
+    NSFW_INFERENCE_SERVER_MAX_CONNECTIONS: int = 64
+    NSFW_INFERENCE_FALLBACK_LOCAL: bool = True
+    # Cache för NSFW-resultat per sha256. Avvisningar återanvänds även på dHash
+    # (max antal skilda bitar, 0 = bara samma hash)
+    NSFW_CACHE_MAXSIZE: int = 10000
+    NSFW_CACHE_TTL_SECONDS: int = 86400
+    NSFW_CACHE_DHASH_DISTANCE: int = 0
+    # Uppladdade bilder skalas ned till max så här många pixlar på längsta sidan
+    IMAGE_MAX_EDGE: int = 1024
+    # Gemini: en delad modell per process, max samtidiga anrop, total deadline per anrop
+    # (inklusive omförsök) och timeout per försök
+    GEMINI_MODEL: str = "gemini-2.0-flash"
+    GEMINI_MAX_CONCURRENCY: int = 8
+    GEMINI_TIMEOUT_SECONDS: float = 60.0
+    GEMINI_ATTEMPT_TIMEOUT_SECONDS: float = 25.0
+    # Omförsök vid timeout, 5xx och 429: backoff slumpas mellan 0 och base * 2^försök (max max_backoff)
+    GEMINI_MAX_RETRIES: int = 2
+    GEMINI_RETRY_BASE_SECONDS: float = 0.5
+    GEMINI_RETRY_MAX_BACKOFF_SECONDS: float = 4.0
+    # Circuit breaker: öppnar vid felandel >= FAILURE_RATE på minst MIN_CALLS anrop inom fönstret
+    GEMINI_CIRCUIT_WINDOW_SECONDS: float = 30.0
+    GEMINI_CIRCUIT_MIN_CALLS: int = 10
+    GEMINI_CIRCUIT_FAILURE_RATE: float = 0.5
+    GEMINI_CIRCUIT_OPEN_SECONDS: float = 15.0
+    # Hedgade anrop (/chat): ett andra försök startas om det första inte svarat inom så här lång tid, 0 = av
+    GEMINI_HEDGE_DELAY_SECONDS: float = 4.0
+    # Pris per miljon tokens (in resp. ut) för estimated_cost i /admin/gemini-metrics
+    GEMINI_INPUT_PRICE_PER_MILLION: float = 0.10
+    GEMINI_OUTPUT_PRICE_PER_MILLION: float = 0.40
+    # Portioner som recepten i datasetet är skrivna för, Recipes saknar en egen kolumn
+    DEFAULT_RECIPE_SERVINGS: int = 4
+    # Liknande recept (recipe_similarity.py): nya recept läggs till, full ombyggnad med jämna mellanrum
+    RECIPE_SIMILARITY_REFRESH_SECONDS: int = 60
+    RECIPE_SIMILARITY_FULL_REFRESH_SECONDS: int = 3600
+    RECIPE_SIMILARITY_NUTRITION_WEIGHT: float = 0.3  # resten är ingredienslikhet
+    # Max antal tokens (uppskattat) av sidans kontext som skickas med i /chat
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 2000
+    # Cache för AI-svar på receptendpoints: "postgres" (tabellen ai_response_cache) eller "memory"
+    AI_CACHE_BACKEND: str = "postgres"
+    AI_CACHE_TTL_SECONDS: int = 7 * 86400
+    AI_CACHE_MEMORY_MAXSIZE: int = 2000
+    AI_CACHE_MAX_ROWS: int = 100000
+    AI_CACHE_PRUNE_SECONDS: int = 3600
+    # Kö för bildjobb (ai_jobs.py): workers per process, poll-intervall, lease (förnyas medan
+    # jobbet körs) innan ett jobb från en död process tas upp igen, max tid och försök per jobb
+    AI_JOB_WORKERS: int = 4
+    AI_JOB_POLL_SECONDS: float = 2.0
+    AI_JOB_LEASE_SECONDS: float = 30.0
+    AI_JOB_TIMEOUT_SECONDS: float = 180.0
+    AI_JOB_MAX_ATTEMPTS: int = 3
+    AI_JOB_MAX_ACTIVE_PER_USER: int = 5
+    AI_JOB_EVENTS_POLL_SECONDS: float = 1.0
+    AI_JOB_EVENTS_MAX_SECONDS: float = 300.0
+    # Klara jobb (och deras resultat) sparas så här länge
+    AI_JOB_RETENTION_SECONDS: int = 7 * 86400
+    AI_JOB_PRUNE_SECONDS: int = 3600
     
     model_config = SettingsConfigDict(env_file=".env")
 
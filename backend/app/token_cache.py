@@ -0,0 +1,78 @@
+import threading
+from datetime import UTC, datetime
+
+from cachetools import TTLCache
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.api.v1.core.models import Users
+from app.settings import settings
+
+
+class TokenCache:
+    """
+    Processlokal cache token -> användare med kort TTL, så att autentiserade
+    anrop slipper slå upp token och användare i databasen varje gång.
+
+    Användaren lagras som en ögonblicksbild av kolumnerna (inte som ORM-objekt)
+    och kopplas in i anropets session utan någon SELECT.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._tokens = TTLCache(maxsize=maxsize, ttl=ttl)  # token -> (user_id, expires_at)
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)   # user_id -> kolumnvärden
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> dict | None:
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= datetime.now(UTC):
+                self._tokens.pop(token, None)
+                return None
+            return self._users.get(user_id)
+
+    def put(self, token: str, user: Users, expires_at: datetime):
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=UTC)
+        snapshot = {attr.key: getattr(user, attr.key) for attr in inspect(Users).column_attrs}
+        with self._lock:
+            self._tokens[token] = (user.id, expires_at)
+            self._users[user.id] = snapshot
+
+    def invalidate_token(self, token: str):
+        with self._lock:
+            self._tokens.pop(token, None)
+
+    def invalidate_user(self, user_id: int):
+        # Tokens som pekar på användaren blir missar tills de laddats om
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+
+
+async def attach_user(db: AsyncSession, snapshot: dict) -> Users:
+    """Gör en cachad ögonblicksbild till en persistent Users i sessionen utan SELECT"""
+    user = Users(**snapshot)
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
+
+
+token_cache = TokenCache(
+    maxsize=settings.TOKEN_CACHE_MAXSIZE,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS,
+)
+
+
+# ORM-ändringar av en användare (lösenord, profil, credits) ska inte ge gamla värden från cachen
+@event.listens_for(Users, "after_update")
+@event.listens_for(Users, "after_delete")
+def invalidate_changed_user(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
@@ -0,0 +1,36 @@
+# Produktion: gunicorn -c gunicorn.conf.py main:app
+# (docker-compose kör fortfarande uvicorn --reload för utveckling)
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+# GUNICORN_PRELOAD_APP=1: appen importeras en gång i mastern och workers forkas
+# från den, så att de delar modulernas minnessidor copy-on-write. TensorFlow
+# importeras inte vid import av appen (se model_registry.py) och laddas aldrig
+# i mastern: dess trådpooler överlever inte fork och inferensen kan hänga.
+preload_app = os.environ.get("GUNICORN_PRELOAD_APP", "0") == "1"
+
+
+def on_starting(server):
+    if preload_app:
+        # Flytta allt som finns nu till den permanenta generationen så att
+        # GC i workers inte skriver i (och därmed kopierar) de delade sidorna
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    from app.settings import settings
+
+    if not settings.NSFW_MODEL_PRELOAD:
+        return
+
+    from app.api.v1.core.ai_endpoints.model_registry import NSFW_MODEL, model_registry
+
+    # I workern efter fork, innan den tar emot anrop
+    model_registry.get(NSFW_MODEL)
+    server.log.info("Worker %s loaded NSFW model: %s", worker.pid, model_registry.stats()[NSFW_MODEL])
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import Depends, FastAPI, HTTPException, Request, status
@@ -16,7 +17,13 @@ from app.api.v1.core.models import (
 )
 # from app.api.v1.core.schemas import
 from app.api.v1.routers import router
+from app.api.v1.core.ai_endpoints.ai_jobs import job_worker_pool, run_ai_job_pruning
+from app.api.v1.core.ai_endpoints.ai_response_cache import run_ai_cache_pruning
+from app.api.v1.core.ai_endpoints.model_registry import NSFW_MODEL, model_registry
+from app.api.v1.core.ai_endpoints.nsfw_inference import nsfw_batcher
+from app.credits import credit_ledger, run_daily_credit_refill
 from app.db_setup import get_db, init_db
+from app.settings import settings
 
 
 # Funktion som körs när vi startar FastAPI -
@@ -24,7 +31,25 @@ from app.db_setup import get_db, init_db
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()  # Vi ska skapa denna funktion
+    # Daglig påfyllning av credits för användare som har 0 kvar
+    refill_task = asyncio.create_task(run_daily_credit_refill())
+    credit_ledger.start()
+    # Rensar utgångna och överskjutande rader i ai_response_cache
+    cache_prune_task = asyncio.create_task(run_ai_cache_pruning())
+    # Ladda NSFW-modellen innan workern tar trafik i stället för vid första uppladdningen
+    if settings.NSFW_MODEL_WARMUP:
+        await asyncio.to_thread(model_registry.get, NSFW_MODEL)
+    # Workers för köade bildjobb (POST /v1/jobs/...) och rensning av klara jobb
+    job_worker_pool.start()
+    job_prune_task = asyncio.create_task(run_ai_job_pruning())
     yield
+    # Pågående jobb läggs tillbaka i kön innan NSFW-batchern stängs
+    await job_worker_pool.stop()
+    await nsfw_batcher.stop()
+    refill_task.cancel()
+    cache_prune_task.cancel()
+    job_prune_task.cancel()
+    credit_ledger.stop()  # Skriver kvarvarande credit_transactions
 
 
 app = FastAPI(lifespan=lifespan)
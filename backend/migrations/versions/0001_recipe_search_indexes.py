@@ -0,0 +1,46 @@
+"""Trigram and full-text indexes for recipe search
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # CONCURRENTLY blockerar inte skrivningar mot recipes medan indexen byggs, men kan
+    # inte köras i en transaktion. Ett avbrutet bygge lämnar ett ogiltigt index som
+    # måste tas bort (DROP INDEX) innan migreringen körs igen.
+    with op.get_context().autocommit_block():
+        # Trigram-index gör att ILIKE '%term%' kan använda index istället för seq scan
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_name_trgm "
+            "ON recipes USING gin (name gin_trgm_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_ingredients_trgm "
+            "ON recipes USING gin (ingredients gin_trgm_ops)"
+        )
+
+        # Uttrycket måste vara identiskt med SEARCH_DOCUMENT i recipe_search.py
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_search_document "
+            "ON recipes USING gin (to_tsvector('swedish'::regconfig, "
+            "coalesce(name, '') || ' ' || coalesce(ingredients, '')))"
+        )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_recipes_search_document")
+    op.execute("DROP INDEX IF EXISTS ix_recipes_ingredients_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_recipes_name_trgm")
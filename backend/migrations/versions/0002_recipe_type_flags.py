@@ -0,0 +1,54 @@
+"""Precomputed recipe_type_flags for the random recipe filter
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Kopia av RECIPE_TYPE_KEYWORDS i recipe_classification.py när migreringen skrevs,
+# ändras nyckelorden senare ska den här migreringen ändå göra samma sak som då
+RECIPE_TYPE_KEYWORDS = {
+    1: ("kyckling", "anka", "kalkon"),  # POULTRY
+    2: ("fisk", "skaldjur", "tonfisk", "lax", "bläckfisk", "räkor", "krabba", "hummer"),  # FISH
+    4: ("nötkött", "fläsk", "bacon", "kött", "lamm"),  # MEAT
+}
+
+
+def _flag_case(flag: int, keywords: tuple[str, ...]) -> str:
+    patterns = ", ".join(f"'%{keyword}%'" for keyword in keywords)
+    return f"(CASE WHEN ingredients ILIKE ANY (ARRAY[{patterns}]) THEN {flag} ELSE 0 END)"
+
+
+def upgrade() -> None:
+    # create_all har redan skapat kolumnen på nya databaser
+    op.execute("ALTER TABLE recipes ADD COLUMN IF NOT EXISTS recipe_type_flags SMALLINT")
+
+    # Klassa befintliga recept en gång med nyckelorden ovan
+    flags_sql = " | ".join(
+        _flag_case(flag, keywords) for flag, keywords in RECIPE_TYPE_KEYWORDS.items()
+    )
+    op.execute(
+        f"UPDATE recipes SET recipe_type_flags = {flags_sql} "
+        "WHERE recipe_type_flags IS NULL"
+    )
+
+    # Blockerar inte skrivningar mot recipes, se 0001
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_recipe_type_flags "
+            "ON recipes (recipe_type_flags)"
+        )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_recipes_recipe_type_flags")
+    op.execute("ALTER TABLE recipes DROP COLUMN IF EXISTS recipe_type_flags")
@@ -0,0 +1,53 @@
+"""Indexes for foreign keys and hot filter columns
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (indexnamn, tabell, kolumner). Namnen är samma som index=True/__table_args__ i models.py
+# ger, så create_all på en ny databas och migreringen landar i samma schema.
+# users.email behövs inte: unique-constrainten har redan ett eget index.
+INDEXES = [
+    ("ix_saved_recipes_recipe_id", "saved_recipes", "recipe_id"),
+    ("ix_saved_recipes_user_id_saved_at", "saved_recipes", "user_id, saved_at, recipe_id"),
+    ("ix_saved_user_recipes_user_recipe_id", "saved_user_recipes", "user_recipe_id"),
+    ("ix_saved_user_recipes_user_id_saved_at", "saved_user_recipes", "user_id, saved_at, user_recipe_id"),
+    ("ix_user_recipes_user_id", "user_recipes", "user_id"),
+    ("ix_images_user_id", "images", "user_id"),
+    ("ix_images_user_recipes_id", "images", "user_recipes_id"),
+    ("ix_saved_items_user_id", "saved_items", "user_id"),
+    ("ix_comments_user_id", "comments", "user_id"),
+    ("ix_comments_user_recipes_id", "comments", "user_recipes_id"),
+    ("ix_reviews_user_id", "reviews", "user_id"),
+    ("ix_reviews_recipes_id", "reviews", "recipes_id"),
+    ("ix_messages_sender_user_id", "messages", "sender_user_id"),
+    ("ix_messages_receiver_user_id", "messages", "receiver_user_id"),
+    ("ix_user_follows_follower_user_id", "user_follows", "follower_user_id"),
+    ("ix_user_follows_followee_user_id", "user_follows", "followee_user_id"),
+    ("ix_tokens_user_id", "tokens", "user_id"),
+    ("ix_tokens_created_at", "tokens", "created_at"),
+    ("ix_password_reset_tokens_user_id", "password_reset_tokens", "user_id"),
+    ("ix_activation_tokens_user_id", "activation_tokens", "user_id"),
+]
+
+
+def upgrade() -> None:
+    # Ett index i taget utan att blockera skrivningar, se 0001
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    for name, _table, _columns in reversed(INDEXES):
+        op.execute(f"DROP INDEX IF EXISTS {name}")
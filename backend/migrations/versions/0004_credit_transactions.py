@@ -0,0 +1,36 @@
+"""credit_transactions ledger for app/credits.py
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all har redan skapat tabellen när migreringarna körs från run_migrations
+    if sa.inspect(op.get_bind()).has_table("credit_transactions"):
+        return
+
+    op.create_table(
+        "credit_transactions",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("reason", sa.String(100), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="SET NULL"), nullable=True),
+    )
+    op.create_index("ix_credit_transactions_user_id", "credit_transactions", ["user_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("credit_transactions")
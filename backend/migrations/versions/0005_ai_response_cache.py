@@ -0,0 +1,40 @@
+"""ai_response_cache, persistent level of the AI response cache
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all har redan skapat tabellen när migreringarna körs från run_migrations
+    if sa.inspect(op.get_bind()).has_table("ai_response_cache"):
+        return
+
+    op.create_table(
+        "ai_response_cache",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("cache_key", sa.String(64), nullable=False),
+        sa.Column("endpoint", sa.String(100), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("recipe_id", sa.Integer(), sa.ForeignKey("recipes.id", ondelete="CASCADE"), nullable=True),
+    )
+    op.create_index("ix_ai_response_cache_cache_key", "ai_response_cache", ["cache_key"], unique=True)
+    op.create_index("ix_ai_response_cache_expires_at", "ai_response_cache", ["expires_at"])
+    op.create_index("ix_ai_response_cache_recipe_id", "ai_response_cache", ["recipe_id"])
+
+
+def downgrade() -> None:
+    op.drop_table("ai_response_cache")
@@ -0,0 +1,47 @@
+"""ai_jobs queue for the background image jobs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # create_all har redan skapat tabellen när migreringarna körs från run_migrations
+    if sa.inspect(op.get_bind()).has_table("ai_jobs"):
+        return
+
+    op.create_table(
+        "ai_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("kind", sa.String(50), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("image", sa.LargeBinary(), nullable=True),
+        sa.Column("file_name", sa.String(255), nullable=True),
+        sa.Column("credits", sa.Integer(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("status_code", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_ai_jobs_user_id", "ai_jobs", ["user_id"])
+    op.create_index("ix_ai_jobs_status_created_at", "ai_jobs", ["status", "created_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("ai_jobs")
@@ -0,0 +1,17 @@
+import os
+
+# Settings kräver de här, enhetstesterna rör varken databas, Gemini eller S3
+for name, value in {
+    "DB_URL": "sqlite:///:memory:",
+    "GEMINI_API_KEY": "test",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+    "POSTGRES_DB": "test",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "POSTMARK_TOKEN": "test",
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "AWS_BUCKET_NAME": "test",
+    "AWS_REGION": "eu-north-1",
+}.items():
+    os.environ.setdefault(name, value)
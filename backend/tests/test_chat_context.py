@@ -0,0 +1,99 @@
+from app.api.v1.core.ai_endpoints.chat_context import (
+    MIN_TRUNCATED_CHARS,
+    ChatContextCompactor,
+    estimate_tokens,
+    truncate_line,
+)
+
+RECIPE_PAGE = """
+<html>
+<head><title>Pannkakor</title><script>var tracking = 1;</script></head>
+<body>
+  <nav><a href="/">Hem</a><a href="/recept">Recept</a></nav>
+  <h1>Pannkakor</h1>
+  <p>Godkänn cookies för att fortsätta</p>
+  <h2>Ingredienser</h2>
+  <ul><li>3 dl vetemjöl</li><li>6 dl mjölk</li><li>3 ägg</li></ul>
+  <h2>Gör så här</h2>
+  <p>Vispa ihop mjöl och hälften av mjölken.</p>
+  <p>Vispa ihop mjöl och hälften av mjölken.</p>
+  <footer>© Receptsajten</footer>
+</body>
+</html>
+"""
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_compact_html_drops_boilerplate_and_duplicates():
+    compacted = ChatContextCompactor(token_budget=1000).compact(RECIPE_PAGE)
+
+    assert compacted.splitlines() == [
+        "Pannkakor",
+        "Ingredienser",
+        "3 dl vetemjöl",
+        "6 dl mjölk",
+        "3 ägg",
+        "Gör så här",
+        "Vispa ihop mjöl och hälften av mjölken.",
+    ]
+
+
+def test_compact_plain_text_keeps_lines():
+    compacted = ChatContextCompactor(token_budget=1000).compact("Rad ett\n\n  Rad   två  \nRad ett")
+
+    assert compacted == "Rad ett\nRad två"
+
+
+def test_truncate_line_cuts_at_word_boundary():
+    line = "Vispa ihop mjöl och hälften av mjölken till en slät smet utan klumpar"
+    truncated = truncate_line(line, 8)
+
+    assert truncated.endswith("…")
+    assert line.startswith(truncated[:-1])
+    assert line[len(truncated) - 1] == " "
+    assert estimate_tokens(truncated + "\n") <= 8
+
+
+def test_truncate_line_too_small_budget():
+    assert truncate_line("x" * 100, (MIN_TRUNCATED_CHARS + 1) // 4) == ""
+
+
+def test_fit_respects_budget_and_priority():
+    compactor = ChatContextCompactor(token_budget=30)
+    sections = [
+        (False, ["Relaterade recept", "Köttbullar med potatismos och lingon, en klassiker"]),
+        (True, ["Ingredienser", "3 dl vetemjöl", "6 dl mjölk", "3 ägg"]),
+    ]
+
+    compacted, truncated = compactor._fit(sections)
+
+    assert estimate_tokens(compacted) <= 30
+    # Det prioriterade avsnittet får plats i sin helhet, resten kortas
+    assert compacted.endswith("Ingredienser\n3 dl vetemjöl\n6 dl mjölk\n3 ägg")
+    assert truncated
+
+
+def test_over_budget_line_is_truncated_not_dropped():
+    compactor = ChatContextCompactor(token_budget=20)
+    line = "Vispa ihop mjöl och hälften av mjölken till en slät smet, tillsätt resten av mjölken och äggen"
+
+    compacted, truncated = compactor._fit([(True, [line])])
+
+    assert truncated
+    assert compacted.endswith("…")
+    assert line.startswith(compacted[:-1])
+
+
+def test_stats():
+    compactor = ChatContextCompactor(token_budget=1000)
+    compactor.compact(RECIPE_PAGE)
+    stats = compactor.stats()
+
+    assert stats["requests"] == 1
+    assert stats["truncated"] == 0
+    assert stats["tokens_saved"] == stats["original_tokens"] - stats["compacted_tokens"] > 0
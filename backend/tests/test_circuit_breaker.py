@@ -0,0 +1,110 @@
+import pytest
+
+from app.api.v1.core.ai_endpoints import circuit_breaker
+from app.api.v1.core.ai_endpoints.circuit_breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(window_seconds=60, min_calls=4, failure_rate=0.5, open_seconds=30)
+
+
+def _open(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_stays_closed_below_min_calls(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_stays_closed_below_failure_rate(breaker):
+    for _ in range(3):
+        breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_opens_at_failure_rate(breaker):
+    for _ in range(2):
+        breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["times_opened"] == 1
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_old_outcomes_leave_the_window(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 61
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["window_failures"] == 1
+
+
+def test_half_open_allows_one_probe(breaker, clock):
+    _open(breaker)
+    clock.now += 30
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes(breaker, clock):
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    assert breaker.stats()["window_calls"] == 1
+
+
+def test_failed_probe_reopens(breaker, clock):
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["times_opened"] == 2
+
+
+def test_abandoned_probe_does_not_lock_the_breaker(breaker, clock):
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    # Provanropet avbröts utan att utfallet registrerades
+    clock.now += 31
+
+    assert breaker.allow()
@@ -0,0 +1,213 @@
+"""
+Kontrollerar med EXPLAIN att sök- och filterfrågorna använder indexen från
+migrations/versions (trigram, tsvector och FK-index) på en seedad Postgres.
+
+Körs bara när TEST_POSTGRES_URL pekar på en tom databas som testet får skriva
+över, t.ex. postgresql+psycopg2://postgres@localhost/index_test (kräver pg_trgm).
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine, delete, select, text
+
+from app.api.v1.core.models import (
+    Base,
+    Comments,
+    Images,
+    Messages,
+    Recipes,
+    SavedItems,
+    SavedRecipes,
+    SavedUserRecipes,
+    Token,
+    UserRecipes,
+    Users,
+)
+from app.api.v1.core.recipe_endpoints.recipe_search import postgres_search_statement
+from app.api.v1.core.schemas import SearchRecipeSchema
+from app.db_setup import run_migrations
+
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL är inte satt")
+
+RECIPES = 200000
+USERS = 500
+ROWS_PER_TABLE = 20000
+
+# Tillräckligt många rader för att planeraren ska välja index framför seq scan
+SEED_SQL = [
+    f"""
+    INSERT INTO users (first_name, last_name, email, is_admin, credits, hashed_password, level, is_active)
+    SELECT 'Test', 'Användare' || i, 'user' || i || '@example.com', false, 10, 'x', 1, true
+    FROM generate_series(1, {USERS}) AS i
+    """,
+    # Vanliga ingredienser i övrigt, var 500:e recept matchar söktermen och var 5000:e
+    # ingrediensfiltret i testerna nedan
+    f"""
+    INSERT INTO recipes (name, ingredients, calories, protein, carbohydrates, recipe_type_flags)
+    SELECT
+        CASE WHEN i % 500 = 0 THEN 'Kycklinggryta med lax ' || i ELSE 'Vardagsrätt ' || i END,
+        CASE WHEN i % 5000 = 0 THEN 'kyckling | röda linser | dill'
+             ELSE (ARRAY['potatis', 'morot', 'grädde', 'smör', 'mjölk', 'ägg', 'vetemjöl', 'ris',
+                         'pasta', 'tomat', 'gul lök', 'vitlök', 'paprika', 'ost', 'citron'])[i % 15 + 1]
+                  || ' | ' || (ARRAY['salt', 'svartpeppar', 'persilja', 'timjan', 'olivolja',
+                                     'buljong', 'socker'])[i % 7 + 1]
+                  || ' | ' || (ARRAY['nötfärs', 'fläskfilé', 'torsk', 'halloumi', 'bönor', 'tofu',
+                                     'kikärtor', 'spenat', 'svamp', 'purjolök', 'broccoli'])[i % 11 + 1]
+        END,
+        200 + i % 800, 5 + i % 60, 10 + i % 90, (ARRAY[1, 2, 4, 0, 0])[i % 5 + 1]
+    FROM generate_series(1, {RECIPES}) AS i
+    """,
+    f"""
+    INSERT INTO user_recipes (name, descriptions, ingredients, instructions, is_ai, servings, user_id)
+    SELECT 'Eget recept ' || i, 'beskrivning', 'ingredienser', 'gör så här', false, 4, i % {USERS} + 1
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+    f"""
+    INSERT INTO saved_recipes (user_id, recipe_id, saved_at)
+    SELECT i % {USERS} + 1, i, now() - i * interval '1 minute'
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+    f"""
+    INSERT INTO saved_user_recipes (user_id, user_recipe_id, saved_at)
+    SELECT i % {USERS} + 1, i, now() - i * interval '1 minute'
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+    f"""
+    INSERT INTO images (link, user_id, user_recipes_id)
+    SELECT 'images/' || i || '.jpg', i % {USERS} + 1, i
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+    f"""
+    INSERT INTO comments (content, user_id, user_recipes_id)
+    SELECT 'Gott!', i % {USERS} + 1, i
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+    f"""
+    INSERT INTO messages (content, sender_user_id, receiver_user_id)
+    SELECT 'Hej', i % {USERS} + 1, (i + 7) % {USERS} + 1
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+    f"""
+    INSERT INTO saved_items (item, size, user_id)
+    SELECT 'mjölk', '1 l', i % {USERS} + 1
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+    f"""
+    INSERT INTO tokens (token, user_id, created_at)
+    SELECT 'token-' || i, i % {USERS} + 1, now() - i * interval '1 minute'
+    FROM generate_series(1, {ROWS_PER_TABLE}) AS i
+    """,
+]
+
+
+@pytest.fixture(scope="module")
+def connection():
+    engine = create_engine(TEST_POSTGRES_URL)
+    with engine.connect() as conn:
+        Base.metadata.drop_all(bind=conn)
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+        conn.commit()
+
+    # Samma väg som en deploy: create_all plus alla migreringar
+    run_migrations(TEST_POSTGRES_URL)
+
+    with engine.connect() as conn:
+        for statement in SEED_SQL:
+            conn.execute(text(statement))
+        conn.commit()
+        conn.execute(text("ANALYZE"))
+        conn.commit()
+        yield conn
+
+    engine.dispose()
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def explain(connection, stmt) -> list[dict]:
+    compiled = stmt.compile(connection)
+    try:
+        result = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params)
+        return list(_plan_nodes(result.scalar()[0]["Plan"]))
+    finally:
+        connection.rollback()
+
+
+def assert_uses_index(nodes: list[dict], table: str, *index_names: str):
+    seq_scans = [node for node in nodes if node["Node Type"] == "Seq Scan" and node["Relation Name"] == table]
+    used = {node["Index Name"] for node in nodes if "Index Name" in node}
+    assert not seq_scans, f"Seq scan på {table}: {nodes}"
+    assert used & set(index_names), f"Inget av {index_names} används, bara {used}"
+
+
+def _search(**params) -> SearchRecipeSchema:
+    return SearchRecipeSchema(**{"query": "", "page": 0, "page_size": 20, **params})
+
+
+def test_search_term_uses_fulltext_and_trigram_indexes(connection):
+    nodes = explain(connection, postgres_search_statement(_search(query="kycklinggryta"), limit=21))
+
+    assert_uses_index(nodes, "recipes", "ix_recipes_search_document", "ix_recipes_name_trgm")
+
+
+def test_ingredient_filter_uses_trigram_index(connection):
+    nodes = explain(connection, postgres_search_statement(_search(ingredients="röda linser"), limit=21))
+
+    assert_uses_index(nodes, "recipes", "ix_recipes_ingredients_trgm")
+
+
+def test_search_with_filters_uses_indexes(connection):
+    stmt = postgres_search_statement(
+        _search(query="lax", ingredients="dill", calories=500, protein=20), limit=21
+    )
+
+    assert_uses_index(
+        explain(connection, stmt), "recipes",
+        "ix_recipes_search_document", "ix_recipes_name_trgm", "ix_recipes_ingredients_trgm",
+    )
+
+
+@pytest.mark.parametrize("table, stmt, index_names", [
+    # /saved/recipe och /saved/user-recipe, senast sparade först
+    (
+        "saved_recipes",
+        select(Recipes).join(SavedRecipes, Recipes.id == SavedRecipes.recipe_id)
+        .where(SavedRecipes.user_id == 42)
+        .order_by(SavedRecipes.saved_at.desc(), SavedRecipes.recipe_id.desc()).limit(21),
+        ("ix_saved_recipes_user_id_saved_at",),
+    ),
+    (
+        "saved_user_recipes",
+        select(UserRecipes).join(SavedUserRecipes, UserRecipes.id == SavedUserRecipes.user_recipe_id)
+        .where(SavedUserRecipes.user_id == 42)
+        .order_by(SavedUserRecipes.saved_at.desc(), SavedUserRecipes.user_recipe_id.desc()).limit(21),
+        ("ix_saved_user_recipes_user_id_saved_at",),
+    ),
+    # ON DELETE CASCADE/SET NULL slår upp barnraderna på FK-kolumnen
+    ("saved_recipes", delete(SavedRecipes).where(SavedRecipes.recipe_id == 42), ("ix_saved_recipes_recipe_id",)),
+    (
+        "saved_user_recipes",
+        delete(SavedUserRecipes).where(SavedUserRecipes.user_recipe_id == 42),
+        ("ix_saved_user_recipes_user_recipe_id",),
+    ),
+    ("user_recipes", select(UserRecipes).where(UserRecipes.user_id == 42), ("ix_user_recipes_user_id",)),
+    ("images", select(Images).where(Images.user_recipes_id == 42), ("ix_images_user_recipes_id",)),
+    ("comments", select(Comments).where(Comments.user_recipes_id == 42), ("ix_comments_user_recipes_id",)),
+    ("messages", select(Messages).where(Messages.receiver_user_id == 42), ("ix_messages_receiver_user_id",)),
+    ("saved_items", select(SavedItems).where(SavedItems.user_id == 42), ("ix_saved_items_user_id",)),
+    # get_current_user i security.py
+    (
+        "tokens",
+        select(Token).where(Token.token == "token-42", Token.created_at >= text("now() - interval '30 minutes'")),
+        ("ix_tokens_token", "ix_tokens_created_at"),
+    ),
+    ("users", select(Users).where(Users.email == "user42@example.com"), ("users_email_key",)),
+])
+def test_foreign_key_and_filter_lookups_use_indexes(connection, table, stmt, index_names):
+    assert_uses_index(explain(connection, stmt), table, *index_names)
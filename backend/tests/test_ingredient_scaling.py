@@ -0,0 +1,94 @@
+from fractions import Fraction
+
+import pytest
+
+from app.api.v1.core.recipe_endpoints.ingredient_scaling import (
+    Ingredient,
+    format_quantity,
+    parse_ingredient,
+    parse_quantity,
+    scale_ingredients,
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2", Fraction(2)),
+    ("1,5", Fraction(3, 2)),
+    ("1.5", Fraction(3, 2)),
+    ("1/2", Fraction(1, 2)),
+    ("1 1/2", Fraction(3, 2)),
+    ("½", Fraction(1, 2)),
+    ("1½", Fraction(3, 2)),
+    ("2 ¾", Fraction(11, 4)),
+])
+def test_parse_quantity(text, expected):
+    assert parse_quantity(text) == expected
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("2 dl mjölk", Ingredient("mjölk", "dl", Fraction(2))),
+    ("1 1/2 msk smör", Ingredient("smör", "msk", Fraction(3, 2))),
+    ("ca 500 g kycklingfilé", Ingredient("kycklingfilé", "g", Fraction(500))),
+    ("2-3 klyftor vitlök", Ingredient("vitlök", "klyftor", Fraction(2), Fraction(3))),
+    ("3 ägg", Ingredient("ägg", "", Fraction(3))),
+    ("1 lök", Ingredient("lök", "", Fraction(1))),
+    ("2 KG potatis", Ingredient("potatis", "kg", Fraction(2))),
+    ("1 burk krossade tomater (400 g)", Ingredient("krossade tomater (400 g)", "burk", Fraction(1))),
+    ("salt och peppar", Ingredient("salt och peppar")),
+])
+def test_parse_ingredient(line, expected):
+    assert parse_ingredient(line) == expected
+
+
+@pytest.mark.parametrize("line", ["smör, 50 g", "1 msk + 1 tsk olja"])
+def test_parse_ingredient_ambiguous(line):
+    assert parse_ingredient(line) is None
+
+
+@pytest.mark.parametrize("value, unit, name, expected", [
+    (Fraction(4), "dl", "", "4"),
+    (Fraction(3, 2), "dl", "", "1 1/2"),
+    (Fraction(1, 3), "msk", "", "1/3"),
+    (Fraction(1, 3), "st", "", "1"),
+    (Fraction(7, 10), "dl", "", "0,7"),
+    (Fraction(125, 8), "dl", "", "15,6"),
+    (Fraction(1001, 8), "g", "", "125"),
+    # Utan enhet avrundas bara ägg, annat står kvar som bråk
+    (Fraction(3, 2), "", "ägg", "2"),
+    (Fraction(1, 2), "", "lime", "1/2"),
+    (Fraction(3, 2), "", "gul lök", "1 1/2"),
+    (Fraction(7, 10), "", "avokado", "0,7"),
+])
+def test_format_quantity(value, unit, name, expected):
+    assert format_quantity(value, unit, name) == expected
+
+
+def test_scale_ingredients():
+    scaled, unparsed = scale_ingredients(
+        "2 dl mjölk | 1 1/2 msk smör | 3 ägg | 2-3 klyftor vitlök | salt | smör, 50 g | ",
+        Fraction(3, 2),
+    )
+
+    assert scaled == [
+        {"name": "mjölk", "amount": "3", "unit": "dl"},
+        {"name": "smör", "amount": "2 1/4", "unit": "msk"},
+        {"name": "ägg", "amount": "5", "unit": ""},
+        {"name": "vitlök", "amount": "3-5", "unit": "klyftor"},
+        {"name": "salt", "amount": "", "unit": ""},
+    ]
+    assert unparsed == ["smör, 50 g"]
+
+
+def test_scale_ingredients_fractional_without_unit():
+    scaled, unparsed = scale_ingredients("0,5 lime | 1,5 gurka | 1 ägg", Fraction(1, 2))
+
+    assert scaled == [
+        {"name": "lime", "amount": "1/4", "unit": ""},
+        {"name": "gurka", "amount": "3/4", "unit": ""},
+        {"name": "ägg", "amount": "1", "unit": ""},
+    ]
+    assert unparsed == []
+
+
+def test_scale_ingredients_empty():
+    assert scale_ingredients(None, Fraction(2)) == ([], [])
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import UTC, datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.core.pagination import (
+    SAVED_ITEMS,
+    SAVED_RECIPES,
+    SAVED_USER_RECIPES,
+    SEARCH,
+    cursor_page,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def _raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).rstrip(b"=").decode()
+
+
+@pytest.mark.parametrize("kind, rank", [
+    (SEARCH, 0.4375),
+    (SAVED_RECIPES, datetime(2024, 5, 1, 12, 30, tzinfo=UTC)),
+    (SAVED_USER_RECIPES, datetime(2024, 5, 1, 12, 30, tzinfo=UTC)),
+    (SAVED_ITEMS, None),
+])
+def test_round_trip(kind, rank):
+    assert decode_cursor(encode_cursor(kind, rank, 42), kind) == (rank, 42)
+
+
+def test_empty_cursor_is_first_page():
+    assert decode_cursor(None, SEARCH) is None
+    assert decode_cursor("", SEARCH) is None
+
+
+def test_integer_search_rank_is_float():
+    rank, row_id = decode_cursor(encode_cursor(SEARCH, 1, 7), SEARCH)
+    assert rank == 1.0 and isinstance(rank, float)
+    assert row_id == 7
+
+
+@pytest.mark.parametrize("cursor, kind", [
+    (encode_cursor(SEARCH, 0.5, 1), SAVED_RECIPES),
+    (encode_cursor(SAVED_RECIPES, datetime.now(UTC), 1), SAVED_USER_RECIPES),
+    (encode_cursor(SAVED_ITEMS, None, 1), SEARCH),
+    # Rätt kind men fel typ på rank
+    (_raw_cursor([SEARCH, None, 1]), SEARCH),
+    (_raw_cursor([SAVED_ITEMS, 0.5, 1]), SAVED_ITEMS),
+    (_raw_cursor([SAVED_RECIPES, 0.5, 1]), SAVED_RECIPES),
+    # Cursor från innan kind lades till
+    (_raw_cursor([0.5, 1]), SEARCH),
+    (_raw_cursor([SEARCH, 0.5, "1"]), SEARCH),
+    (_raw_cursor([SEARCH, True, 1]), SEARCH),
+    (_raw_cursor([SAVED_RECIPES, {"t": "igår"}, 1]), SAVED_RECIPES),
+    ("inte base64!", SEARCH),
+])
+def test_invalid_cursor_is_400(cursor, kind):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor, kind)
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.detail == "Invalid cursor"
+
+
+def test_cursor_page_has_more():
+    rows = [(0.9, 5), (0.8, 4), (0.7, 3)]
+    page = cursor_page(rows, 2, key=lambda row: row, kind=SEARCH)
+
+    assert page["items"] == [(0.9, 5), (0.8, 4)]
+    assert decode_cursor(page["next_cursor"], SEARCH) == (0.8, 4)
+
+
+def test_cursor_page_last_page():
+    page = cursor_page([(0.9, 5), (0.8, 4)], 2, key=lambda row: row, kind=SEARCH)
+
+    assert page["items"] == [(0.9, 5), (0.8, 4)]
+    assert page["next_cursor"] is None